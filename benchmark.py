@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+
+########################################################################
+# Copyright (c) 2018 University of Utah Student Computing Labs.        #
+# All Rights Reserved.                                                 #
+#                                                                      #
+# Permission to use, copy, modify, and distribute this software and    #
+# its documentation for any purpose and without fee is hereby granted, #
+# provided that the above copyright notice appears in all copies and   #
+# that both that copyright notice and this permission notice appear    #
+# in supporting documentation, and that the name of The University     #
+# of Utah not be used in advertising or publicity pertaining to        #
+# distribution of the software without specific, written prior         #
+# permission. This software is supplied as is without expressed or     #
+# implied warranties of any kind.                                      #
+########################################################################
+
+# Display Manager, version 1.0.2
+# Benchmarks
+
+# Measures how long Display Manager takes to do its work, and checks the results against budgets
+# and (optionally) against a saved baseline. Runs anywhere, against simulated displays.
+
+import os                   # find display_manager.py
+import sys                  # run display_manager.py with the current interpreter
+import time                 # time everything
+import json                 # save and load baselines
+import random               # generate reproducible workloads
+import subprocess           # run display_manager.py as a separate process
+import argparse             # parse command-line arguments
+import collections          # keep results in the order they were measured
+from display_manager import *
+
+
+# The command-line interface whose startup is measured
+cliPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "display_manager.py")
+
+# Longest acceptable median time (in seconds) from launching display_manager.py to its first line of
+# output, for commands which don't need to touch any displays (e.g. "help" and syntax errors)
+startupBudget = 0.25
+
+# How much the time parsing takes per word may vary across command string lengths before parsing
+# is no longer considered to take linear time
+parseScaling = 3.0
+
+# The percentiles reported for every benchmark
+percentiles = [50, 95, 99]
+
+
+def percentile(samples, p):
+    """
+    :param samples: A list of numbers
+    :param p: The percentile to find, from 0 to 100
+    :return: The p-th percentile of samples (by nearest rank)
+    """
+    ordered = sorted(samples)
+    rank = int(round(p / 100.0 * (len(ordered) - 1)))
+    return ordered[rank]
+
+
+def summarize(samples):
+    """
+    :param samples: A list of times (in seconds)
+    :return: A dictionary of the samples' percentiles (e.g. "p50"), in seconds
+    """
+    return collections.OrderedDict(("p{}".format(p), percentile(samples, p)) for p in percentiles)
+
+
+def report(name, summary, status=None):
+    """
+    Prints a benchmark's percentiles (in milliseconds)
+    :param name: The benchmark's name
+    :param summary: The benchmark's percentiles, as returned by summarize
+    :param status: A note to print after the percentiles, if any
+    """
+    times = ", ".join("{} {:.3f} ms".format(key, value * 1000) for key, value in summary.items())
+    print("{}: {}{}".format(name, times, " ({})".format(status) if status else ""))
+
+
+# Startup
+
+def timeStartup(args):
+    """
+    :param args: The arguments to run display_manager.py with
+    :return: The time (in seconds) from launching display_manager.py to its first line of output,
+        and whether it ran without crashing (e.g. by trying to load PyObjC where it isn't available)
+    """
+    start = time.time()
+    process = subprocess.Popen(
+        [sys.executable, cliPath] + args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    output = process.stdout.readline()
+    elapsed = time.time() - start
+
+    output += process.communicate()[0]
+    return elapsed, process.returncode == 0 and b"Traceback" not in output
+
+
+def benchmarkStartup(runs, results):
+    """
+    Measures display_manager.py's startup time for commands which shouldn't load any frameworks
+    :param runs: How many times to run each command
+    :param results: A dictionary to add each command's percentiles to
+    :return: Whether every command ran cleanly, with a median startup time within startupBudget
+    """
+    passed = True
+    for args in [["help"], ["help", "res"], ["res", "nonsense"]]:
+        timings = [timeStartup(args) for i in range(runs)]
+        samples = [elapsed for elapsed, clean in timings]
+        clean = all(clean for elapsed, clean in timings)
+        summary = summarize(samples)
+
+        if not clean:
+            status = "crashed"
+        elif summary["p50"] > startupBudget:
+            status = "over budget of {:.0f} ms".format(startupBudget * 1000)
+        else:
+            status = "ok"
+        passed = passed and status == "ok"
+
+        name = "startup \"{}\"".format(" ".join(args))
+        results[name] = summary
+        report(name, summary, status)
+
+    return passed
+
+
+# Operations
+
+def timeCalls(function, runs):
+    """
+    :param function: The function to time; called with the run number
+    :param runs: How many times to call function
+    :return: The time (in seconds) each call took
+    """
+    samples = []
+    for run in range(runs):
+        start = time.perf_counter()
+        function(run)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def commandString(displays, generator):
+    """
+    :param displays: The Displays to configure
+    :param generator: The random.Random to choose settings with
+    :return: A command string which sets the mode, rotation, brightness, and underscan of every display
+    """
+    commands = []
+    for display in displays:
+        mode = generator.choice(display.allModes)
+        commands.extend([
+            "res {} {} {} {}".format(mode.width, mode.height, mode.refresh, display.tag),
+            "rotate {} {}".format(generator.choice([0, 90, 180, 270]), display.tag),
+            "brightness {:.2f} {}".format(generator.random(), display.tag),
+            "underscan {:.2f} {}".format(generator.random(), display.tag),
+        ])
+    return " ".join(commands)
+
+
+def benchmarkOperations(runs, displayCounts, modeCounts, results):
+    """
+    Measures parsing, planning, comparing commands, and mode selection against simulated displays
+    :param runs: How many times to run each operation
+    :param displayCounts: The numbers of displays to simulate
+    :param modeCounts: The numbers of modes to give each simulated display
+    :param results: A dictionary to add each operation's percentiles to
+    """
+    for displayCount in displayCounts:
+        for modeCount in modeCounts:
+            # The same workload every time, so that results can be compared against a baseline
+            generator = random.Random(displayCount * 1000 + modeCount)
+            setBackend(SimulatedBackend(displays=displayCount, modes=modeCount))
+            displays = getAllDisplays()
+            main = getMainDisplay()
+
+            # Two different configurations to switch between, so that every run changes something
+            commandStrings = [commandString(displays, generator) for i in range(2)]
+            commandLists = [parseCommands(string) for string in commandStrings]
+            singleCommand = commandStrings[0].split(" rotate ")[0]
+            queries = [
+                (
+                    generator.randint(320, 5120), generator.randint(200, 3200),
+                    generator.choice([0, 24, 30, 60, 120]), generator.choice([0, 1, 2]),
+                )
+                for i in range(runs)
+            ]
+
+            def addCommands(run):
+                commandList = CommandList()
+                for command in commandLists[0].commands:
+                    commandList.addCommand(command)
+
+            def copyAllModes(run):
+                main.invalidate()
+                return main.allModes
+
+            def findClosestMode(run):
+                try:
+                    main.closestMode(*queries[run])
+                except DisplayError:
+                    pass
+
+            operations = [
+                ("parseCommands", lambda run: parseCommands(commandStrings[run % 2])),
+                ("getCommand", lambda run: getCommand(singleCommand)),
+                ("CommandList.addCommand", addCommands),
+                ("CommandList.run", lambda run: commandLists[run % 2].run()),
+                ("CommandList.__eq__", lambda run: commandLists[0] == commandLists[1]),
+                ("CommandList.__hash__", lambda run: hash(commandLists[run % 2])),
+                ("CommandList.unique", lambda run: commandLists[run % 2].unique()),
+                ("sorted(commands)", lambda run: sorted(commandLists[run % 2].commands)),
+                ("Display.allModes", copyAllModes),
+                ("closestMode", findClosestMode),
+            ]
+            for operation, function in operations:
+                name = "{} [displays={}, modes={}]".format(operation, displayCount, modeCount)
+                results[name] = summarize(timeCalls(function, runs))
+                report(name, results[name])
+
+
+def benchmarkParallel(runs, displayCounts, jobs, latency, results):
+    """
+    Measures configuring every display at once, serially and on a pool of worker threads
+    :param runs: How many times to run each configuration
+    :param displayCounts: The numbers of displays to simulate
+    :param jobs: How many worker threads to use, when running in parallel
+    :param latency: How long (in seconds) each simulated call to the displays should take
+    :param results: A dictionary to add each configuration's percentiles to
+    """
+    # Two different configurations to switch between, so that every run changes something
+    commandLists = [
+        parseCommands("brightness 1 all underscan 0 all"),
+        parseCommands("brightness 0 all underscan 1 all"),
+    ]
+
+    for displayCount in displayCounts:
+        setBackend(SimulatedBackend(displays=displayCount, latency=latency))
+        for workers in [1, jobs]:
+            name = "CommandList.run [displays={}, latency={:g} ms, workers={}]".format(
+                displayCount, latency * 1000, workers)
+            results[name] = summarize(timeCalls(lambda run: commandLists[run % 2].run(workers=workers), runs))
+            report(name, results[name])
+
+
+def benchmarkParsing(runs, tokenCounts, results):
+    """
+    Measures how parsing scales with the length of the command string
+    :param runs: How many times to parse each command string
+    :param tokenCounts: The (approximate) numbers of words in each command string
+    :param results: A dictionary to add each command string's percentiles to
+    :return: Whether parsing took time linear in the number of words (within a factor of parseScaling)
+    """
+    setBackend(SimulatedBackend(displays=4))
+    generator = random.Random(0)
+    displays = getAllDisplays()
+
+    perToken = []
+    for tokenCount in tokenCounts:
+        commands = []
+        tokens = 0
+        while tokens < tokenCount:
+            commands.append(commandString([generator.choice(displays)], generator))
+            tokens += len(commands[-1].split())
+        string = " ".join(commands)
+
+        name = "parseCommands [tokens={}]".format(tokenCount)
+        results[name] = summarize(timeCalls(lambda run: parseCommands(string), runs))
+        perToken.append(results[name]["p50"] / tokens)
+        report(name, results[name], "{:.2f} us per token".format(perToken[-1] * 1e6))
+
+    linear = max(perToken) <= min(perToken) * parseScaling
+    if not linear:
+        print("parseCommands: time per token varies by more than {}x".format(parseScaling))
+    return linear
+
+
+# Baselines
+
+def compare(results, baseline, threshold):
+    """
+    Compares each benchmark's median against a baseline
+    :param results: The benchmarks' percentiles, by name
+    :param baseline: Previously saved results
+    :param threshold: How much slower (as a fraction, e.g. 0.2 for 20%) a median can be before it's a regression
+    :return: Whether no benchmark regressed
+    """
+    passed = True
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["p50"]
+        after = summary["p50"]
+        change = (after - before) / before if before else 0
+        regressed = change > threshold
+        passed = passed and not regressed
+
+        print("{}: p50 {:.3f} ms -> {:.3f} ms ({:+.0%}){}".format(
+            name, before * 1000, after * 1000, change, ", REGRESSION" if regressed else ""))
+
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Display Manager")
+    parser.add_argument("--runs", type=int, default=20, help="how many times to run each benchmark")
+    parser.add_argument(
+        "--displays", default="1,4,16,64", help="comma-separated numbers of displays to simulate")
+    parser.add_argument(
+        "--modes", default="50,200,800", help="comma-separated numbers of modes per simulated display")
+    parser.add_argument("--jobs", type=int, default=8, help="how many displays to configure at once, in parallel")
+    parser.add_argument(
+        "--latency", type=float, default=0.001,
+        help="how long (in seconds) each simulated call takes, when configuring in parallel (default: 0.001)")
+    parser.add_argument(
+        "--tokens", default="100,1000,10000", help="comma-separated numbers of words in parsed command strings")
+    parser.add_argument("--skip-startup", action="store_true", help="don't measure display_manager.py's startup")
+    parser.add_argument("--save", metavar="FILE", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare the results against a saved baseline")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2,
+        help="how much slower (as a fraction) a median may be than the baseline's (default: 0.2)")
+    args = parser.parse_args()
+
+    results = collections.OrderedDict()
+    passed = True
+
+    if not args.skip_startup:
+        passed = benchmarkStartup(args.runs, results) and passed
+
+    benchmarkOperations(
+        args.runs,
+        [int(count) for count in args.displays.split(",")],
+        [int(count) for count in args.modes.split(",")],
+        results,
+    )
+    benchmarkParallel(
+        args.runs, [int(count) for count in args.displays.split(",")], args.jobs, args.latency, results)
+    passed = benchmarkParsing(args.runs, [int(count) for count in args.tokens.split(",")], results) and passed
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("")
+        passed = compare(results, baseline, args.threshold) and passed
+
+    if not passed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,24 +22,44 @@
 # Can set screen resolution, refresh rate, rotation, brightness, underscan, and screen mirroring.
 
 import sys                          # Collect command-line arguments
+import os                           # Find the agent's socket
 import re                           # Parse command-line input
 import collections                  # Special collections are required for CommandList
+import io                           # Capture the agent's output for each client
+import contextlib                   # Capture the agent's output for each client
+import json                         # Encode messages between the agent and its clients
+import socket                       # Connect to the agent
+import socketserver                 # Run the agent
+import tempfile                     # Find the agent's socket
+import signal                       # Shut the agent down cleanly
+import threading                    # Serialize the agent's access to the displays
+import time                         # Time runs for the trace
+import select                       # Coalesce command lines which are already waiting to be read
+import stat                         # Check the agent's socket
 from display_manager_lib import *   # The Display Manager Library
 
 
+# The formats "show" can print in (see "--format")
+showFormats = ["text", "json", "jsonl"]
+# The version of the schema of "show"'s JSON output; changes whenever a key is renamed, removed, or changes meaning
+showSchema = 1
+
+
 class CommandSyntaxError(Exception):
     """
     Raised if commands have improper syntax
         (e.g. wrong number of arguments, arguments in wrong place, invalid (sub)command(s), etc.)
     """
 
-    def __init__(self, message, verb=None):
+    def __init__(self, message, verb=None, position=None):
         """
         :param verb: The type of command that raised this exception
         :param message: Description of what went wrong
+        :param position: Where (in characters) in the command string it went wrong, if known
         """
         self.message = message
         self.verb = verb
+        self.position = position
 
         Exception.__init__(self, self.message)
 
@@ -50,13 +70,15 @@ class CommandValueError(Exception):
         (e.g. values are incorrect type, values are outside expected range, etc.)
     """
 
-    def __init__(self, message, verb=None):
+    def __init__(self, message, verb=None, position=None):
         """
         :param verb: The type of command that raised this exception
         :param message: Description of what went wrong
+        :param position: Where (in characters) in the command string it went wrong, if known
         """
         self.message = message
         self.verb = verb
+        self.position = position
 
         Exception.__init__(self, self.message)
 
@@ -77,17 +99,67 @@ class CommandExecutionError(Exception):
         Exception.__init__(self, self.message)
 
 
+@contextlib.contextmanager
+def tracedRun(commands):
+    """
+    Records a "run" event in the trace (if Display Manager is being traced) once the block it wraps
+    finishes, with the commands which were run, how long they took and, if they raised an exception, what it was
+    :param commands: The Commands being run
+    """
+    if getTrace() is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        error = getattr(e, "message", repr(e))
+        trace("run", commands=[str(command) for command in commands], ok=False, error=error,
+              elapsed=time.perf_counter() - start)
+        raise
+    else:
+        trace("run", commands=[str(command) for command in commands], ok=True, error=None,
+              elapsed=time.perf_counter() - start)
+
+
+def traceReport(report):
+    """
+    Records an "operation" event in the trace (if Display Manager is being traced) for each change in a
+    ReconcileReport
+    :param report: The ReconcileReport to record
+    :return: report
+    """
+    if getTrace() is not None:
+        for status, operations in [("applied", report.applied), ("skipped", report.skipped)]:
+            for operation in operations:
+                trace(
+                    "operation", status=status, display=operation.display,
+                    setting=operation.setting, value=operation.value,
+                )
+    return report
+
+
 class Command(object):
     """
     Represents a user-requested command to Display Manager
+
+    Commands are immutable values: their fields can't be changed once they're created, and their equality,
+    hash, and ordering all come from a canonical key computed up front, without touching the displays.
     """
 
+    __slots__ = (
+        "__verb", "__subcommand", "__scope", "__width", "__height", "__refresh", "__hidpi",
+        "__angle", "__brightness", "__underscan", "__source", "__key", "__hash", "__sortKey",
+    )
+
     def __init__(self, **kwargs):
         """
         :param kwargs: Includes verb ("command type"), subcommand, scope, and misc. Command values
+            (a value of None is the same as leaving it out)
             verb: string in ["help", "show", "res", "brightness", "rotate", "underscan", "mirror"]
             subcommand: string
-            scope: Display(s)
+            scope: display tag(s) ("main", "ext<N>", or "all") and/or Display(s)
             width: int
             height: int
             refresh: int
@@ -95,45 +167,130 @@ class Command(object):
             angle: int
             brightness: float
             underscan: float
-            source: Display
+            source: display tag or Display
         """
+        def value(name, convert):
+            return convert(kwargs[name]) if kwargs.get(name) is not None else None
+
         # Determine verb
-        if "verb" in kwargs:
-            if kwargs["verb"] in ["help", "show", "res", "brightness", "rotate", "underscan", "mirror"]:
-                self.verb = kwargs["verb"]
-            else:
-                raise CommandSyntaxError("\"{}\" is not a valid command".format(kwargs["verb"]))
-        else:
-            self.verb = None
+        verb = kwargs.get("verb")
+        if verb is not None and verb not in ["help", "show", "res", "brightness", "rotate", "underscan", "mirror"]:
+            raise CommandSyntaxError("\"{}\" is not a valid command".format(verb))
+        self.__verb = verb
 
         # Determine subcommand, scope
-        self.subcommand = kwargs["subcommand"] if "subcommand" in kwargs else None
-        if "scope" in kwargs:
-            if isinstance(kwargs["scope"], list):
-                self.scope = kwargs["scope"]
-            elif isinstance(kwargs["scope"], AbstractDisplay):
-                self.scope = [kwargs["scope"]]
-            else:
-                self.scope = None
-        else:
-            self.scope = None
+        self.__subcommand = kwargs.get("subcommand")
+        # Display tags are kept as they are, and only resolved to Displays when the Command is run
+        # (see resolveScope); None means the verb's default scope
+        scope = kwargs.get("scope")
+        if isinstance(scope, (str, AbstractDisplay)):
+            scope = [scope]
+        for item in scope or []:
+            if isinstance(item, str) and not CommandParser.scopePattern.match(item):
+                raise CommandValueError("\"{}\" is not a valid display tag".format(item), verb=verb)
+        self.__scope = tuple(scope) if scope else None
 
         # Determine values
-        self.width = int(kwargs["width"]) if "width" in kwargs else None
-        self.height = int(kwargs["height"]) if "height" in kwargs else None
-        self.refresh = int(kwargs["refresh"]) if "refresh" in kwargs else None
+        self.__width = value("width", int)
+        self.__height = value("height", int)
+        self.__refresh = value("refresh", int)
         # For HiDPI:
         #   0: fits HiDPI or non-HiDPI
         #   1: fits only non-HiDPI
         #   2: fits only HiDPI
-        self.hidpi = int(kwargs["hidpi"]) if "hidpi" in kwargs else None
-        self.angle = int(kwargs["angle"]) if "angle" in kwargs else None
-        self.brightness = float(kwargs["brightness"]) if "brightness" in kwargs else None
-        self.underscan = float(kwargs["underscan"]) if "underscan" in kwargs else None
-        self.source = kwargs["source"] if "source" in kwargs else None
+        self.__hidpi = value("hidpi", int)
+        self.__angle = value("angle", int)
+        self.__brightness = value("brightness", float)
+        self.__underscan = value("underscan", float)
+        self.__source = kwargs.get("source")
+
+        # The order of a scope doesn't matter, and "all" includes everything else
+        scopeKey = None
+        if self.__scope:
+            scopeKey = frozenset(["all"]) if "all" in self.__scope else frozenset(self.__scope)
+        fields = (
+            self.__width, self.__height, self.__refresh, self.__hidpi,
+            self.__angle, self.__brightness, self.__underscan,
+        )
+        self.__key = (self.__verb, self.__subcommand, scopeKey) + fields + (self.__source,)
+        self.__hash = hash(self.__key)
+        # Every element must be comparable with the same element of any other Command's sort key,
+        # so missing values sort first, and display tags sort before Displays
+        self.__sortKey = (
+            self.__verb or "",
+            self.__subcommand or "",
+            tuple(sorted(self.__scopeItemKey(item) for item in scopeKey)) if scopeKey else (),
+        ) + tuple((0, 0) if field is None else (1, field) for field in fields) + (
+            self.__scopeItemKey(self.__source) if self.__source is not None else (),
+        )
+
+    @staticmethod
+    def __scopeItemKey(item):
+        """
+        :param item: A display tag or Display
+        :return: A key to sort item by: "all", then "main", then external displays in order, then Displays
+        """
+        if isinstance(item, str):
+            return 0, {"all": -2, "main": -1}.get(item) or int(item[3:])
+        else:
+            return 1, item.displayID
+
+    # Fields
+
+    @property
+    def verb(self):
+        return self.__verb
 
-        # Make sure IOKit is ready for use in any/all commands
-        getIOKit()
+    @property
+    def subcommand(self):
+        return self.__subcommand
+
+    @property
+    def scope(self):
+        """
+        :return: A tuple of the display tags and/or Displays this Command was given, or None for its default scope
+        """
+        return self.__scope
+
+    @property
+    def width(self):
+        return self.__width
+
+    @property
+    def height(self):
+        return self.__height
+
+    @property
+    def refresh(self):
+        return self.__refresh
+
+    @property
+    def hidpi(self):
+        return self.__hidpi
+
+    @property
+    def angle(self):
+        return self.__angle
+
+    @property
+    def brightness(self):
+        return self.__brightness
+
+    @property
+    def underscan(self):
+        return self.__underscan
+
+    @property
+    def source(self):
+        return self.__source
+
+    @property
+    def key(self):
+        """
+        :return: This Command's canonical key: equal Commands (regardless of the order of their scopes)
+            have equal keys
+        """
+        return self.__key
 
     # "Magic" methods
 
@@ -158,7 +315,7 @@ class Command(object):
         elif self.verb == "underscan":
             stringList.append(self.underscan)
         elif self.verb == "mirror" and self.subcommand == "enable":
-            stringList.append(self.source.tag)
+            stringList.append(self.source if isinstance(self.source, str) else self.source.tag)
 
         # Determine options
 
@@ -175,26 +332,15 @@ class Command(object):
         # Determine scope
 
         if self.scope:
-            if len(self.scope) == len(getAllDisplays()):
+            tags = set(item if isinstance(item, str) else item.tag for item in self.scope)
+            if "all" in tags:
                 stringList.append("all")
             else:
-                for display in sorted(self.scope):
-                    stringList.append(display.tag)
+                # "main" first, then external displays in order
+                stringList.extend(sorted(tags, key=lambda tag: -1 if tag == "main" else int(tag[3:])))
         # Default scope
         else:
-            if (
-                self.verb == "res" or
-                self.verb == "rotate" or
-                self.verb == "brightness" or
-                self.verb == "underscan"
-            ):
-                stringList.append("main")
-
-            elif (
-                self.verb == "show" or
-                (self.verb == "mirror" and self.subcommand == "disable")
-            ):
-                stringList.append("all")
+            stringList.extend(self.defaultScope)
 
         # Convert everything to a string so it can be joined
         for i in range(len(stringList)):
@@ -203,90 +349,156 @@ class Command(object):
         return " ".join(stringList)
 
     def __eq__(self, other):
-        def safeScopeCheckEquals(a, b):
-            """
-            Check whether two Commands' scopes are equal in a None-safe way
-            :param a: The first Command
-            :param b: The second Command
-            :return: Whether the two scopes are equal
-            """
-            if a.scope and b.scope:
-                return set(a.scope) == set(b.scope)
-            else:
-                return a.scope == b.scope
-
-        if isinstance(other, self.__class__):
-            return all([
-                isinstance(other, self.__class__),
-
-                self.verb == other.verb,
-                self.subcommand == other.subcommand,
-                safeScopeCheckEquals(self, other),
-
-                self.width == other.width,
-                self.height == other.height,
-                self.refresh == other.refresh,
-                self.hidpi == other.hidpi,
-                self.angle == other.angle,
-                self.brightness == other.brightness,
-                self.underscan == other.underscan,
-                self.source == other.source,
-            ])
+        if isinstance(other, Command):
+            return self.__key == other.__key
         else:
             return NotImplemented
 
     def __ne__(self, other):
-        if isinstance(other, self.__class__):
-            return not self.__eq__(other)
+        if isinstance(other, Command):
+            return self.__key != other.__key
         else:
             return NotImplemented
 
     def __lt__(self, other):
-        if self.__eq__(other):
-            return False
+        if isinstance(other, Command):
+            return self.__sortKey < other.__sortKey
         else:
-            return self.__str__().lower() < self.__str__().lower()
+            return NotImplemented
 
     def __gt__(self, other):
-        if self.__eq__(other):
-            return False
+        if isinstance(other, Command):
+            return self.__sortKey > other.__sortKey
         else:
-            return self.__str__().lower() > self.__str__().lower()
+            return NotImplemented
 
     def __hash__(self):
-        return hash(self.__str__())
+        return self.__hash
+
+    # Scope
+
+    @property
+    def defaultScope(self):
+        """
+        :return: The display tags this Command applies to if it isn't given a scope
+        """
+        if self.verb in ["res", "rotate", "brightness", "underscan"]:
+            return ["main"]
+        elif self.verb == "show" or (self.verb == "mirror" and self.subcommand == "disable"):
+            return ["all"]
+        else:
+            return []
+
+    def resolveScope(self, snapshot=None):
+        """
+        Resolves this Command's scope (or its default scope, if it wasn't given one) to Displays
+        :param snapshot: The DisplaySnapshot to look display tags up in; if None, the current one is used
+        :return: The Displays this Command applies to
+        """
+        scope = self.scope if self.scope else self.defaultScope
+        if not scope:
+            return []
+        if snapshot is None:
+            snapshot = getDisplaySnapshot()
+
+        if "all" in scope:
+            return list(snapshot.displays)
+        displays = []
+        for item in scope:
+            display = snapshot.fromTag(item) if isinstance(item, str) else item
+            if display not in displays:
+                displays.append(display)
+        return displays
+
+    def resolveSource(self, snapshot=None):
+        """
+        :param snapshot: The DisplaySnapshot to look the source's display tag up in; if None, the current one is used
+        :return: The Display this (mirror) Command's source refers to, or None if it has no source
+        """
+        if isinstance(self.source, str):
+            return (snapshot if snapshot is not None else getDisplaySnapshot()).fromTag(self.source)
+        return self.source
 
     # Run (and its handlers)
 
-    def run(self):
+    def run(self, format="text", snapshot=None):
         """
         Runs the command this Command has stored
+        :param format: How "show" commands print what they show (see showFormats)
+        :param snapshot: The DisplaySnapshot to look display tags up in; if None, the displays are checked
+            (see refreshDisplaySnapshot) and the current one is used
+        :return: For commands which change display settings, a ReconcileReport of which changes were applied
+            and which were skipped (because the displays already matched them)
+        """
+        with tracedRun([self]):
+            try:
+                if self.verb != "help" and snapshot is None:
+                    snapshot = refreshDisplaySnapshot()
+                if self.verb == "help":
+                    self.__handleHelp()
+                elif self.verb == "show":
+                    displays = self.resolveScope(snapshot)
+                    self.__trace(displays)
+                    self.__handleShow(displays, format)
+                elif self.verb in ["res", "rotate", "brightness", "underscan", "mirror"]:
+                    reconciler = DisplayReconciler()
+                    self.addTargets(reconciler, snapshot=snapshot)
+                    return traceReport(reconciler.apply())
+            except DisplayError as e:
+                raise CommandExecutionError(e.message, command=self)
+
+    def showRecords(self, snapshot=None):
+        """
+        Reads what this "show" Command shows, in machine-readable form (see writeShowRecords), without writing it
+        :param snapshot: The DisplaySnapshot to look display tags up in; if None, the current one is used
+        :return: A dictionary describing each display in this Command's scope
         """
         try:
-            if self.verb == "help":
-                self.__handleHelp()
-            elif self.verb == "show":
-                self.__handleShow()
-            elif self.verb == "res":
-                self.__handleRes()
-            elif self.verb == "rotate":
-                self.__handleRotate()
-            elif self.verb == "brightness":
-                self.__handleBrightness()
-            elif self.verb == "underscan":
-                self.__handleUnderscan()
-            elif self.verb == "mirror":
-                self.__handleMirror()
+            displays = self.resolveScope(snapshot)
+            self.__trace(displays)
+            return [self.__showRecord(display) for display in displays]
         except DisplayError as e:
             raise CommandExecutionError(e.message, command=self)
 
+    def addTargets(self, reconciler, displays=None, snapshot=None):
+        """
+        Adds the display settings this Command asks for to a DisplayReconciler, without applying them
+        :param reconciler: The DisplayReconciler to add targets to
+        :param displays: The Displays (from this Command's scope) to add targets for; if None, all of them
+        :param snapshot: The DisplaySnapshot to resolve display tags against; if None, the current one is used
+        """
+        if snapshot is None:
+            snapshot = getDisplaySnapshot()
+        if displays is None:
+            displays = self.resolveScope(snapshot)
+        self.__trace(displays)
+
+        if self.verb == "res":
+            self.__handleRes(reconciler, displays)
+        elif self.verb == "rotate":
+            self.__handleRotate(reconciler, displays)
+        elif self.verb == "brightness":
+            self.__handleBrightness(reconciler, displays)
+        elif self.verb == "underscan":
+            self.__handleUnderscan(reconciler, displays)
+        elif self.verb == "mirror":
+            self.__handleMirror(reconciler, displays, snapshot)
+
+    def __trace(self, displays):
+        """
+        Records a "command" event in the trace (if Display Manager is being traced)
+        :param displays: The Displays this Command is being run on
+        """
+        if getTrace() is not None:
+            trace("command", command=str(self), verb=self.verb, scope=displays)
+
     def __handleHelp(self):
         """
         Shows the user usage information (either for a specific verb, or general help)
         """
         helpTypes = {
             "usage": "\n".join([
-                "usage:  display_manager.py <command>",
+                "usage:  display_manager.py [options] <command>",
                 "",
                 "COMMANDS (required)",
                 "    help        Show help information about a command",
@@ -296,6 +508,28 @@ class Command(object):
                 "    rotate      Manage display rotation",
                 "    underscan   Manage display underscan",
                 "    mirror      Manage screen mirroring",
+                "",
+                "OPTIONS (optional)",
+                "    --configure <option>    How long configuration changes last",
+                "        permanent (default)     Until changed again (persists across logins)",
+                "        session                 Until the user logs out",
+                "        app                     Until Display Manager exits (resolution and mirroring only)",
+                "        transient               Until Display Manager exits (all settings)",
+                "    --socket <path>         Send commands to the agent listening at <path>",
+                "    --profiles <file>       Apply the display profiles in <file> (when given without commands)",
+                "    --stats                 Show how many calls were made to the displays, and how long they took",
+                "    --trace <file>          Append a JSON-lines trace of everything done to <file> (\"-\": stderr)",
+                "    --jobs <n>              Configure up to <n> displays at once (default: 1)",
+                "    -f, --file <file>       Run the commands on each line of <file> (\"-\": standard input)",
+                "    --format <format>       How \"show\" prints what it shows",
+                "        text (default)          For people to read",
+                "        json                    A single JSON document, of every display",
+                "        jsonl                   A JSON document (line) per display",
+                "",
+                "AGENT",
+                "    display_manager.py serve [--socket <path>] [--profiles <file>] [--trace <file>]",
+                "        Keep Display Manager running, and accept commands from \"--socket\" clients;",
+                "        with \"--profiles\", apply profiles to displays as they are connected",
             ]), "help": "\n".join([
                 "usage:  display_manager.py help <command>",
                 "",
@@ -409,26 +643,30 @@ class Command(object):
         else:
             print(helpTypes["usage"])
 
-    def __handleShow(self):
+    def __handleShow(self, displays, format="text"):
         """
         Shows the user information about connected displays
         """
-        for i, display in enumerate(self.scope):
+        if format != "text":
+            writeShowRecords([self.__showRecord(display) for display in displays], format)
+            return
+
+        for i, display in enumerate(displays):
             # Always print display identifier
             print("display \"{0}\":".format(display.tag))
 
             if self.subcommand == "current":
-                current = display.currentMode
-                print(current.bigString)
-
-                if display.rotation is not None:
-                    print("rotation:       {}".format(display.rotation))
-                if display.brightness is not None:
-                    print("brightness:     {:.2f}".format(display.brightness))
-                if display.underscan is not None:
-                    print("underscan:      {:.2f}".format(display.underscan))
-                if display.mirrorSource is not None:
-                    print("mirror of:      {}".format(display.mirrorSource.tag))
+                state = display.snapshot()
+                print(state.mode.bigString)
+
+                if state.rotation is not None:
+                    print("rotation:       {}".format(state.rotation))
+                if state.brightness is not None:
+                    print("brightness:     {:.2f}".format(state.brightness))
+                if state.underscan is not None:
+                    print("underscan:      {:.2f}".format(state.underscan))
+                if state.mirrorSource is not None:
+                    print("mirror of:      {}".format(state.mirrorSource.tag))
 
             elif self.subcommand == "default":
                 default = display.defaultMode
@@ -441,21 +679,14 @@ class Command(object):
                     print(highest.bigString)
 
             elif self.subcommand == "available":
-                # Categorize modes by type, in order
-                current = None
-                default = None
-                hidpi = []
-                lodpi = []
-                for mode in sorted(display.allModes, reverse=True):
-                    if mode == display.currentMode:
-                        current = mode
-                    # Note: intentionally left "if" instead of "elif"; mode can be both current and default
-                    if mode.isDefault:
-                        default = mode
-                    if mode.hidpi:
-                        hidpi.append(mode)
-                    if not mode.hidpi:
-                        lodpi.append(mode)
+                # The catalog already has modes categorized by type, in order
+                catalog = display.modeCatalog
+                current = display.currentMode
+                if catalog.exact(current.width, current.height, current.refresh, current.hidpi) is None:
+                    current = None
+                default = catalog.default
+                hidpi = catalog.hidpiModes
+                lodpi = catalog.lodpiModes
 
                 if current:
                     print("\n".join([
@@ -488,61 +719,111 @@ class Command(object):
                         )
 
             # Leave an empty line between displays
-            if i < len(self.scope) - 1:
+            if i < len(displays) - 1:
                 print("")
 
-    def __handleRes(self):
+    @staticmethod
+    def __modeRecord(mode):
         """
-        Sets the display to the correct DisplayMode.
+        :param mode: A DisplayMode, or None
+        :return: mode, as "show"'s machine-readable output represents it
         """
-        for display in self.scope:
+        if mode is None:
+            return None
+        return {
+            "width": mode.width,
+            "height": mode.height,
+            "refresh": mode.refresh,
+            "hidpi": mode.hidpi,
+            "pixelWidth": mode.pixelWidth,
+            "pixelHeight": mode.pixelHeight,
+            "isDefault": mode.isDefault,
+        }
+
+    def __showRecord(self, display):
+        """
+        :param display: The Display to describe
+        :return: Everything "show" can show about display, as a dictionary with the keys of showSchema
+            (each of which is always present; what a display doesn't support is None)
+        """
+        # One read of the display's settings, and its (cached) mode catalog
+        state = display.snapshot()
+        catalog = display.modeCatalog
+        if self.hidpi == 1:
+            available = catalog.lodpiModes
+        elif self.hidpi == 2:
+            available = catalog.hidpiModes
+        else:
+            available = catalog.modes
+
+        mirrorSource = None
+        if state.mirrorSource is not None:
+            mirrorSource = {"displayID": state.mirrorSource.displayID, "tag": state.mirrorSource.tag}
+
+        return {
+            "displayID": state.displayID,
+            "tag": display.tag,
+            "isMain": state.isMain,
+            "current": self.__modeRecord(state.mode),
+            "default": self.__modeRecord(catalog.default),
+            "highest": self.__modeRecord(catalog.highest(self.hidpi)),
+            "available": [self.__modeRecord(mode) for mode in available],
+            "rotation": state.rotation,
+            "brightness": state.brightness,
+            "underscan": state.underscan,
+            "mirrorSource": mirrorSource,
+        }
+
+    def __handleRes(self, reconciler, displays):
+        """
+        Targets the correct DisplayMode for each display.
+        """
+        for display in displays:
             if self.subcommand == "default":
-                default = display.defaultMode
-                display.setMode(default)
+                mode = display.defaultMode
 
             elif self.subcommand == "highest":
-                highest = display.highestMode(self.hidpi)
-                display.setMode(highest)
+                mode = display.highestMode(self.hidpi)
 
             else:
-                closest = display.closestMode(self.width, self.height, self.refresh, self.hidpi)
-                display.setMode(closest)
+                mode = display.closestMode(self.width, self.height, self.refresh, self.hidpi)
+
+            reconciler.setTarget(display, mode=mode)
 
-    def __handleRotate(self):
+    def __handleRotate(self, reconciler, displays):
         """
-        Sets display rotation.
+        Targets display rotation.
         """
-        for display in self.scope:
-            display.setRotate(self.angle)
+        for display in displays:
+            reconciler.setTarget(display, rotation=self.angle)
 
-    def __handleBrightness(self):
+    def __handleBrightness(self, reconciler, displays):
         """
-        Sets display brightness
+        Targets display brightness
         """
-        for display in self.scope:
-            display.setBrightness(self.brightness)
+        for display in displays:
+            reconciler.setTarget(display, brightness=self.brightness)
 
-    def __handleUnderscan(self):
+    def __handleUnderscan(self, reconciler, displays):
         """
-        Sets or shows a display's underscan settings.
+        Targets a display's underscan settings.
         """
-        for display in self.scope:
-            display.setUnderscan(self.underscan)
+        for display in displays:
+            reconciler.setTarget(display, underscan=self.underscan)
 
-    def __handleMirror(self):
+    def __handleMirror(self, reconciler, displays, snapshot):
         """
-        Enables or disables mirroring between two displays.
+        Targets mirroring between two displays.
         """
         if self.subcommand == "enable":
-            source = self.source
-            for target in self.scope:
-                target.setMirrorSource(source)
+            source = self.resolveSource(snapshot)
+            for target in displays:
+                reconciler.setTarget(target, mirrorSource=source)
 
         elif self.subcommand == "disable":
-            for target in self.scope:
-                # If display is a mirror of another display, disable mirroring between them
-                if target.mirrorSource is not None:
-                    target.setMirrorSource(None)
+            # Displays which aren't mirroring anything are skipped by the reconciler
+            for target in displays:
+                reconciler.setTarget(target, mirrorSource=None)
 
 
 class CommandList(object):
@@ -550,14 +831,16 @@ class CommandList(object):
     Holds one or more "Command" instances, and allows smart simultaneous execution
     """
 
+    # Verbs, in the order they must be run to avoid interfering with each other
+    # (settings verbs are ordered by the DisplayReconciler, between "help" and "show")
+    verbOrder = ["help", "mirror", "rotate", "res", "underscan", "brightness", "show"]
+
     def __init__(self, commands=None):
         """
         :param commands: A single Command, a list of Commands, or a CommandList
         """
         # self.commands is a list that contains all the raw commands passed in to self.addCommand
         self.commands = []
-        # self.commandDict will consist of displayID keys corresponding to commands for that display
-        self.commandDict = {}
 
         if commands:
             if isinstance(commands, Command):
@@ -584,11 +867,8 @@ class CommandList(object):
             return NotImplemented
 
     def __hash__(self):
-        h = 0
-        for command in self.commands:
-            h = h | command.__str__()
-
-        return hash(h)
+        # Consistent with __eq__: neither the order of the commands nor repeated commands matter
+        return hash(frozenset(self.commands))
 
     # Command interfacing
 
@@ -596,154 +876,141 @@ class CommandList(object):
         """
         :param command: The Command to add to this CommandList
         """
-        # Break "command" into each individual action it will perform
-        # on each individual display in its scope, and add those actions
-        # to commandDict, according to their associated display
-        if command.scope:
-            if len(command.scope) == len(getAllDisplays()):
-                if "all" in self.commandDict:
-                    self.commandDict["all"].append(command)
-                else:
-                    self.commandDict["all"] = [command]
-            else:
-                for display in command.scope:
-                    if display.tag in self.commandDict:
-                        self.commandDict[display.tag].append(command)
-                    else:
-                        self.commandDict[display.tag] = [command]
-        # If there is no scope, there will be only one action.
-        # In this case, we simply add the command to key "None".
-        #   Note: this should only be possible with verb="help", since every
-        #   other verb has a default scope
-        else:
-            if None in self.commandDict:
-                self.commandDict[None].append(command)
-            else:
-                self.commandDict[None] = [command]
-
+        # Commands' scopes are only resolved to displays when they are run
         self.commands.append(command)
 
-    def run(self):
-        """
-        Runs all stored Commands in a non-interfering fashion
-        """
-        for displayTag in self.commandDict:
-            # Commands for this particular display
-            displayCommands = self.commandDict[displayTag]
-
-            # Group commands by subcommand. Must preserve ordering to avoid interfering commands
-            verbGroups = collections.OrderedDict([
-                ("help", []),
-                ("mirror", []),
-                ("rotate", []),
-                ("res", []),
-                ("underscan", []),
-                ("brightness", []),
-                ("show", []),
-            ])
-            for command in displayCommands:
-                verbGroups[command.verb].append(command)
-
-            # Run commands by subcommand
-            for verb in verbGroups:
-                # Commands for this display, of this subcommand
-                commands = verbGroups[verb]
-
-                if len(commands) > 0:
-                    # Multiple commands of these types will undo each other.
-                    # As such, just run the most recently added command (the last in the list)
-                    if (
-                            verb == "help" or
-                            verb == "rotate" or
-                            verb == "res" or
-                            verb == "brightness" or
-                            verb == "underscan"
-                    ):
-                        try:
-                            commands[-1].run()
-                        except DisplayError as e:
-                            raise CommandExecutionError(e.message, commands[-1])
-
-                    # "show" commands don't interfere with each other, so run all of them
-                    elif verb == "show":
-                        for command in commands:
-                            try:
-                                command.run()
-                            except DisplayError as e:
-                                raise CommandExecutionError(e.message, command)
-
-                    # "mirror" commands are the most complicated to deal with
-                    elif verb == "mirror":
-                        command = commands[-1]
-
-                        if command.subcommand == "enable":
-                            display = getDisplayFromTag(displayTag)
-                            # The current Display that the above "display" is mirroring
-                            currentMirror = display.mirrorSource
-                            # Become a mirror of most recently requested display
-                            mirrorDisplay = command.source
-
-                            # If display is not a mirror of any other display
-                            if currentMirror is None:
-                                try:
-                                    display.setMirrorSource(mirrorDisplay)
-                                except DisplayError as e:
-                                    raise CommandExecutionError(e.message, command)
-
-                            # The user requested that this display mirror itself, or that it mirror a display
-                            # which it is already mirroring. In either case, nothing should be done
-                            elif display == currentMirror or currentMirror == mirrorDisplay:
-                                pass
-
-                            # display is already a mirror, but not of the requested display
-                            else:
-                                # First disable mirroring, then enable it for new mirror
-                                display.setMirrorSource(None)
-                                display.setMirrorSource(mirrorDisplay)
-                                try:
-                                    display.setMirrorSource(None)
-                                    display.setMirrorSource(mirrorDisplay)
-                                except DisplayError as e:
-                                    raise CommandExecutionError(e.message, command)
-
-                        elif command.subcommand == "disable":
-                            try:
-                                command.run()
-                            except DisplayError as e:
-                                raise CommandExecutionError(e.message, command)
-
-
-def getDisplayFromTag(displayTag):
+    def unique(self):
+        """
+        :return: A CommandList of the same Commands, in the same order, without any repeated ones
+        """
+        seen = set()
+        commands = []
+        for command in self.commands:
+            if command not in seen:
+                seen.add(command)
+                commands.append(command)
+        return CommandList(commands)
+
+    def run(self, option=None, workers=1, format="text"):
+        """
+        Runs all stored Commands in a non-interfering fashion.
+
+        Every settings change is collected into a single DisplayReconciler, which compares them against the
+        displays' current settings and only performs the ones which change something. Mode and mirroring
+        changes are applied as one DisplayConfiguration; if any change fails, none of the pending ones are.
+        "help" commands run before any changes, and "show" commands after all of them.
+        :param option: The configure option to apply changes with (see configureOptions); if None,
+            the current default is used
+        :param workers: The most displays to read or configure at once (see DisplayReconciler)
+        :param format: How "show" commands print what they show (see showFormats)
+        :return: A ReconcileReport of which changes were applied and which were skipped
+        """
+        with tracedRun(self.commands):
+            # Check the displays once, up front; every display tag is then looked up in the same snapshot
+            if any(command.verb != "help" for command in self.commands):
+                refreshDisplaySnapshot()
+            return self.__run(option, workers, format)
+
+    def __run(self, option, workers, format):
+        """
+        Runs all stored Commands (see run)
+        """
+        # Must preserve verb ordering to avoid interfering commands
+        verbGroups = collections.OrderedDict([(verb, []) for verb in self.verbOrder])
+        for command in self.commands:
+            verbGroups[command.verb].append(command)
+
+        # Multiple "help" commands are redundant, so just run the most recently added one
+        if verbGroups["help"]:
+            verbGroups["help"][-1].run()
+
+        reconciler = DisplayReconciler(option, workers)
+        # Every command's display tags are resolved against the same snapshot
+        snapshot = None
+        for verb in self.verbOrder:
+            if verb == "help" or verb == "show" or not verbGroups[verb]:
+                continue
+            if snapshot is None:
+                snapshot = getDisplaySnapshot()
+
+            # Multiple commands of the same verb will undo each other.
+            # As such, each display is only targeted by the most recently added command which applies to it
+            targeted = set()
+            commandTargets = []
+            for command in reversed(verbGroups[verb]):
+                try:
+                    displays = command.resolveScope(snapshot)
+                except DisplayError as e:
+                    raise CommandExecutionError(e.message, command)
+                displays = [display for display in displays if display.displayID not in targeted]
+                targeted.update(display.displayID for display in displays)
+                if displays:
+                    commandTargets.append((command, displays))
+
+            for command, displays in reversed(commandTargets):
+                try:
+                    command.addTargets(reconciler, displays, snapshot)
+                except DisplayError as e:
+                    raise CommandExecutionError(e.message, command)
+
+        try:
+            report = traceReport(reconciler.apply())
+        except DisplayError as e:
+            raise CommandExecutionError(e.message)
+
+        # "show" commands don't interfere with each other, so run all of them. Machine-readable output is
+        # written all at once, so that every "show" command's displays are in the same (single) document
+        if format == "text":
+            for command in verbGroups["show"]:
+                command.run(format, getDisplaySnapshot())
+        elif verbGroups["show"]:
+            records = []
+            for command in verbGroups["show"]:
+                records.extend(command.showRecords())
+            writeShowRecords(records, format)
+
+        return report
+
+
+def writeShowRecords(records, format):
+    """
+    Writes what "show" commands read about displays to standard output, in a machine-readable format
+    :param records: The dictionaries describing each display (see Command.showRecords)
+    :param format: "json" for a single document ({"schema": showSchema, "displays": [...]}), or
+        "jsonl" for one document per display (each with its own "schema")
+    """
+    # Encode everything before writing any of it, so the output is written (and flushed) all at once,
+    # and a display failing part way through doesn't leave a truncated document behind
+    buffer = io.StringIO()
+    if format == "json":
+        json.dump({"schema": showSchema, "displays": records}, buffer, indent=4)
+        buffer.write("\n")
+    else:
+        for record in records:
+            line = {"schema": showSchema}
+            line.update(record)
+            json.dump(line, buffer)
+            buffer.write("\n")
+
+    sys.stdout.write(buffer.getvalue())
+    sys.stdout.flush()
+
+
+def getDisplayFromTag(displayTag, snapshot=None):
     """
     Returns a Display for "displayTag"
     :param displayTag: The display tag to find the Display of
+    :param snapshot: The DisplaySnapshot to look displayTag up in; if None, the current one is used
     :return: The Display which displayTag refers to
     """
-    if displayTag == "main":
-        return getMainDisplay()
-    elif displayTag == "all":
-        return getAllDisplays()
-    elif re.match(r"^ext[0-9]+$", displayTag):
-        # Get all the external displays (in order)
-        externals = sorted(getAllDisplays())
-        for display in externals:
-            if display.isMain:
-                externals.remove(display)
-                break
-
-        # Get the number in displayTag
-        externalNum = int(displayTag[3:])
-        if externalNum > len(externals) - 1:
-            # There aren't enough displays for this externalNumber to be valid
-            raise CommandValueError("There is no display \"{}\"".format(displayTag))
-        else:
-            # 0 < externalNum < len(externals) - 1 means valid tag
-            # ("0 < externalNum" known from re.match(r"^ext[0-9]+$") above)
-            return externals[externalNum]
+    if snapshot is None:
+        snapshot = getDisplaySnapshot()
 
-    # Note: no need for final "else" here, because getDisplayFromTag will only
-    # be passed regex matches for "main|all|ext[0-9]+", because these are the only
-    # arguments added to "scopeTags"
+    try:
+        return snapshot.fromTag(displayTag)
+    except DisplayError:
+        # There aren't enough displays for this external number to be valid
+        raise CommandValueError("There is no display \"{}\"".format(displayTag))
 
 
 def getCommand(commandString):
@@ -752,488 +1019,531 @@ def getCommand(commandString):
     :param commandString: the string to convert
     :return: The Command represented by "commandString"
     """
-    if not commandString:
+    parser = CommandParser()
+    tokens = parser.tokenize(commandString)
+    if not tokens:
         return None
+    return parser.parseCommand(tokens)
+
+
+def parseCommands(commandStrings):
+    """
+    :param commandStrings: The string to get Commands from
+    :return: Commands contained within the string
+    """
+    return CommandParser().parse(commandStrings)
+
+
+# A word of a command string: its text, its position (in characters) in the string, and its kind
+# ("verb", "scope" for display tags, or "word" for anything else)
+Token = collections.namedtuple("Token", ["text", "position", "kind"])
+
+
+class CommandParser(object):
+    """
+    Parses command strings into Commands.
+
+    Command strings are split into words (tokens) in a single pass, and then into commands at each verb,
+    so parsing takes time linear in the length of the string. Errors are raised with the position (in
+    characters) of the word which caused them. Parsing never touches the displays: display tags are kept
+    in the Commands as they are, and only resolved when the Commands are run.
+    """
+
+    verbs = frozenset(["help", "show", "res", "brightness", "rotate", "underscan", "mirror"])
+    scopePattern = re.compile(r"(?:main|all|ext[0-9]+)\Z")
+    wordPattern = re.compile(r"\S+")
+    nonASCIIPattern = re.compile(r"[^\x00-\x7f]")
 
-    # Individual words/values in the command
-    words = commandString.split()
-
-    # Determine verb, and remove it from words
-    verb = words.pop(0)
-
-    # Determine scope, and remove it from words
-    scopePattern = r"^(main|ext[0-9]+|all)$"
-    scopeTags = []
-    # Iterate backwards through the indices of "words"
-    for i in range(len(words) - 1, -1, -1):
-        if re.match(scopePattern, words[i]):
-            # If this scope tag is at the end of the list
-            if words[i] == words[-1]:
-                scopeTags.append(words.pop(i))
-            # This scope tag is in the wrong place
+    def tokenize(self, commandString):
+        """
+        :param commandString: The string to split into words
+        :return: A list of the Tokens in commandString
+        """
+        nonASCII = self.nonASCIIPattern.search(commandString)
+        if nonASCII:
+            raise CommandSyntaxError("Commands cannot include non-ASCII characters", position=nonASCII.start())
+
+        tokens = []
+        for match in self.wordPattern.finditer(commandString):
+            word = match.group()
+            if word in self.verbs:
+                kind = "verb"
+            elif self.scopePattern.match(word):
+                kind = "scope"
             else:
-                raise CommandSyntaxError("Invalid placement of {}".format(words[i]), verb=verb)
-
-    # Determine positionals (all remaining words)
-    positionals = words
-
-    attributesDict = {
-        "verb": verb,
-        "subcommand": None,
-        "scope": None,
-        "width": None,
-        "height": None,
-        "refresh": None,
-        "hidpi": None,
-        "angle": None,
-        "brightness": None,
-        "underscan": None,
-        "source": None,
-    }
+                kind = "word"
+            tokens.append(Token(word, match.start(), kind))
+        return tokens
+
+    def parse(self, commandStrings):
+        """
+        :param commandStrings: The string to get Commands from
+        :return: A CommandList of the Commands contained within the string
+        """
+        tokens = self.tokenize(commandStrings) if commandStrings else []
+        # Empty string
+        if not tokens:
+            raise CommandSyntaxError("An empty string is not a valid command")
+
+        # Make sure the command starts with a valid verb
+        first = tokens[0]
+        if first.kind != "verb":
+            raise CommandSyntaxError(
+                "\"{}\" is not a valid type of command".format(first.text), verb=first.text, position=first.position)
+
+        commands = CommandList()
+        # The whole command will be interpreted as a single help command
+        if first.text == "help":
+            commands.addCommand(self.parseCommand(tokens))
+            return commands
+
+        # Each verb starts a new command
+        start = 0
+        for i in range(1, len(tokens) + 1):
+            if i < len(tokens) and tokens[i].kind != "verb":
+                continue
+            # Cannot run more than one command if one of them is a "help" command
+            if i < len(tokens) and tokens[i].text == "help":
+                raise CommandSyntaxError(
+                    "Cannot run multiple commands if one of them is \"help\"", verb="help", position=tokens[i].position)
+            commands.addCommand(self.parseCommand(tokens[start:i]))
+            start = i
+
+        return commands
+
+    def parseCommand(self, tokens):
+        """
+        :param tokens: The Tokens of a single command, starting with its verb
+        :return: The Command represented by tokens
+        """
+        verb = tokens[0].text
+        if tokens[0].kind != "verb":
+            raise CommandSyntaxError(
+                "\"{}\" is not a valid command".format(verb), verb=verb, position=tokens[0].position)
+
+        # Scope tags must all come at the end of the command
+        end = len(tokens)
+        while end > 1 and tokens[end - 1].kind == "scope":
+            end -= 1
+        scopeTags = tokens[end:]
+        # Everything between the verb and the scope
+        positionals = tokens[1:end]
+        for token in positionals:
+            if token.kind == "scope":
+                raise CommandSyntaxError(
+                    "Invalid placement of {}".format(token.text), verb=verb, position=token.position)
+
+        # Where missing arguments should have been
+        last = tokens[-1]
+        self.__end = last.position + len(last.text)
+
+        if verb == "help":
+            attributes = self.__parseHelp(verb, positionals + scopeTags)
+        elif verb == "show":
+            attributes = self.__parseShow(verb, positionals, scopeTags)
+        elif verb == "res":
+            attributes = self.__parseRes(verb, positionals, scopeTags)
+        elif verb == "rotate":
+            attributes = self.__parseRotate(verb, positionals, scopeTags)
+        elif verb == "brightness":
+            attributes = self.__parseLevel(verb, positionals, scopeTags)
+        elif verb == "underscan":
+            attributes = self.__parseLevel(verb, positionals, scopeTags)
+        else:
+            attributes = self.__parseMirror(verb, positionals, scopeTags)
+
+        attributes["verb"] = verb
+        return Command(**attributes)
+
+    # Scope
+
+    @staticmethod
+    def __scope(scopeTags):
+        """
+        :param scopeTags: The scope Tokens of a command
+        :return: The display tags of scopeTags, or None if there aren't any (for the verb's default scope)
+        """
+        return [token.text for token in scopeTags] or None
+
+    # Verbs
+
+    def __parseHidpi(self, verb, positionals):
+        """
+        Removes "no-hidpi" and "only-hidpi" from positionals
+        :return: 0 (fits HiDPI or non-HiDPI), 1 (fits only non-HiDPI), or 2 (fits only HiDPI), and the
+            remaining positionals
+        """
+        hidpi = 0
+        remaining = []
+        for token in positionals:
+            if token.text == "no-hidpi" or token.text == "only-hidpi":
+                setting = 1 if token.text == "no-hidpi" else 2
+                # If HiDPI has been set to the contrary setting
+                if hidpi not in [0, setting]:
+                    raise CommandValueError(
+                        "Cannot specify both \"no-hidpi\" and \"only-hidpi\"", verb=verb, position=token.position)
+                hidpi = setting
+            else:
+                remaining.append(token)
+        return hidpi, remaining
 
-    if verb == "help":
+    def __parseHelp(self, verb, positionals):
         if len(positionals) == 0:
             # Default (sub)command
             subcommand = "usage"
         elif len(positionals) == 1:
-            if positionals[0] in ["help", "show", "res", "brightness", "rotate", "underscan", "mirror"]:
-                subcommand = positionals[0]
+            subcommand = positionals[0].text
             # Invalid (sub)command
-            else:
-                raise CommandValueError("\"{}\" is not a valid command".format(positionals[0]), verb=verb)
+            if subcommand not in self.verbs:
+                raise CommandValueError(
+                    "\"{}\" is not a valid command".format(subcommand), verb=verb, position=positionals[0].position)
         # Too many arguments
         else:
-            raise CommandSyntaxError("Help commands can only have one argument", verb=verb)
+            raise CommandSyntaxError(
+                "Help commands can only have one argument", verb=verb, position=positionals[1].position)
 
-        attributesDict["subcommand"] = subcommand
+        return {"subcommand": subcommand}
 
-    elif verb == "show":
-        # Determine HiDPI settings
-        hidpi = 0
-        for positional in positionals:
-            if positional == "no-hidpi":
-                # If HiDPI hasn't been set to the contrary setting
-                if hidpi != 2:
-                    hidpi = 1  # doesn't match HiDPI
-                    positionals.remove(positional)
-                else:
-                    raise CommandValueError("Cannot specify both \"no-hidpi\" and \"only-hidpi\"", verb=verb)
-            elif positional == "only-hidpi":
-                # If HiDPI hasn't been set to the contrary setting
-                if hidpi != 1:
-                    hidpi = 2  # only matches HiDPI
-                    positionals.remove(positional)
-                else:
-                    raise CommandValueError("Cannot specify both \"no-hidpi\" and \"only-hidpi\"", verb=verb)
+    def __parseShow(self, verb, positionals, scopeTags):
+        hidpi, positionals = self.__parseHidpi(verb, positionals)
 
         if len(positionals) == 0:
             # Default subcommand
             subcommand = "current"
         elif len(positionals) == 1:
-            if positionals[0] in ["current", "default", "highest", "available"]:
-                subcommand = positionals[0]
+            subcommand = positionals[0].text
             # Invalid subcommand
-            else:
-                raise CommandValueError("\"{}\" is not a valid subcommand".format(positionals[0]), verb=verb)
+            if subcommand not in ["current", "default", "highest", "available"]:
+                raise CommandValueError(
+                    "\"{}\" is not a valid subcommand".format(subcommand), verb=verb, position=positionals[0].position)
         # Too many arguments
         else:
-            raise CommandSyntaxError("Show commands can only have one subcommand", verb=verb)
-
-        # Determine scope
-        if len(scopeTags) > 0:
-            if "all" in scopeTags:
-                scope = getAllDisplays()
-            else:
-                scope = []
-                for scopeTag in scopeTags:
-                    scope.append(getDisplayFromTag(scopeTag))
-        else:
-            # Default scope
-            scope = getAllDisplays()
+            raise CommandSyntaxError(
+                "Show commands can only have one subcommand", verb=verb, position=positionals[1].position)
 
-        attributesDict["subcommand"] = subcommand
-        attributesDict["hidpi"] = hidpi
-        attributesDict["scope"] = scope
+        return {"subcommand": subcommand, "hidpi": hidpi, "scope": self.__scope(scopeTags)}
 
-    elif verb == "res":
-        # Determine HiDPI settings
-        hidpi = 0
-        for positional in positionals:
-            if positional == "no-hidpi":
-                # If HiDPI hasn't been set to the contrary setting
-                if hidpi != 2:
-                    hidpi = 1  # doesn't match HiDPI
-                    positionals.remove(positional)
-                else:
-                    raise CommandValueError("Cannot specify both \"no-hidpi\" and \'only-hidpi\"", verb=verb)
-            elif positional == "only-hidpi":
-                # If HiDPI hasn't been set to the contrary setting
-                if hidpi != 1:
-                    hidpi = 2  # only matches HiDPI
-                    positionals.remove(positional)
-                else:
-                    raise CommandValueError("Cannot specify both \"no-hidpi\" and \'only-hidpi\"", verb=verb)
+    def __parseRes(self, verb, positionals, scopeTags):
+        hidpi, positionals = self.__parseHidpi(verb, positionals)
+        attributes = {"hidpi": hidpi}
+        values = [self.__integer(token) for token in positionals]
 
         if len(positionals) == 0:
-            raise CommandSyntaxError("Res commands must specify a resolution", verb=verb)
+            raise CommandSyntaxError("Res commands must specify a resolution", verb=verb, position=self.__end)
+
+        # cases: "default"/"highest", optionally followed by refresh
+        elif positionals[0].text in ["default", "highest"] and len(positionals) <= 2:
+            attributes["subcommand"] = positionals[0].text
+            if len(positionals) == 2:
+                refresh = values[1]
+                if refresh is None:
+                    raise CommandValueError(
+                        "\"{}\" is not a valid refresh rate".format(positionals[1].text),
+                        verb=verb, position=positionals[1].position)
+                if refresh < 0:
+                    raise CommandValueError(
+                        "Refresh rate must be positive", verb=verb, position=positionals[1].position)
+                attributes["refresh"] = refresh
 
-        # case: "default"/"highest"
         elif len(positionals) == 1:
-            if positionals[0] in ["default", "highest"]:
-                subcommand = positionals[0]
-            else:
-                raise CommandValueError(
-                    "Res commands must either specify both width and height or use the \"highest\" keyword",
-                    verb=verb
-                )
-
-            attributesDict["subcommand"] = subcommand
-            attributesDict["hidpi"] = hidpi
+            raise CommandValueError(
+                "Res commands must either specify both width and height or use the \"highest\" keyword",
+                verb=verb, position=positionals[0].position)
 
-        # cases: ("default"/"highest", refresh) or (width, height)
+        # case: (width, height)
         elif len(positionals) == 2:
-            # case: ("default"/"highest", refresh)
-            if positionals[0] in ["default", "highest"]:
-                subcommand = positionals[0]
-                try:
-                    refresh = int(positionals[1])
-                except ValueError:
-                    raise CommandValueError("\"{}\" is not a valid refresh rate", verb=verb)
-                if refresh < 0:
-                    raise CommandValueError("Refresh rate must be positive", verb=verb)
-
-                attributesDict["subcommand"] = subcommand
-                attributesDict["refresh"] = refresh
-                attributesDict["hidpi"] = hidpi
-
-            # case: (width, height)
-            else:
-                # Try to parse positionals as integers
-                wh = []
-                for i in range(len(positionals)):
-                    try:
-                        wh.append(int(positionals[i]))
-                    except ValueError:
-                        wh.append(None)
-                width, height = wh
-                # Neither width nor height were integers (and thus invalid pixel counts)
-                if width is None and height is None:
-                    raise CommandValueError(
-                        "Neither \"{}\" nor \"{}\" are valid widths or heights".format(
-                            positionals[0], positionals[1]),
-                        verb=verb
-                    )
-                # width was invalid
-                elif width is None:
-                    raise CommandValueError(
-                        "\"{}\" is not a valid width".format(positionals[0]),
-                        verb=verb
-                    )
-                # height was invalid
-                elif height is None:
-                    raise CommandValueError(
-                        "\"{}\" is not a valid height".format(positionals[1]),
-                        verb=verb
-                    )
-                # no negative dimensions
-                if width < 0 or height < 0:
-                    raise CommandValueError(
-                        "Width and height must be positive",
-                        verb=verb
-                    )
+            width, height = values
+            # Neither width nor height were integers (and thus invalid pixel counts)
+            if width is None and height is None:
+                raise CommandValueError(
+                    "Neither \"{}\" nor \"{}\" are valid widths or heights".format(
+                        positionals[0].text, positionals[1].text),
+                    verb=verb, position=positionals[0].position)
+            # width was invalid
+            elif width is None:
+                raise CommandValueError(
+                    "\"{}\" is not a valid width".format(positionals[0].text),
+                    verb=verb, position=positionals[0].position)
+            # height was invalid
+            elif height is None:
+                raise CommandValueError(
+                    "\"{}\" is not a valid height".format(positionals[1].text),
+                    verb=verb, position=positionals[1].position)
+            # no negative dimensions
+            if width < 0 or height < 0:
+                raise CommandValueError(
+                    "Width and height must be positive",
+                    verb=verb, position=positionals[0 if width < 0 else 1].position)
 
-                attributesDict["width"] = width
-                attributesDict["height"] = height
-                attributesDict["hidpi"] = hidpi
+            attributes["width"] = width
+            attributes["height"] = height
 
         # case: (width, height, refresh)
         elif len(positionals) == 3:
-            # Try to parse width, height, and refresh as integers
-            whr = []
-            for i in range(len(positionals)):
-                try:
-                    whr.append(int(positionals[i]))
-                except ValueError:
-                    whr.append(None)
-            width, height, refresh = whr
+            width, height, refresh = values
             # Nothing was an integer
             if width is None and height is None and refresh is None:
                 raise CommandValueError(
                     "\"{}\"x\"{}\" is not a valid resolution, and \"{}\" is not a valid refresh rate".format(
-                        positionals[0], positionals[1], positionals[2]),
-                    verb=verb
-                )
+                        positionals[0].text, positionals[1].text, positionals[2].text),
+                    verb=verb, position=positionals[0].position)
             # Neither width nor height were integers
             elif width is None or height is None:
                 raise CommandValueError(
-                    "\"{}\"x\"{}\" is not a valid resolution".format(
-                        positionals[0], positionals[1]),
-                    verb=verb
-                )
+                    "\"{}\"x\"{}\" is not a valid resolution".format(positionals[0].text, positionals[1].text),
+                    verb=verb, position=positionals[0 if width is None else 1].position)
             # refresh was not an integer
             elif refresh is None:
                 raise CommandValueError(
-                    "\"{}\" is not a valid refresh rate".format(positionals[2]),
-                    verb=verb
-                )
+                    "\"{}\" is not a valid refresh rate".format(positionals[2].text),
+                    verb=verb, position=positionals[2].position)
             # no negative dimensions or rate
-            if width < 0 or height < 0 or refresh < 0:
-                raise CommandValueError(
-                    "Width, height, and refresh rate must be positive",
-                    verb=verb
-                )
+            for token, value in zip(positionals, values):
+                if value < 0:
+                    raise CommandValueError(
+                        "Width, height, and refresh rate must be positive", verb=verb, position=token.position)
 
-            attributesDict["width"] = width
-            attributesDict["height"] = height
-            attributesDict["refresh"] = refresh
-            attributesDict["hidpi"] = hidpi
+            attributes["width"] = width
+            attributes["height"] = height
+            attributes["refresh"] = refresh
 
         else:
             raise CommandSyntaxError(
-                "Too many arguments supplied for the res command",
-                verb=verb
-            )
+                "Too many arguments supplied for the res command", verb=verb, position=positionals[3].position)
 
-        # Determine scope
-        if len(scopeTags) > 0:
-            if "all" in scopeTags:
-                scope = getAllDisplays()
-            else:
-                scope = []
-                for scopeTag in scopeTags:
-                    scope.append(getDisplayFromTag(scopeTag))
-        else:
-            # Default scope
-            scope = getMainDisplay()
-        attributesDict["scope"] = scope
+        attributes["scope"] = self.__scope(scopeTags)
+        return attributes
 
-    elif verb == "rotate":
+    def __parseRotate(self, verb, positionals, scopeTags):
         if len(positionals) == 0:
-            raise CommandSyntaxError("Rotate commands must specify an angle", verb=verb)
-        elif len(positionals) == 1:
-            try:
-                angle = int(positionals[0])
-                # Rotation must be multiple of 90
-                if angle % 90 != 0:
-                    raise CommandValueError("\"{}\" is not a multiple of 90".format(positionals[0]), verb=verb)
-            # Couldn't convert to int
-            except ValueError:
-                raise CommandValueError("\"{}\" is not a multiple of 90".format(positionals[0]), verb=verb)
+            raise CommandSyntaxError("Rotate commands must specify an angle", verb=verb, position=self.__end)
         # Too many arguments
-        else:
-            raise CommandSyntaxError("Rotate commands can only have one argument", verb=verb)
+        elif len(positionals) > 1:
+            raise CommandSyntaxError(
+                "Rotate commands can only have one argument", verb=verb, position=positionals[1].position)
 
-        # Determine scope
-        if len(scopeTags) > 0:
-            if "all" in scopeTags:
-                scope = getAllDisplays()
-            else:
-                scope = []
-                for scopeTag in scopeTags:
-                    scope.append(getDisplayFromTag(scopeTag))
-        else:
-            # Default scope
-            scope = getMainDisplay()
+        angle = self.__integer(positionals[0])
+        # Rotation must be multiple of 90
+        if angle is None or angle % 90 != 0:
+            raise CommandValueError(
+                "\"{}\" is not a multiple of 90".format(positionals[0].text), verb=verb, position=positionals[0].position)
 
-        attributesDict["angle"] = angle
-        attributesDict["scope"] = scope
+        return {"angle": angle, "scope": self.__scope(scopeTags)}
 
-    elif verb == "brightness":
+    def __parseLevel(self, verb, positionals, scopeTags):
+        """
+        Parses brightness and underscan commands, which both take a single number between 0 and 1
+        """
         if len(positionals) == 0:
-            raise CommandSyntaxError("Brightness commands must specify a brightness value", verb=verb)
-        elif len(positionals) == 1:
-            try:
-                brightness = float(positionals[0])
-                # Brightness must be between 0 and 1
-                if brightness < 0 or brightness > 1:
-                    raise CommandValueError(
-                        "\"{}\" is not a number between 0 and 1 (inclusive)".format(positionals[0]),
-                        verb=verb
-                    )
-            # Couldn't convert to float
-            except ValueError:
-                raise CommandValueError(
-                    "\"{}\" is not a number between 0 and 1 (inclusive)".format(positionals[0]),
-                    verb=verb
-                )
+            raise CommandSyntaxError(
+                "{} commands must specify {} {} value".format(
+                    verb.capitalize(), "an" if verb == "underscan" else "a", verb),
+                verb=verb, position=self.__end)
         # Too many arguments
-        else:
-            raise CommandSyntaxError("Brightness commands can only have one argument", verb=verb)
+        elif len(positionals) > 1:
+            raise CommandSyntaxError(
+                "{} commands can only have one argument".format(verb.capitalize()),
+                verb=verb, position=positionals[1].position)
 
-        # Determine scope
-        if len(scopeTags) > 0:
-            if "all" in scopeTags:
-                scope = getAllDisplays()
-            else:
-                scope = []
-                for scopeTag in scopeTags:
-                    scope.append(getDisplayFromTag(scopeTag))
-        else:
-            # Default scope
-            scope = getMainDisplay()
+        try:
+            level = float(positionals[0].text)
+        # Couldn't convert to float
+        except ValueError:
+            level = None
+        # Must be between 0 and 1
+        if level is None or not 0 <= level <= 1:
+            raise CommandValueError(
+                "\"{}\" is not a number between 0 and 1 (inclusive)".format(positionals[0].text),
+                verb=verb, position=positionals[0].position)
+
+        return {verb: level, "scope": self.__scope(scopeTags)}
+
+    def __parseMirror(self, verb, positionals, scopeTags):
+        if len(positionals) == 0:
+            raise CommandSyntaxError("Mirror commands must specify a subcommand", verb=verb, position=self.__end)
 
-        attributesDict["brightness"] = brightness
-        attributesDict["scope"] = scope
+        subcommand = positionals[0].text
+        if subcommand == "enable":
+            if len(positionals) > 1:
+                raise CommandValueError(
+                    "\"{}\" is not a valid source or target".format(positionals[1].text),
+                    verb=verb, position=positionals[1].position)
+            if len(scopeTags) < 2:
+                raise CommandSyntaxError(
+                    "Mirror enable commands require at least one source and one target display",
+                    verb=verb, position=self.__end)
+
+            # For "enable" subcommand, first element in scope is source, and the rest are targets
+            # Cannot mirror from more than one display
+            if scopeTags[0].text == "all":
+                raise CommandValueError(
+                    "The source for mirror enable cannot be \"all\"", verb=verb, position=scopeTags[0].position)
+            return {"subcommand": subcommand, "source": scopeTags[0].text, "scope": self.__scope(scopeTags[1:])}
 
-    elif verb == "underscan":
-        if len(positionals) == 0:
-            raise CommandSyntaxError("Underscan commands must specify an underscan value", verb=verb)
-        elif len(positionals) == 1:
-            try:
-                underscan = float(positionals[0])
-                # Underscan must be between 0 and 1
-                if underscan < 0 or underscan > 1:
-                    raise CommandValueError(
-                        "\"{}\" is not a number between 0 and 1 (inclusive)".format(positionals[0]),
-                        verb=verb
-                    )
-            # Couldn't convert to float
-            except ValueError:
+        elif subcommand == "disable":
+            if len(positionals) > 1:
                 raise CommandValueError(
-                    "\"{}\" is not a number between 0 and 1 (inclusive)".format(positionals[0]),
-                    verb=verb
-                )
-        # Too many arguments
-        else:
-            raise CommandSyntaxError("underscan commands can only have one argument", verb=verb)
+                    "\"{}\" is not a valid scope".format(positionals[1].text),
+                    verb=verb, position=positionals[1].position)
+
+            return {"subcommand": subcommand, "scope": self.__scope(scopeTags)}
 
-        # Determine scope
-        if len(scopeTags) > 0:
-            if "all" in scopeTags:
-                scope = getAllDisplays()
-            else:
-                scope = []
-                for scopeTag in scopeTags:
-                    scope.append(getDisplayFromTag(scopeTag))
         else:
-            # Default scope
-            scope = getMainDisplay()
+            raise CommandValueError(
+                "\"{}\" is not a valid subcommand".format(subcommand), verb=verb, position=positionals[0].position)
 
-        attributesDict["underscan"] = underscan
-        attributesDict["scope"] = scope
+    # Values
 
-    elif verb == "mirror":
-        if len(positionals) == 0:
-            raise CommandSyntaxError("Mirror commands must specify a subcommand", verb=verb)
-        # elif len(positionals) == 1:
-        subcommand = positionals.pop(0)
-        if subcommand == "enable":
-            if len(positionals) == 0:
-                if len(scopeTags) < 2:
-                    raise CommandSyntaxError(
-                        "Mirror enable commands require at least one source and one target display",
-                        verb=verb
-                    )
-                else:
-                    # For "enable" subcommand, first element in scope is source, and the rest are targets
-                    # Since we parsed "scope" in reverse order, source will be last
-                    source = getDisplayFromTag(scopeTags.pop(-1))
-                    # Cannot mirror from more than one display
-                    if isinstance(source, list):
-                        if len(source) > 1:
-                            raise CommandValueError(
-                                "The source for mirror enable cannot be \"all\"",
-                                verb=verb
-                            )
-                    # Determine target(s)
-                    if "all" in scopeTags:
-                        targets = getAllDisplays()
-                    else:
-                        targets = []
-                        for scopeTag in scopeTags:
-                            targets.append(getDisplayFromTag(scopeTag))
-
-                attributesDict["subcommand"] = subcommand
-                attributesDict["source"] = source
-                attributesDict["scope"] = targets
-            else:
-                raise CommandValueError(
-                    "\"{}\" is not a valid source or target".format(positionals[0]),
-                    verb=verb
-                )
+    @staticmethod
+    def __integer(token):
+        """
+        :return: The integer token represents, or None if it isn't one
+        """
+        try:
+            return int(token.text)
+        except ValueError:
+            return None
 
-        elif subcommand == "disable":
-            if len(positionals) == 0:
-                # Determine scope
-                if len(scopeTags) > 0:
-                    if "all" in scopeTags:
-                        scope = getAllDisplays()
-                    else:
-                        scope = []
-                        for scopeTag in scopeTags:
-                            scope.append(getDisplayFromTag(scopeTag))
-                else:
-                    # Default scope
-                    scope = getAllDisplays()
-
-                attributesDict["subcommand"] = subcommand
-                attributesDict["scope"] = scope
-            else:
-                raise CommandValueError(
-                    "\"{}\" is not a valid scope".format(positionals[0]),
-                    verb=verb
-                )
 
+def parseOptions(args):
+    """
+    Separates Display Manager's options (e.g. "--configure session") from its commands
+    :param args: The command-line arguments
+    :return: A dictionary of the options specified (without their leading dashes), and a list of
+        the remaining arguments
+    """
+    # Option -> the values it may take (None, if it doesn't take a value; a string naming
+    # the value, if it may take any value)
+    validOptions = {
+        "--configure": sorted(configureOptions),
+        "--socket": "<path>",
+        "--profiles": "<file>",
+        "--stats": None,
+        "--trace": "<file>",
+        "--jobs": "<n>",
+        "--file": "<file>",
+        "--format": sorted(showFormats),
+    }
+    # Short option -> the option it stands for
+    shortOptions = {
+        "-f": "--file",
+    }
+
+    options = {}
+    remaining = []
+    i = 0
+    while i < len(args):
+        arg = shortOptions.get(args[i], args[i])
+        # Read commands from standard input
+        if arg == "-":
+            options["file"] = "-"
+        elif arg in validOptions:
+            values = validOptions[arg]
+            if values is None:
+                options[arg[2:]] = True
+            elif isinstance(values, str):
+                if i + 1 >= len(args) or args[i + 1].startswith("--"):
+                    raise CommandSyntaxError("\"{}\" must be followed by {}".format(arg, values))
+                i += 1
+                options[arg[2:]] = args[i]
+            elif i + 1 < len(args) and args[i + 1] in values:
+                i += 1
+                options[arg[2:]] = args[i]
+            else:
+                raise CommandSyntaxError("\"{}\" must be followed by one of: {}".format(arg, ", ".join(values)))
+        elif arg.startswith("--"):
+            raise CommandSyntaxError("\"{}\" is not a valid option".format(arg))
         else:
-            raise CommandValueError("\"{}\" is not a valid subcommand".format(subcommand), verb=verb)
+            remaining.append(arg)
+        i += 1
 
-    emptyKeys = [key for key in attributesDict if attributesDict[key] is None]
-    for emptyKey in emptyKeys:
-        attributesDict.pop(emptyKey)
+    if "jobs" in options:
+        if not options["jobs"].isdigit() or int(options["jobs"]) < 1:
+            raise CommandSyntaxError("\"--jobs\" must be followed by a positive number")
+        options["jobs"] = int(options["jobs"])
 
-    return Command(**attributesDict)
+    return options, remaining
 
 
-def parseCommands(commandStrings):
+def runArguments(args):
     """
-    :param commandStrings: The string to get Commands from
-    :return: Commands contained within the string
+    Parses and runs a single invocation's options and commands, printing their output (including any errors)
+    :param args: The arguments, as they would be given on the command line
+    :return: Whether the commands were parsed and run successfully
+    """
+    try:
+        options, args = parseOptions(args)
+    except CommandSyntaxError as e:
+        print("Error: {}".format(e.message))
+        return False
+
+    # Record calls for just this invocation, unless something else is already recording them
+    recording = "stats" in options and getStats() is None
+    if recording:
+        enableStats()
+    tracing = "trace" in options and getTrace() is None
+    if tracing and not startTrace(options["trace"]):
+        return False
+    try:
+        return runCommands(options, args)
+    finally:
+        if recording:
+            print("")
+            print(disableStats().report)
+        if tracing:
+            stopTrace()
+
+
+def startTrace(path):
+    """
+    Starts tracing what Display Manager does (see TraceLog)
+    :param path: The file to append the trace to, or "-" for standard error
+    :return: Whether the trace could be opened
     """
-    # Empty string
-    if not commandStrings:
-        raise CommandSyntaxError("An empty string is not a valid command")
-    # Make sure all of the commands are in ASCII
-    if not all(ord(c) < 128 for c in commandStrings):
-        raise CommandSyntaxError("Commands cannot include non-ASCII characters")
-
-    # The types of commands that can be issued
-    verbPattern = r"help|show|res|brightness|rotate|underscan|mirror"
-    # Pattern for finding multiple commands
-    commandPattern = r"((?:{0}).*?)(?:(?: (?={0}))|\Z)".format(verbPattern)
-
-    # Make sure the command starts with a valid verb
-    firstWord = commandStrings.split()[0]
-    firstWordMatch = re.match("^(" + verbPattern + ")$", firstWord)
-    if not firstWordMatch:
-        raise CommandSyntaxError("\"{}\" is not a valid type of command".format(firstWord), verb=firstWord)
-
-    # Get all the individual commands
-    if "help" not in commandStrings:
-        commandStrings = re.findall(commandPattern, commandStrings)
-    # Cannot run more than one command if one of them is a "help" command
+    if path == "-":
+        stream = sys.stderr
     else:
-        # The whole command will be interpreted as a single help command
-        if firstWord == "help":
-            commandStrings = [commandStrings]
-        # The help command isn't even the first command
-        else:
-            raise CommandSyntaxError("Cannot run multiple commands if one of them is \"help\"", verb="help")
+        try:
+            stream = open(path, "a")
+        except IOError as e:
+            print("Error: couldn't open trace file \"{}\" ({})".format(path, e.strerror))
+            return False
+    enableTrace(stream)
+    return True
 
-    # Make the CommandList from the given command strings
-    commands = CommandList()
-    for commandString in commandStrings:
-        command = getCommand(commandString)
-        if command:
-            commands.addCommand(command)
 
-    return commands
+def stopTrace():
+    """
+    Stops tracing, writing out (and closing) the trace
+    """
+    log = disableTrace()
+    if log is not None and log.stream is not sys.stderr:
+        log.stream.close()
 
 
-def main():
+def runCommands(options, args):
+    """
+    Parses and runs a single invocation's commands, printing their output (including any errors)
+    :param options: The invocation's options (see parseOptions)
+    :param args: The invocation's arguments, without its options
+    :return: Whether the commands were parsed and run successfully
+    """
+    # Read the commands from a file, a line at a time
+    if "file" in options:
+        if args:
+            print("Error: commands cannot be given along with a command file")
+            return False
+        return runCommandFile(options["file"], options)
+
     # Attempt to parse the commands
     try:
-        commands = parseCommands(" ".join(sys.argv[1:]))
+        # Profiles can be applied on their own
+        if "profiles" in options and not args:
+            return applyProfiles(options["profiles"], options.get("configure"))
+        commandString = " ".join(args)
+        commands = parseCommands(commandString)
     except (CommandSyntaxError, CommandValueError) as e:
+        trace("error", args=args, error=e.message, position=e.position)
         if e.verb:
             if e.verb in ["help", "show", "res", "brightness", "rotate", "underscan", "mirror"]:
                 # Show proper usage information for the attempted command
@@ -1243,13 +1553,407 @@ def main():
             print(e.message)
         else:
             print("Error: {}".format(e.message))
-        raise SystemExit()
+        if e.position is not None:
+            print(errorLocation(commandString, e.position))
+        return False
     # Command successfully parsed
     else:
         try:
-            commands.run()
+            commands.run(options.get("configure"), options.get("jobs", 1), options.get("format", "text"))
         except CommandExecutionError as e:
+            trace("error", args=args, error=e.message)
             print("Error: {}".format(e.message))
+            return False
+
+    return True
+
+
+def runCommandFile(path, options):
+    """
+    Runs the commands on each line of a file (see runCommandStream)
+    :param path: The path of the file, or "-" for standard input
+    :param options: The invocation's options (see parseOptions)
+    :return: Whether every line was parsed and run successfully
+    """
+    if path == "-":
+        return runCommandStream(sys.stdin, options)
+
+    try:
+        stream = open(path)
+    except IOError as e:
+        print("Error: couldn't open command file \"{}\" ({})".format(path, e.strerror))
+        return False
+    with stream:
+        return runCommandStream(stream, options)
+
+
+# The most command lines which are run together
+commandBatchSize = 64
+
+
+def runCommandStream(stream, options):
+    """
+    Runs the commands on each line of a stream, printing each line's status ("line <N>: ok", or the error).
+    Blank lines, and lines starting with "#", are ignored.
+
+    Lines are parsed as they are read. Consecutive lines are run together, as a single CommandList (so
+    later lines' settings replace earlier ones', and each setting is only changed once), until a line
+    shows the displays' settings, mirrors displays (which changes what later display tags refer to),
+    or asks for help, or until no more lines are waiting to be read. If a batch of lines fails, its lines
+    are run again one at a time to find out which of them failed. Everything a line prints (its status,
+    and any output) comes after everything earlier lines print, so output is in the same order as the input.
+    :param stream: The text stream to read lines from
+    :param options: The invocation's options (see parseOptions)
+    :return: Whether every line was parsed and run successfully
+    """
+    ok = True
+    # The (line number, CommandList) of each line which has been parsed but not yet run
+    batch = []
+
+    for number, line in enumerate(iter(stream.readline, ""), 1):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            try:
+                commands = parseCommands(line)
+            except (CommandSyntaxError, CommandValueError) as e:
+                # Earlier lines' statuses come first
+                ok = runCommandBatch(batch, options) and ok
+                batch = []
+                trace("error", line=number, error=e.message, position=e.position)
+                verb = " in {} command".format(e.verb) if e.verb else ""
+                print("line {}: error{}: {}".format(number, verb, e.message))
+                if e.position is not None:
+                    print(errorLocation(line, e.position))
+                ok = False
+            else:
+                verbs = set(command.verb for command in commands.commands)
+                # Help is printed before anything else is run, and shown settings before the batch's statuses,
+                # so neither can be run along with earlier lines
+                if verbs & {"help", "show"}:
+                    ok = runCommandBatch(batch, options) and ok
+                    batch = []
+                batch.append((number, commands))
+                if verbs & {"help", "show", "mirror"} or len(batch) >= commandBatchSize:
+                    ok = runCommandBatch(batch, options) and ok
+                    batch = []
+
+        # Don't hold lines back waiting for more input
+        if batch and not inputWaiting(stream):
+            ok = runCommandBatch(batch, options) and ok
+            batch = []
+
+    return runCommandBatch(batch, options) and ok
+
+
+def runCommandBatch(batch, options):
+    """
+    Runs command lines together, as a single CommandList, printing each line's status
+    :param batch: The (line number, CommandList) of each line
+    :param options: The invocation's options (see parseOptions)
+    :return: Whether every line was run successfully
+    """
+    if not batch:
+        return True
+
+    commands = CommandList()
+    for number, lineCommands in batch:
+        for command in lineCommands.commands:
+            commands.addCommand(command)
+
+    try:
+        commands.run(options.get("configure"), options.get("jobs", 1), options.get("format", "text"))
+    except CommandExecutionError as e:
+        if len(batch) > 1:
+            # Changes which were already made are skipped, so this only redoes the ones which weren't
+            return all([runCommandBatch([line], options) for line in batch])
+        trace("error", line=batch[0][0], error=e.message)
+        print("line {}: error: {}".format(batch[0][0], e.message))
+        return False
+
+    for number, lineCommands in batch:
+        print("line {}: ok".format(number))
+    return True
+
+
+def inputWaiting(stream):
+    """
+    :param stream: A stream being read
+    :return: Whether more of stream can be read without waiting (or, if that can't be told, True)
+    """
+    try:
+        return bool(select.select([stream], [], [], 0)[0])
+    except (ValueError, TypeError, io.UnsupportedOperation, select.error):
+        return True
+
+
+def errorLocation(commandString, position, width=72):
+    """
+    :param commandString: A command string which couldn't be parsed
+    :param position: Where (in characters) in commandString the error is
+    :param width: The most characters of commandString to show
+    :return: Two lines: (the part of) commandString around position, and a caret pointing to position
+    """
+    # Center long command strings on the error
+    start = max(0, min(position - width // 2, len(commandString) - width))
+    excerpt = commandString[start:start + width]
+    prefix = "..." if start > 0 else ""
+    suffix = "..." if start + width < len(commandString) else ""
+    return "    {}{}{}\n    {}^".format(prefix, excerpt, suffix, " " * (len(prefix) + position - start))
+
+
+def loadProfiles(path):
+    """
+    :param path: The path of a JSON file of display profiles (see ProfileStore.load)
+    :return: A ProfileStore, or None (after printing why) if the file couldn't be loaded
+    """
+    try:
+        return ProfileStore.load(path)
+    except (IOError, ValueError) as e:
+        print("Error: could not load profiles from \"{}\" ({})".format(path, e))
+        return None
+
+
+def applyProfiles(path, option=None):
+    """
+    Applies the display profiles in a file to every connected display they match
+    :param path: The path of a JSON file of display profiles (see ProfileStore.load)
+    :param option: The configure option to apply changes with
+    :return: Whether the profiles were loaded and applied successfully
+    """
+    store = loadProfiles(path)
+    if store is None:
+        return False
+
+    try:
+        report = store.apply(option=option)
+    except DisplayError as e:
+        print("Error: {}".format(e.message))
+        return False
+    printProfileFailures(report)
+    return not report.failed
+
+
+def printProfileFailures(report):
+    """
+    Prints an error for each display a profile couldn't be applied to
+    :param report: The ReconcileReport from applying profiles
+    """
+    for display, error in report.failed:
+        trace("error", display=display, error=error.message)
+        print("Error: {}".format(error.message))
+
+
+def getSocketPath(options):
+    """
+    :param options: The options given on the command line (see parseOptions)
+    :return: The path of the agent's Unix domain socket
+    """
+    if "socket" in options:
+        return options["socket"]
+    # One agent per user, since the displays belong to whoever is logged in
+    return os.path.join(tempfile.gettempdir(), "display_manager.{}.sock".format(os.getuid()))
+
+
+class AgentRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles a single client of the Display Manager agent.
+
+    Each request is one line containing a JSON list of command-line arguments; the response is one line
+    containing a JSON object, with "ok" (whether the commands ran successfully) and "output" (everything
+    they printed).
+    """
+
+    def handle(self):
+        request = self.rfile.readline()
+        # Connections which close without a request (e.g. checking whether an agent is running) need no response
+        if not request:
+            return
+        try:
+            args = json.loads(request.decode("utf-8"))
+            if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+                raise ValueError("expected a list of arguments")
+        except ValueError as e:
+            response = {"ok": False, "output": "Error: malformed request ({})\n".format(e)}
+        else:
+            output = io.StringIO()
+            # Clients share the displays (and Display Manager's caches), so they take turns with them
+            with self.server.lock, contextlib.redirect_stdout(output):
+                ok = runArguments(args)
+            response = {"ok": ok, "output": output.getvalue()}
+
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class Agent(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A long-running Display Manager, which accepts commands from any number of clients over a Unix domain socket.
+
+    Keeping Display Manager running means that frameworks, IOKit bindings, and display information are loaded
+    once, rather than once per command. Clients are handled concurrently, but only one at a time may use the
+    displays. Note that "app" and "transient" configure options last until the agent (not the client) exits.
+    """
+
+    daemon_threads = True
+    # How often (in seconds) the agent checks for display reconfigurations
+    pollInterval = 0.1
+
+    def __init__(self, path, profiles=None):
+        """
+        :param path: The path to listen at
+        :param profiles: A ProfileStore to apply whenever matching displays are connected, or None
+        """
+        if os.path.exists(path):
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                raise OSError("\"{}\" already exists, and is not a socket".format(path))
+            if agentIsRunning(path):
+                raise OSError("A Display Manager agent is already running at \"{}\"".format(path))
+            # Clear out the socket of an agent which didn't exit cleanly
+            os.unlink(path)
+
+        # Only the user who started the agent may send it commands. The socket is created with those
+        # permissions (rather than changed to them afterwards), so that nobody else can connect in between.
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path, AgentRequestHandler)
+        finally:
+            os.umask(umask)
+        os.chmod(path, 0o600)
+
+        self.path = path
+        self.profiles = profiles
+        # Held while a client is using the displays
+        self.lock = threading.Lock()
+
+    def serve(self):
+        """
+        Serves clients until interrupted. Meanwhile, runs the run loop on the main thread, so that
+        reconfigurations invalidate Display Manager's caches rather than leaving them stale.
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        # Agents run in the background are stopped with SIGTERM (e.g. by launchd), rather than SIGINT
+        signal.signal(signal.SIGTERM, lambda signalNumber, frame: sys.exit())
+
+        watcher = DisplayWatcher(self.__onDisplayEvent)
+        try:
+            while True:
+                with self.lock:
+                    watcher.poll(0)
+                thread.join(self.pollInterval)
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            self.shutdown()
+            self.server_close()
+            os.unlink(self.path)
+
+    def __onDisplayEvent(self, event):
+        """
+        Applies profiles to newly-connected displays (while holding the lock, as poll() is only called with it).
+        """
+        if self.profiles is not None and event.added:
+            try:
+                printProfileFailures(self.profiles.onDisplayEvent(event))
+            except DisplayError as e:
+                print("Error: {}".format(e.message))
+
+
+def agentIsRunning(path):
+    """
+    :param path: The path of an agent's socket
+    :return: Whether an agent is listening at path
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except socket.error:
+        return False
+    finally:
+        client.close()
+    return True
+
+
+def agentArguments(args):
+    """
+    :param args: Command-line arguments to send to the agent
+    :return: args, with the files they name made absolute, since the agent runs in its own working directory
+    """
+    pathOptions = ["-f", "--file", "--profiles", "--trace"]
+    forwarded = list(args)
+    for i in range(len(forwarded) - 1):
+        if forwarded[i] in pathOptions and forwarded[i + 1] != "-":
+            forwarded[i + 1] = os.path.abspath(forwarded[i + 1])
+    return forwarded
+
+
+def sendToAgent(path, args):
+    """
+    Runs commands on the agent listening at path, printing their output
+    :param path: The path of the agent's socket
+    :param args: The command-line arguments to send
+    :return: Whether the commands were run successfully
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+        client.sendall(json.dumps(args).encode("utf-8") + b"\n")
+        response = b""
+        while not response.endswith(b"\n"):
+            received = client.recv(65536)
+            if not received:
+                break
+            response += received
+    except socket.error:
+        response = b""
+    finally:
+        client.close()
+
+    if not response:
+        print("Error: no Display Manager agent is running at \"{}\"".format(path))
+        return False
+    response = json.loads(response.decode("utf-8"))
+    sys.stdout.write(response["output"])
+    return response["ok"]
+
+
+def main():
+    try:
+        options, args = parseOptions(sys.argv[1:])
+    except CommandSyntaxError as e:
+        print("Error: {}".format(e.message))
+        raise SystemExit()
+
+    # Run as an agent
+    if args == ["serve"]:
+        profiles = None
+        if "profiles" in options:
+            profiles = loadProfiles(options["profiles"])
+            if profiles is None:
+                raise SystemExit()
+        # Trace everything the agent does, for as long as it runs
+        if "trace" in options and not startTrace(options["trace"]):
+            raise SystemExit()
+        try:
+            try:
+                agent = Agent(getSocketPath(options), profiles)
+            except OSError as e:
+                print("Error: {}".format(e))
+                raise SystemExit()
+            agent.serve()
+        finally:
+            stopTrace()
+    # Let the agent run the commands
+    elif "socket" in options:
+        # The agent can read command files, but not this process's standard input
+        if options.get("file") == "-":
+            print("Error: commands cannot be read from standard input through the agent")
+            raise SystemExit()
+        if not sendToAgent(options["socket"], agentArguments(sys.argv[1:])):
+            raise SystemExit()
+    else:
+        if not runArguments(sys.argv[1:]):
             raise SystemExit()
 
 
@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+
+########################################################################
+# Copyright (c) 2018 University of Utah Student Computing Labs.        #
+# All Rights Reserved.                                                 #
+#                                                                      #
+# Permission to use, copy, modify, and distribute this software and    #
+# its documentation for any purpose and without fee is hereby granted, #
+# provided that the above copyright notice appears in all copies and   #
+# that both that copyright notice and this permission notice appear    #
+# in supporting documentation, and that the name of The University     #
+# of Utah not be used in advertising or publicity pertaining to        #
+# distribution of the software without specific, written prior         #
+# permission. This software is supplied as is without expressed or     #
+# implied warranties of any kind.                                      #
+########################################################################
+
+# Display Manager, version 1.0.2
+# Asynchronous Library
+
+# Awaitable counterparts of the Display Manager Library, for asyncio applications.
+# Calls to the displays run on worker threads, so they never block the event loop.
+
+import asyncio                          # the event loop
+import concurrent.futures               # worker threads
+import functools                        # bind calls' arguments
+import threading                        # guard the worker threads and configurations
+import display_manager_lib as dm        # the Display Manager Library
+
+
+# Worker threads. Each display has its own single thread, so calls to any one display are made one
+# at a time (and in the order they were awaited), while calls to different displays run side by side.
+# Calls which aren't about any one display (e.g. listing the displays) have a thread of their own.
+displayExecutors = {}
+executorLock = threading.Lock()
+
+# Held while a mode or mirroring change is being made, since those go through Display Manager's
+# (single) active DisplayConfiguration
+configurationLock = threading.Lock()
+
+# (event loop, displayID, call name) -> the Future of a read which is in progress, which concurrent
+# awaits of the same read share
+pendingReads = {}
+
+
+def getExecutor(displayID):
+    """
+    :param displayID: The display a call is about, or None
+    :return: The single-threaded executor which makes calls about displayID
+    """
+    executor = displayExecutors.get(displayID)
+    if executor is None:
+        with executorLock:
+            executor = displayExecutors.get(displayID)
+            if executor is None:
+                executor = concurrent.futures.ThreadPoolExecutor(
+                    1, thread_name_prefix="display-{}".format(displayID if displayID is not None else "all"))
+                displayExecutors[displayID] = executor
+    return executor
+
+
+async def call(displayID, function, *args):
+    """
+    Calls function on displayID's worker thread.
+    :param displayID: The display the call is about, or None
+    :param function: The (blocking) function to call
+    :param args: The arguments to call function with
+    :return: What function returns
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(getExecutor(displayID), functools.partial(function, *args))
+
+
+async def read(displayID, name, function, *args):
+    """
+    Like call, but coalesces concurrent reads: while a read is in progress, awaiting the same read again
+    waits for its result, rather than making another call.
+    :param displayID: The display the read is about, or None
+    :param name: What is being read (reads with the same displayID and name are the same read)
+    :param function: The (blocking) function which reads it
+    :param args: The arguments to call function with
+    :return: What function returns
+    """
+    loop = asyncio.get_running_loop()
+    key = (loop, displayID, name)
+
+    future = pendingReads.get(key)
+    if future is None:
+        future = asyncio.ensure_future(call(displayID, function, *args))
+        pendingReads[key] = future
+
+        def done(finished):
+            if pendingReads.get(key) is finished:
+                del pendingReads[key]
+
+        future.add_done_callback(done)
+
+    # One of the waiters being cancelled mustn't cancel the read for all the others
+    return await asyncio.shield(future)
+
+
+def forgetReads(displayID=None):
+    """
+    Stops coalescing with reads which are already in progress on the running event loop, since they
+    started before a change (and so may return what things were like before it). Other event loops'
+    reads are left to them, since they run on other threads.
+    :param displayID: The display which is being changed; if None, every display
+    """
+    loop = asyncio.get_running_loop()
+    for key in list(pendingReads):
+        if key[0] is loop and (displayID is None or key[1] == displayID or key[1] is None):
+            pendingReads.pop(key, None)
+
+
+def configure(function):
+    """
+    :param function: A function which changes the displays through a DisplayConfiguration
+    :return: function, made to hold configurationLock while it runs
+    """
+    @functools.wraps(function)
+    def locked(*args):
+        with configurationLock:
+            return function(*args)
+    return locked
+
+
+class AsyncDisplay(object):
+    """
+    The awaitable counterpart of a Display.
+
+    Every method makes its calls on the display's own worker thread (see displayExecutors), so calls to
+    a single display are never made at the same time, while different displays can be read and changed
+    at once. Concurrent awaits of the same read (e.g. several tasks awaiting snapshot()) share one call.
+    """
+
+    def __init__(self, display):
+        """
+        :param display: The Display (or displayID) to wrap
+        """
+        if not isinstance(display, dm.AbstractDisplay):
+            display = dm.Display(display)
+
+        self.display = display
+        self.displayID = display.displayID
+
+    # "Magic" methods
+
+    def __eq__(self, other):
+        if isinstance(other, AsyncDisplay):
+            return self.displayID == other.displayID
+        else:
+            return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, AsyncDisplay):
+            return self.displayID != other.displayID
+        else:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash(self.displayID)
+
+    def __repr__(self):
+        return "AsyncDisplay({})".format(self.displayID)
+
+    # Reading
+
+    async def snapshot(self):
+        """
+        :return: A DisplayState describing this display as it is right now (see Display.snapshot)
+        """
+        return await read(self.displayID, "snapshot", self.display.snapshot)
+
+    async def allModes(self):
+        """
+        :return: Every DisplayMode this display supports (see Display.allModes)
+        """
+        # Coalesced awaits share one list, so each gets its own copy to change
+        return list(await read(self.displayID, "allModes", lambda: self.display.allModes))
+
+    # Changing
+
+    async def setMode(self, mode, option=None):
+        """
+        :param mode: The DisplayMode to set this display to
+        :param option: The configure option to apply this change with (see configureOptions)
+        """
+        forgetReads()
+        await call(self.displayID, configure(self.display.setMode), mode, option)
+
+    async def setRotate(self, angle, option=None):
+        """
+        :param angle: The angle to rotate this display to; a multiple of 90
+        :param option: The configure option to apply this change with (see configureOptions)
+        """
+        forgetReads(self.displayID)
+        await call(self.displayID, self.display.setRotate, angle, option)
+
+    async def setBrightness(self, brightness, option=None):
+        """
+        :param brightness: The brightness to set this display to, from 0 to 1
+        :param option: The configure option to apply this change with (see configureOptions)
+        """
+        forgetReads(self.displayID)
+        await call(self.displayID, self.display.setBrightness, brightness, option)
+
+    async def setUnderscan(self, underscan, option=None):
+        """
+        :param underscan: The underscan to set this display to, from 0 to 1
+        :param option: The configure option to apply this change with (see configureOptions)
+        """
+        forgetReads(self.displayID)
+        await call(self.displayID, self.display.setUnderscan, underscan, option)
+
+    async def setMirrorSource(self, mirrorDisplay, option=None):
+        """
+        :param mirrorDisplay: The AsyncDisplay (or Display) this display should mirror, or None to stop mirroring
+        :param option: The configure option to apply this change with (see configureOptions)
+        """
+        if isinstance(mirrorDisplay, AsyncDisplay):
+            mirrorDisplay = mirrorDisplay.display
+
+        # Mirroring changes which displays are online, so nothing read before it is still current
+        forgetReads()
+        await call(self.displayID, configure(self.display.setMirrorSource), mirrorDisplay, option)
+
+
+async def getAllDisplays():
+    """
+    :return: An AsyncDisplay for every online display
+    """
+    displays = await read(None, "getAllDisplays", dm.getAllDisplays)
+    return [AsyncDisplay(display) for display in displays]
+
+
+async def getMainDisplay():
+    """
+    :return: An AsyncDisplay for the main display
+    """
+    return AsyncDisplay(await read(None, "getMainDisplay", dm.getMainDisplay))
+
+
+class AsyncDisplayWatcher(object):
+    """
+    An asynchronous iterator of DisplayEvents ("async for event in watcher"; see DisplayWatcher).
+
+    Quartz only delivers reconfiguration callbacks while the main thread's run loop is running, so the
+    event loop (which should be running on the main thread) runs it briefly, without waiting, every
+    asyncInterval seconds. Only once a burst of callbacks has settled are the online displays read, on the
+    same worker thread which getAllDisplays uses, so the event loop is never blocked by reading them.
+    """
+
+    def __init__(self, delay=0.5):
+        """
+        :param delay: How long (in seconds) a burst of reconfigurations must be quiet before it is published
+        """
+        self.watcher = dm.DisplayWatcher(delay=delay)
+
+    def __aiter__(self):
+        return self
+
+    async def start(self):
+        """
+        Starts watching, so that changes made from now on are published. Called automatically by iteration.
+        """
+        if not self.watcher.watching:
+            await call(None, self.watcher.start)
+
+    async def __anext__(self):
+        await self.start()
+        while True:
+            # Deliver any reconfiguration callbacks, without waiting for more
+            dm.getBackend().runLoop(0)
+            if self.watcher.settled:
+                event = await call(None, self.watcher.publish)
+                if event is not None:
+                    return event
+            await asyncio.sleep(self.watcher.asyncInterval)
+
+    def stop(self):
+        """
+        Stops watching.
+        """
+        self.watcher.stop()
+
+
+def watchDisplays(delay=0.5):
+    """
+    :param delay: How long (in seconds) a burst of reconfigurations must be quiet before it is published
+    :return: An AsyncDisplayWatcher ("async for event in watchDisplays()")
+    """
+    return AsyncDisplayWatcher(delay=delay)
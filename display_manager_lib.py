@@ -24,13 +24,87 @@
 import sys		        # make decisions based on system configuration
 import warnings		    # control warning settings for
 import abc              # allows use of abstract classes
-import objc             # access Objective-C functions and variables
-import CoreFoundation   # work with Objective-C data types
-import Quartz           # work with system graphics
+import atexit           # restore transient settings when the process exits
+import bisect           # search sorted mode lists
+import os               # choose a display backend
+import collections      # immutable records of display state
+import importlib        # import PyObjC frameworks on demand
+import time             # debounce display reconfiguration callbacks
+import threading        # configure several displays at once
 
 
-# Configured for global usage; otherwise, must be re-instantiated each time it is called
-iokit = None
+class LazyFramework(object):
+    """
+    Stands in for a PyObjC framework module, which is only imported once one of its attributes is used.
+
+    Importing PyObjC frameworks takes a significant share of Display Manager's running time, and isn't
+    needed at all to (e.g.) show help or report a syntax error. Each attribute is cached on the
+    LazyFramework the first time it is looked up, so later lookups cost the same as a module's.
+    """
+
+    def __init__(self, name):
+        """
+        :param name: The name of the module to import
+        """
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attr):
+        # Only called for attributes which haven't been cached yet
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        value = getattr(self.__module, attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return "<LazyFramework {}>".format(self.__name)
+
+
+objc = LazyFramework("objc")                        # access Objective-C functions and variables
+CoreFoundation = LazyFramework("CoreFoundation")    # work with Objective-C data types
+Quartz = LazyFramework("Quartz")                    # work with system graphics
+
+# IOKit display mode flag marking a display's default mode
+# (see kDisplayModeDefaultFlag in IOKit/graphics/IOGraphicsTypes.h)
+kDisplayModeDefaultFlag = 0x00000004
+
+# Incremented every time the display topology changes; anything cached about the online displays
+# (e.g. the current DisplaySnapshot) is only valid for the generation it was built in
+topologyGeneration = 0
+# The DisplaySnapshot for the current topologyGeneration, built on demand by getDisplaySnapshot
+displaySnapshot = None
+# Held while displaySnapshot or topologyGeneration change, since displays may be read from several threads
+# (e.g. by a DisplayReconciler's workers, or display_manager_aio), and reconfiguration callbacks arrive on another
+snapshotLock = threading.RLock()
+# The DisplayConfiguration currently collecting changes, if any (see DisplayConfiguration)
+activeConfiguration = None
+
+# Quartz's configure options (CGConfigureOption), by Display Manager's names for them:
+#   "permanent": changes persist across logins (written to the WindowServer preferences)
+#   "session": changes last until the user logs out
+#   "app": changes last until this process exits
+#   "transient": like "app", but brightness, underscan, and rotation are also restored when this process exits
+configureOptions = {
+    "permanent": "kCGConfigurePermanently",
+    "session": "kCGConfigureForSession",
+    "app": "kCGConfigureForAppOnly",
+    "transient": "kCGConfigureForAppOnly",
+}
+# The configure option used by setters which aren't given one (see setConfigureOption)
+configureOption = "permanent"
+# In transient mode, the original value of each setting changed, by (displayID, setting); restored at exit
+transientOriginals = {}
+# The reconfiguration callback registered with the backend (see registerReconfigurationCallback)
+reconfigurationCallback = None
+# The DisplayBackend every Display is read and configured through (see getBackend)
+displayBackend = None
+# The DisplayStats backend calls are being recorded in, if any (see enableStats)
+displayStats = None
+# The TraceLog Display Manager's actions are being written to, if any (see enableTrace)
+traceLog = None
+# The DisplayWatchers currently being notified of reconfigurations (see DisplayWatcher)
+reconfigurationWatchers = []
 
 
 class DisplayError(Exception):
@@ -38,7 +112,14 @@ class DisplayError(Exception):
     Raised if a display cannot perform the requested operation (or access the requested property)
         (e.g. does not have a matching display mode, display cannot modify this setting, etc.)
     """
-    pass
+
+    def __init__(self, message):
+        """
+        :param message: Description of what went wrong
+        """
+        self.message = message
+
+        Exception.__init__(self, self.message)
 
 
 class AbstractDisplay(object):
@@ -89,6 +170,10 @@ class AbstractDisplay(object):
     def tag(self):
         pass
 
+    @abc.abstractproperty
+    def identity(self):
+        pass
+
     # Mode properties and methods
 
     @abc.abstractproperty
@@ -160,21 +245,20 @@ class Display(AbstractDisplay):
     useful helper functions to configure the display.
     """
 
-    def __init__(self, displayID):
+    def __init__(self, displayID, validate=True):
         """
         :param displayID: The DisplayID of the display to manipulate
+        :param validate: Whether to check that displayID is online. DisplaySnapshot passes False,
+            since it builds its Displays from the online display list itself.
         """
-        # Make sure displayID is actually a display
-        (error, allDisplayIDs, count) = Quartz.CGGetOnlineDisplayList(32, None, None)  # max 32 displays
-        if displayID not in allDisplayIDs or error:
-            raise DisplayError("Display with ID \"{}\" not found".format(displayID))
+        if validate:
+            # Make sure displayID is actually a display
+            if displayID not in getBackend().onlineDisplayIDs():
+                raise DisplayError("Display with ID \"{}\" not found".format(displayID))
 
         # Sets self.displayID to displayID
         super(Display, self).__init__(displayID)
 
-        # iokit is required for several Display methods
-        getIOKit()
-
     # General properties
 
     @property
@@ -182,66 +266,28 @@ class Display(AbstractDisplay):
         """
         :return: The display tag for this Display
         """
-        if self.isMain:
-            return "main"
-        # is external display
-        else:
-            # Get all the external displays (in order)
-            externals = sorted(getAllDisplays())
-            for display in externals:
-                if display.isMain:
-                    externals.remove(display)
-                    break
-
-            for i in range(len(externals)):
-                if self == externals[i]:
-                    return "ext" + str(i)
+        return getDisplaySnapshot().tagOf(self)
 
     @property
     def isMain(self):
         """
         :return: Boolean for whether this Display is the main display
         """
-        return Quartz.CGDisplayIsMain(self.displayID)
+        return getBackend().mainDisplayID() == self.displayID
 
     @property
-    def isHidpi(self):
+    def identity(self):
         """
-        :return: Whether this display can be set to HiDPI resolutions
+        :return: The DisplayIdentity (vendor, product, and serial number) of this display's hardware
         """
-        # Check if self.allModes has any HiDPI modes
-        for mode in self.allModes:
-            if mode.hidpi:
-                return True
-        # None of self.allModes were HiDPI
-        return False
-
-    # Helper methods, properties
+        return getBackend().identity(self.displayID)
 
     @property
-    def __servicePort(self):
-        """
-        :return: The integer representing this display's service port.
-        """
-        return Quartz.CGDisplayIOServicePort(self.displayID)
-
-    @staticmethod
-    def __rightHidpi(mode, hidpi):
+    def isHidpi(self):
         """
-        Evaluates whether the mode fits the user's HiDPI specification.
-
-        :param mode: The mode to be evaluated.
-        :param hidpi: HiDPI code. 0 returns everything, 1 returns only non-HiDPI, and 2 returns only HiDPI.
-        :return: Whether the mode fits the HiDPI description specified by the user.
+        :return: Whether this display can be set to HiDPI resolutions
         """
-        if (
-                (hidpi == 0)  # fits HiDPI or non-HiDPI (default)
-                or (hidpi == 1 and not mode.hidpi)  # fits only non-HiDPI
-                or (hidpi == 2 and mode.hidpi)  # fits only HiDPI
-        ):
-            return True
-        else:
-            return False
+        return len(self.modeCatalog.hidpiModes) > 0
 
     # Mode properties and methods
 
@@ -250,30 +296,37 @@ class Display(AbstractDisplay):
         """
         :return: The current Quartz "DisplayMode" interface for this display.
         """
-        return DisplayMode(Quartz.CGDisplayCopyDisplayMode(self.displayID))
+        return getBackend().currentMode(self.displayID)
 
     @property
     def defaultMode(self):
-        for mode in self.allModes:
-            if mode.isDefault:
-                return mode
-        # No default mode was found
-        return None
+        """
+        :return: The display's default DisplayMode, or None if it has no default.
+        """
+        return self.modeCatalog.default
 
     @property
     def allModes(self):
         """
         :return: All possible Quartz "DisplayMode" interfaces for this display.
         """
-        # TO-DO: This needs to be revisited
-        modes = []
-        # options forces Quartz to show HiDPI modes
-        options = {Quartz.kCGDisplayShowDuplicateLowResolutionModes: True}
-        for modeRef in Quartz.CGDisplayCopyAllDisplayModes(self.displayID, options):
-            modes.append(DisplayMode(modeRef))
+        return list(self.modeCatalog.modes)
 
-        # Eliminate all duplicate modes, including any modes that duplicate "default"
-        uniqueModes = set(modes)
+    @property
+    def modeCatalog(self):
+        """
+        :return: The ModeCatalog indexing all of this display's modes.
+            Built once per display and cached in modeCache until the display is reconfigured.
+        """
+        registerReconfigurationCallback()
+        return modeCache.get(self.displayID, lambda: ModeCatalog(self.__copyAllModes()))
+
+    def __copyAllModes(self):
+        """
+        :return: All possible Quartz "DisplayMode" interfaces for this display, freshly copied from the backend.
+        """
+        # Eliminate all duplicate modes
+        uniqueModes = set(getBackend().allModes(self.displayID))
         defaultMode = None
         # Find default mode
         for mode in uniqueModes:
@@ -281,33 +334,26 @@ class Display(AbstractDisplay):
                 defaultMode = mode
         if defaultMode:
             # If there are any duplicates of defaultMode, remove them (and not defaultMode)
-            for mode in modes:
-                if all([
-                    defaultMode.width == mode.width,
-                    defaultMode.height == mode.height,
-                    defaultMode.refresh == mode.refresh,
-                    defaultMode.hidpi == mode.hidpi,
-                    not mode.isDefault,
-                ]):
-                    try:
-                        uniqueModes.remove(mode)
-                    except KeyError:
-                        pass
+            defaultKey = (defaultMode.width, defaultMode.height, defaultMode.refresh, defaultMode.hidpi)
+            uniqueModes = [
+                mode for mode in uniqueModes
+                if mode.isDefault or (mode.width, mode.height, mode.refresh, mode.hidpi) != defaultKey
+            ]
 
         return list(uniqueModes)
 
+    def invalidate(self):
+        """
+        Discards everything cached about this display (e.g. its modes), so it will be re-read from Quartz.
+        """
+        invalidateDisplayCaches(self.displayID)
+
     def highestMode(self, hidpi=0):
         """
         :param hidpi: HiDPI code. 0 returns everything, 1 returns only non-HiDPI, and 2 returns only HiDPI.
         :return: The Quartz "DisplayMode" interface with the highest display resolution for this display.
         """
-        highest = None
-        for mode in self.allModes:
-            if highest:
-                if mode > highest and self.__rightHidpi(mode, hidpi):
-                    highest = mode
-            else:  # highest hasn't been set yet, so anything is the highest
-                highest = mode
+        highest = self.modeCatalog.highest(hidpi)
 
         if highest:
             return highest
@@ -330,47 +376,23 @@ class Display(AbstractDisplay):
         :param hidpi: HiDPI code. 0 returns everything, 1 returns only non-HiDPI, and 2 returns only HiDPI
         :return: The closest Quartz "DisplayMode" interface possible for this display.
         """
-        # Which criteria does it match (in addition to width and height)?
-        both = []           # matches HiDPI and refresh
-        onlyHidpi = []      # matches HiDPI
-        onlyRefresh = []    # matches refresh
-
-        for mode in self.allModes:
-            if mode.width == width and mode.height == height:
-                if self.__rightHidpi(mode, hidpi) and mode.refresh == refresh:
-                    both.append(mode)
-                elif self.__rightHidpi(mode, hidpi):
-                    onlyHidpi.append(mode)
-                elif mode.refresh == refresh:
-                    onlyRefresh.append(mode)
-
-        # Return the nearest match, with HiDPI matches preferred over refresh matches
-        for modes in [both, onlyHidpi, onlyRefresh]:
-            if modes:
-                return modes[0]
-
-        raise DisplayError(
-            "Display \"{}\" cannot be set to {}x{}".format(self.tag, width, height)
-        )
+        closest = self.modeCatalog.closest(width, height, refresh, hidpi)
 
-    def setMode(self, mode):
+        if closest:
+            return closest
+        else:
+            raise DisplayError(
+                "Display \"{}\" cannot be set to {}x{}".format(self.tag, width, height)
+            )
+
+    def setMode(self, mode, option=None):
         """
         :param mode: The Quartz "DisplayMode" interface to set this display to.
+        :param option: The configure option to apply this change with (see configureOptions); if None,
+            the current default is used. Ignored if there is already an active DisplayConfiguration.
         """
-        (error, configRef) = Quartz.CGBeginDisplayConfiguration(None)
-        if error:
-            raise DisplayError(
-                "Display \"{}\"\'s resolution cannot be set to {}x{} at {} Hz".format(
-                    self.tag, mode.width, mode.height, mode.refresh))
-
-        error = Quartz.CGConfigureDisplayWithDisplayMode(configRef, self.displayID, mode.raw, None)
-        if error:
-            Quartz.CGCancelDisplayConfiguration(configRef)
-            raise DisplayError(
-                "Display \"{}\"\'s resolution cannot be set to {}x{} at {} Hz".format(
-                    self.tag, mode.width, mode.height, mode.refresh))
-
-        Quartz.CGCompleteDisplayConfiguration(configRef, Quartz.kCGConfigurePermanently)
+        with getDisplayConfiguration(option) as configuration:
+            configuration.setMode(self, mode)
 
     # Rotation properties and methods
 
@@ -379,33 +401,21 @@ class Display(AbstractDisplay):
         """
         :return: Rotation of this display, in degrees.
         """
-        return int(Quartz.CGDisplayRotation(self.displayID))
+        return getBackend().rotation(self.displayID)
 
-    def setRotate(self, angle):
+    def setRotate(self, angle, option=None):
         """
         :param angle: The angle of rotation.
+        :param option: The configure option to apply this change with (see configureOptions); if None,
+            the current default is used.
         """
-        # see: https://opensource.apple.com/source/IOGraphics/IOGraphics-406/IOGraphicsFamily/IOKit/graphics/
-        # IOGraphicsTypes.h for angle codes (kIOScaleRotate{0, 90, 180, 270}).
-        # Likewise, see .../IOKit/graphics/IOGraphicsTypesPrivate.h for rotateCode (kIOFBSetTransform)
-        swapAxes = 0x10
-        invertX = 0x20
-        invertY = 0x40
-        angleCodes = {
-            0: 0,
-            90: (swapAxes | invertX) << 16,
-            180: (invertX | invertY) << 16,
-            270: (swapAxes | invertY) << 16,
-        }
-        rotateCode = 0x400
-
         # If user enters inappropriate angle, we should quit
         if angle % 90 != 0:
             raise ValueError("Can only rotate by multiples of 90 degrees.")
-        options = rotateCode | angleCodes[angle % 360]
 
+        self.__rememberOriginal("rotation", option)
         # Actually rotate the screen
-        error = iokit["IOServiceRequestProbe"](self.__servicePort, options)
+        error = getBackend().setRotation(self.displayID, angle % 360)
         if error:
             raise DisplayError("Cannot manage rotation on display \"{}\"".format(self.tag))
 
@@ -416,18 +426,16 @@ class Display(AbstractDisplay):
         """
         :return: Brightness of this display, from 0 to 1.
         """
-        service = self.__servicePort
-        (error, brightness) = iokit["IODisplayGetFloatParameter"](service, 0, iokit["kDisplayBrightness"], None)
-        if error:
-            return None
-        else:
-            return brightness
+        return getBackend().brightness(self.displayID)
 
-    def setBrightness(self, brightness):
+    def setBrightness(self, brightness, option=None):
         """
         :param brightness: The desired brightness, from 0 to 1.
+        :param option: The configure option to apply this change with (see configureOptions); if None,
+            the current default is used.
         """
-        error = iokit["IODisplaySetFloatParameter"](self.__servicePort, 0, iokit["kDisplayBrightness"], brightness)
+        self.__rememberOriginal("brightness", option)
+        error = getBackend().setBrightness(self.displayID, brightness)
         if error:
             if self.isMain:
                 raise DisplayError("Cannot manage brightness on display \"{}\"".format(self.tag))
@@ -445,24 +453,16 @@ class Display(AbstractDisplay):
         :return: Display's active underscan setting, from 1 (0%) to 0 (100%).
             (Yes, it doesn't really make sense to have 1 -> 0 and 0 -> 100, but it's how IOKit reports it.)
         """
-        (error, underscan) = iokit["IODisplayGetFloatParameter"](
-            self.__servicePort, 0, iokit["kDisplayUnderscan"], None)
-        if error:
-            return None
-        else:
-            # IOKit handles underscan values as the opposite of what makes sense, so I switch it here.
-            # e.g. 0 -> maximum (100%), 1 -> 0% (default)
-            return float(abs(underscan - 1))
+        return getBackend().underscan(self.displayID)
 
-    def setUnderscan(self, underscan):
+    def setUnderscan(self, underscan, option=None):
         """
         :param underscan: Underscan value, from 0 (no underscan) to 1 (maximum underscan).
+        :param option: The configure option to apply this change with (see configureOptions); if None,
+            the current default is used.
         """
-        # IOKit handles underscan values as the opposite of what makes sense, so I switch it here.
-        # e.g. 0 -> maximum (100%), 1 -> 0% (default)
-        underscan = float(abs(underscan - 1))
-
-        error = iokit["IODisplaySetFloatParameter"](self.__servicePort, 0, iokit["kDisplayUnderscan"], underscan)
+        self.__rememberOriginal("underscan", option)
+        error = getBackend().setUnderscan(self.displayID, underscan)
         if error:
             raise DisplayError("Cannot manage underscan on display \"{}\"".format(self.tag))
 
@@ -476,246 +476,2757 @@ class Display(AbstractDisplay):
             any display, returns None
         """
         # The display which self is mirroring
-        masterDisplayID = Quartz.CGDisplayMirrorsDisplay(self.displayID)
-        if masterDisplayID == Quartz.kCGNullDirectDisplay:
+        masterDisplayID = getBackend().mirrorSource(self.displayID)
+        if masterDisplayID is None:
             # self is not mirroring any display
             return None
         else:
-            return Display(masterDisplayID)
+            # The backend just reported this display, so it doesn't need to be validated
+            return Display(masterDisplayID, validate=False)
 
-    def setMirrorSource(self, mirrorDisplay):
+    def setMirrorSource(self, mirrorDisplay, option=None):
         """
         :param mirrorDisplay: The Display which this Display will mirror.
             Input a NoneType to stop mirroring.
+        :param option: The configure option to apply this change with (see configureOptions); if None,
+            the current default is used. Ignored if there is already an active DisplayConfiguration.
         """
-        (error, configRef) = Quartz.CGBeginDisplayConfiguration(None)
-        if error:
-            raise DisplayError(
-                "Display \"{}\" cannot be set to mirror display \"{}\"".format(self.tag, mirrorDisplay.tag))
+        with getDisplayConfiguration(option) as configuration:
+            configuration.setMirrorSource(self, mirrorDisplay)
 
-        # Will be passed a None mirrorDisplay to disable mirroring. Cannot mirror self.
-        if mirrorDisplay is None or mirrorDisplay.displayID == self.displayID:
-            Quartz.CGConfigureDisplayMirrorOfDisplay(configRef, self.displayID, Quartz.kCGNullDirectDisplay)
-        else:
-            Quartz.CGConfigureDisplayMirrorOfDisplay(configRef, self.displayID, mirrorDisplay.displayID)
+    # Origin properties and methods
 
-        Quartz.CGCompleteDisplayConfiguration(configRef, Quartz.kCGConfigurePermanently)
+    @property
+    def origin(self):
+        """
+        :return: The (x, y) coordinates of this display's upper-left corner, in the global display coordinate space
+        """
+        return getBackend().origin(self.displayID)
 
+    def setOrigin(self, x, y, option=None):
+        """
+        :param x: The x-coordinate of this display's upper-left corner, in the global display coordinate space
+        :param y: The y-coordinate of this display's upper-left corner, in the global display coordinate space
+        :param option: The configure option to apply this change with (see configureOptions); if None,
+            the current default is used. Ignored if there is already an active DisplayConfiguration.
+        """
+        with getDisplayConfiguration(option) as configuration:
+            configuration.setOrigin(self, x, y)
 
-class AbstractDisplayMode(object):
-    """
-    Abstract representation which display_manager_lib.DisplayMode will inherit from.
+    def __rememberOriginal(self, setting, option):
+        """
+        In transient mode, records the current value of one of this display's IOKit settings (the first
+        time it is changed), so that it can be restored when the process exits.
+        Quartz restores modes and mirroring by itself.
 
-    Included for unit testing purposes
-    """
+        :param setting: "rotation", "brightness", or "underscan"
+        :param option: The configure option the setting is being changed with
+        """
+        if (option or configureOption) == "transient" and (self.displayID, setting) not in transientOriginals:
+            if not transientOriginals:
+                atexit.register(restoreTransientSettings)
+            transientOriginals[(self.displayID, setting)] = getattr(self, setting)
 
-    __metaclass__ = abc.ABCMeta
+    # State
 
-    @abc.abstractmethod
-    def __init__(self, mode):
-        self.raw = mode
+    def snapshot(self):
+        """
+        Reads every one of this display's settings exactly once.
+        :return: A DisplayState describing this display as it is right now
+        """
+        return DisplayState(
+            displayID=self.displayID,
+            isMain=bool(self.isMain),
+            mode=self.currentMode,
+            rotation=self.rotation,
+            brightness=self.brightness,
+            underscan=self.underscan,
+            mirrorSource=self.mirrorSource,
+        )
 
-    # "Magic" methods
 
-    def __eq__(self, other):
-        if isinstance(other, self.__class__):
-            return all([
-                self.width == other.width,
-                self.height == other.height,
-                self.refresh == other.refresh,
-                self.hidpi == other.hidpi,
-                self.isDefault == other.isDefault,
-            ])
-        else:
-            return NotImplemented
+class DisplayState(collections.namedtuple("DisplayState", [
+    "displayID", "isMain", "mode", "rotation", "brightness", "underscan", "mirrorSource",
+])):
+    """
+    An immutable record of a display's settings at a single point in time, as returned by Display.snapshot.
+
+    Fields:
+        displayID: int
+        isMain: bool
+        mode: DisplayMode (the current mode)
+        rotation: int (degrees)
+        brightness: float (0 to 1), or None if the display's brightness can't be read
+        underscan: float (0 to 1), or None if the display's underscan can't be read
+        mirrorSource: the Display being mirrored, or None if the display isn't mirroring one
+    """
 
-    def __ne__(self, other):
-        if isinstance(other, self.__class__):
-            return not self.__eq__(other)
-        else:
-            return NotImplemented
+    __slots__ = ()
 
-    def __lt__(self, other):
-        return self.width * self.height < other.width * other.height
 
-    def __gt__(self, other):
-        return self.width * self.height > other.width * other.height
+class DisplayConfiguration(object):
+    """
+    A single Quartz display configuration transaction.
 
-    def __hash__(self):
-        return hash((self.width, self.height, self.refresh, self.hidpi, self.isDefault))
+    Collects mode, mirroring, and origin changes for any number of displays, and applies all of them
+    at once when committed, so that several changes only reconfigure the displays once. Used as a
+    context manager, the transaction is committed when the block finishes, or cancelled (leaving
+    every display untouched) if the block raises an exception:
 
-    # General properties
+        with DisplayConfiguration() as configuration:
+            configuration.setMode(display, mode)
+            configuration.setMirrorSource(otherDisplay, display)
 
-    @abc.abstractproperty
-    def width(self):
-        pass
+    While a DisplayConfiguration is open, it is the active configuration, and
+    Display.setMode/setMirrorSource/setOrigin add their changes to it rather than applying them separately.
+    """
 
-    @abc.abstractproperty
-    def height(self):
-        pass
+    def __init__(self, option=None):
+        """
+        :param option: The configure option to commit with (see configureOptions); if None,
+            the default at the time of committing is used
+        """
+        if option is not None and option not in configureOptions:
+            raise ValueError("\"{}\" is not a valid configure option".format(option))
+        self.option = option
+        self.__configRef = None
+        # For each (nested) "with" block this configuration is in, whether that block began it
+        self.__blocks = []
+        # The displayIDs which this configuration changes
+        self.changedDisplayIDs = set()
 
-    @abc.abstractproperty
-    def refresh(self):
-        pass
+    # "Magic" methods
 
-    @abc.abstractproperty
-    def hidpi(self):
-        pass
+    def __enter__(self):
+        # Only the block which began the transaction commits it
+        self.__blocks.append(not self.isOpen)
+        self.begin()
+        return self
+
+    def __exit__(self, exceptionType, exceptionValue, traceback):
+        began = self.__blocks.pop()
+        if exceptionType is not None:
+            # Roll back every change, not just those made in this block
+            self.cancel()
+        elif began:
+            self.commit()
+        # Don't suppress exceptions
+        return False
 
-    @abc.abstractproperty
-    def isDefault(self):
-        pass
+    # Transaction management
 
+    @property
+    def isOpen(self):
+        """
+        :return: Whether this configuration has begun, and has not yet been committed or cancelled
+        """
+        return self.__configRef is not None
 
-class DisplayMode(AbstractDisplayMode):
-    """
-    Represents a DisplayMode as implemented in Quartz.CoreGraphics
-    """
+    def begin(self):
+        """
+        Begins the Quartz configuration transaction, and makes this the active configuration.
+        Does nothing if the transaction has already begun.
+        """
+        global activeConfiguration
 
-    def __init__(self, mode):
-        if not isinstance(mode, Quartz.CGDisplayModeRef):
-            raise DisplayError("\"{}\" is not a valid Quartz.CGDisplayModeRef".format(mode))
-        # sets self.raw to mode
-        super(DisplayMode, self).__init__(mode)
+        if self.isOpen:
+            return
 
-        self.__width = int(Quartz.CGDisplayModeGetWidth(mode))
-        self.__height = int(Quartz.CGDisplayModeGetHeight(mode))
-        self.__refresh = int(Quartz.CGDisplayModeGetRefreshRate(mode))
+        configRef = getBackend().beginConfiguration()
+        if configRef is None:
+            raise DisplayError("Could not begin display configuration")
+        self.__configRef = configRef
+        self.changedDisplayIDs = set()
+        if activeConfiguration is None:
+            activeConfiguration = self
 
-        maxWidth = Quartz.CGDisplayModeGetPixelWidth(mode)  # the maximum display width for this display
-        maxHeight = Quartz.CGDisplayModeGetPixelHeight(mode)  # the maximum display width for this display
-        self.__hidpi = (maxWidth != self.width and maxHeight != self.height)  # if they're the same, mode is not HiDPI
+    def commit(self):
+        """
+        Applies every change in this configuration. Does nothing if the transaction isn't open.
+        """
+        if not self.isOpen:
+            return
+
+        configRef = self.__end()
+        if not self.changedDisplayIDs:
+            # Nothing to apply; don't make Quartz reconfigure the displays for nothing
+            getBackend().cancelConfiguration(configRef)
+            return
+
+        error = getBackend().completeConfiguration(configRef, self.option or configureOption)
+        for displayID in self.changedDisplayIDs:
+            invalidateDisplayCaches(displayID)
+        if error:
+            raise DisplayError("Could not apply display configuration")
 
-    # General properties
+    def cancel(self):
+        """
+        Discards every change in this configuration. Does nothing if the transaction isn't open.
+        """
+        if not self.isOpen:
+            return
 
-    @property
-    def littleString(self):
-        return "resolution: {width}x{height}, refresh rate: {refresh}, HiDPI: {hidpi}".format(**{
-            "width": self.width,
-            "height": self.height,
-            "refresh": self.refresh,
-            "hidpi": self.hidpi,
-        })
+        getBackend().cancelConfiguration(self.__end())
 
-    @property
-    def bigString(self):
-        return "\n".join([
-            "resolution:     {}x{}".format(self.width, self.height),
-            "refresh rate:   {}".format(self.refresh),
-            "HiDPI:          {}".format(self.hidpi),
-        ])
+    def __end(self):
+        """
+        Closes the transaction (and stops it from being the active configuration).
+        :return: The closed transaction's configRef
+        """
+        global activeConfiguration
 
-    @property
-    def width(self):
-        return self.__width
+        configRef = self.__configRef
+        self.__configRef = None
+        if activeConfiguration is self:
+            activeConfiguration = None
+        return configRef
 
-    @property
-    def height(self):
-        return self.__height
+    # Changes
 
-    @property
-    def refresh(self):
-        return self.__refresh
+    def setMode(self, display, mode):
+        """
+        :param display: The Display to change
+        :param mode: The DisplayMode to set display to
+        """
+        self.begin()
+        error = getBackend().configureMode(self.__configRef, display.displayID, mode)
+        if error:
+            raise DisplayError(
+                "Display \"{}\"\'s resolution cannot be set to {}x{} at {} Hz".format(
+                    display.tag, mode.width, mode.height, mode.refresh))
+        self.changedDisplayIDs.add(display.displayID)
 
-    @property
-    def hidpi(self):
-        return self.__hidpi
+    def setMirrorSource(self, display, mirrorDisplay):
+        """
+        :param display: The Display to change
+        :param mirrorDisplay: The Display which display will mirror. Input a NoneType to stop mirroring.
+        """
+        self.begin()
+        # Will be passed a None mirrorDisplay to disable mirroring. Cannot mirror self.
+        if mirrorDisplay is None or mirrorDisplay.displayID == display.displayID:
+            error = getBackend().configureMirror(self.__configRef, display.displayID, None)
+            if error:
+                raise DisplayError("Display \"{}\" cannot stop mirroring".format(display.tag))
+        else:
+            error = getBackend().configureMirror(self.__configRef, display.displayID, mirrorDisplay.displayID)
+            if error:
+                raise DisplayError(
+                    "Display \"{}\" cannot be set to mirror display \"{}\"".format(display.tag, mirrorDisplay.tag))
+        self.changedDisplayIDs.add(display.displayID)
 
-    @property
-    def isDefault(self):
+    def setOrigin(self, display, x, y):
         """
-        :return: Whether this DisplayMode is the display's default mode
+        :param display: The Display to change
+        :param x: The x-coordinate of display's upper-left corner, in the global display coordinate space
+        :param y: The y-coordinate of display's upper-left corner, in the global display coordinate space
         """
-        # CGDisplayModeGetIOFlags returns a hexadecimal number representing the DisplayMode's flags
-        # the "default" flag is 0x4, which means that said number's binary representation must have
-        # a '1' in the third-to-last position for it to be the default
-        return bin(Quartz.CGDisplayModeGetIOFlags(self.raw))[-3] == '1'
+        self.begin()
+        error = getBackend().configureOrigin(self.__configRef, display.displayID, int(x), int(y))
+        if error:
+            raise DisplayError("Display \"{}\" cannot be moved to ({}, {})".format(display.tag, x, y))
+        self.changedDisplayIDs.add(display.displayID)
 
 
-def getMainDisplay():
+def getDisplayConfiguration(option=None):
     """
-    :return: The main Display.
+    :param option: The configure option for a new DisplayConfiguration (see configureOptions)
+    :return: The active DisplayConfiguration, if one is being built; otherwise, a new DisplayConfiguration
     """
-    return Display(Quartz.CGMainDisplayID())
+    if activeConfiguration is not None:
+        return activeConfiguration
+    else:
+        return DisplayConfiguration(option)
 
 
-def getAllDisplays():
+def setConfigureOption(option):
     """
-    :return: A list containing all currently-online displays.
+    Sets the configure option used by every setter (and DisplayConfiguration) which isn't given one.
+
+    :param option: "permanent" (the default), "session", "app", or "transient" (see configureOptions)
     """
-    (error, displayIDs, count) = Quartz.CGGetOnlineDisplayList(32, None, None)  # max 32 displays
-    if error:
-        raise DisplayError("Could not retrieve displays list")
+    global configureOption
 
-    displays = []
-    for displayID in displayIDs:
-        displays.append(Display(displayID))
-    return sorted(displays)
+    if option not in configureOptions:
+        raise ValueError("\"{}\" is not a valid configure option".format(option))
+    configureOption = option
 
 
-def getIOKit():
+def restoreTransientSettings():
     """
-    This handles the importing of specific functions and variables from the
-    IOKit framework. IOKit is not natively bridged in PyObjC, so the methods
-    must be found and encoded manually to gain their functionality in Python.
+    Restores every setting changed in transient mode to its original value.
+    Registered to run automatically when the process exits.
+    """
+    originals = list(transientOriginals.items())
+    transientOriginals.clear()
+
+    for (displayID, setting), value in originals:
+        if value is None:
+            continue
+        try:
+            display = Display(displayID)
+            if setting == "rotation":
+                display.setRotate(value, option="permanent")
+            elif setting == "brightness":
+                display.setBrightness(value, option="permanent")
+            elif setting == "underscan":
+                display.setUnderscan(value, option="permanent")
+        # The display may have been disconnected, or may no longer accept the setting
+        except DisplayError:
+            pass
+
+
+class DisplayOperation(collections.namedtuple("DisplayOperation", ["display", "setting", "value"])):
+    """
+    A single change to a single display's settings, as planned by a DisplayReconciler.
 
-    :return: A dictionary containing several IOKit functions and variables.
+    Fields:
+        display: Display
+        setting: "mirrorSource", "rotation", "mode", "underscan", or "brightness"
+        value: The value the setting will be (or would have been) set to
     """
-    global iokit
 
-    # IOKit may have already been instantiated, in which case, nothing needs to be done
-    if not iokit:
-        # PyObjC sometimes raises compatibility warnings in macOS 10.14 relating to parts of IOKit that
-        # Display Manager doesn't use. Thus, such warnings will be temporarily ignored
-        warnings.simplefilter("ignore")
+    __slots__ = ()
 
-        # The dictionary which will contain all of the necessary functions and variables from IOKit
-        iokit = {}
+    def __str__(self):
+        if self.setting == "mode":
+            value = "{}x{} at {} Hz{}".format(
+                self.value.width, self.value.height, self.value.refresh, " (HiDPI)" if self.value.hidpi else "")
+        elif self.setting == "mirrorSource":
+            value = self.value.tag if self.value is not None else "none"
+        else:
+            value = self.value
+        return "{} {}: {}".format(self.display.tag, self.setting, value)
 
-        # Retrieve the IOKit framework
-        iokitBundle = objc.initFrameworkWrapper(
-            "IOKit",
-            frameworkIdentifier="com.apple.iokit",
-            frameworkPath=objc.pathForFramework("/System/Library/Frameworks/IOKit.framework"),
-            globals=globals()
-        )
 
-        # The IOKit functions to be retrieved
-        functions = [
-            ("IOServiceGetMatchingServices", b"iI@o^I"),
-            ("IODisplayCreateInfoDictionary", b"@II"),
-            ("IODisplayGetFloatParameter", b"iII@o^f"),
-            ("IODisplaySetFloatParameter", b"iII@f"),
-            ("IOServiceRequestProbe", b"iII"),
-            ("IOIteratorNext", b"II"),
-        ]
-
-        # The IOKit variables to be retrieved
-        variables = [
-            ("kIODisplayNoProductName", b"I"),
-            ("kIOMasterPortDefault", b"I"),
-            ("kIODisplayOverscanKey", b"*"),
-            ("kDisplayVendorID", b"*"),
-            ("kDisplayProductID", b"*"),
-            ("kDisplaySerialNumber", b"*"),
-        ]
-
-        # Load functions from IOKit.framework into our iokit
-        objc.loadBundleFunctions(iokitBundle, iokit, functions)
-        # Bridge won't put straight into iokit, so globals()
-        objc.loadBundleVariables(iokitBundle, globals(), variables)
-        # Move only the desired variables into iokit
-        for var in variables:
-            key = "{}".format(var[0])
-            if key in globals():
-                iokit[key] = globals()[key]
-
-        # A few IOKit variables that have been deprecated, but whose values
-        # still work as intended in IOKit functions
-        iokit["kDisplayBrightness"] = CoreFoundation.CFSTR("brightness")
-        iokit["kDisplayUnderscan"] = CoreFoundation.CFSTR("pscn")
-
-        # Stop ignoring warnings now that we've finished with PyObjC
-        warnings.simplefilter("default")
+class ReconcileReport(collections.namedtuple("ReconcileReport", ["applied", "skipped", "failed"])):
+    """
+    The outcome of DisplayReconciler.apply (or ProfileStore.apply).
+
+    Fields:
+        applied: The DisplayOperations which were performed
+        skipped: The DisplayOperations which weren't performed, because the display already matched them
+        failed: (Display, DisplayError) for each display whose targets couldn't be worked out (e.g. because
+            a profile asked for a resolution it doesn't support), and which was therefore left alone
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, applied, skipped, failed=()):
+        return super(ReconcileReport, cls).__new__(cls, applied, skipped, list(failed))
+
+
+class DisplayReconciler(object):
+    """
+    Brings displays to a desired state, performing only the operations which actually change something.
+
+    Targets are given per display, and only for the settings which matter; every other setting is left
+    alone. When applied, the targets are compared against the displays' current settings, and any which
+    already match are skipped, so that re-applying a configuration which is already in place costs a few
+    reads rather than a mode switch (and a blanked screen). The remaining operations are run in the
+    order that keeps them from interfering with each other (mirroring, rotation, mode, underscan, then
+    brightness); mirroring and mode changes are made through a single DisplayConfiguration.
+
+    With more than one worker, different displays are read and configured at the same time, on a bounded
+    pool of threads. Each display's own operations are still performed one at a time, in order, and
+    mirroring and mode changes are still made through the configuration between them.
+
+    Applied while the caller has a DisplayConfiguration open, mirroring and mode changes join the caller's
+    configuration instead, and so only take effect when the caller commits it. Rotation, underscan, and
+    brightness still act immediately (in order), which means they come before mirroring and mode changes,
+    rather than between them.
+    """
+
+    # Settings, in the order they must be changed to avoid interfering with each other
+    settingOrder = ["mirrorSource", "rotation", "mode", "underscan", "brightness"]
+    # Settings which are changed through a DisplayConfiguration, rather than immediately
+    transactionalSettings = ["mirrorSource", "mode"]
+    # How far apart two brightness or underscan values can be and still be considered the same
+    # (IOKit doesn't always report back exactly the value it was set to)
+    tolerance = 0.005
+
+    def __init__(self, option=None, workers=1):
+        """
+        :param option: The configure option to apply changes with (see configureOptions); if None,
+            the current default is used
+        :param workers: The most displays to read or configure at once
+        """
+        if workers < 1:
+            raise ValueError("A DisplayReconciler needs at least one worker")
+
+        self.option = option
+        self.workers = workers
+        # displayID -> (Display, {setting: value})
+        self.__targets = collections.OrderedDict()
+
+    def setTarget(self, display, **settings):
+        """
+        Sets (or updates) the desired state of a display. Later targets for the same setting of the same
+        display replace earlier ones.
+
+        :param display: The Display to configure
+        :param settings: Any of:
+            mode: DisplayMode
+            rotation: int (degrees; a multiple of 90)
+            brightness: float (0 to 1)
+            underscan: float (0 to 1)
+            mirrorSource: Display to mirror, or None to stop mirroring
+        """
+        for setting in settings:
+            if setting not in self.settingOrder:
+                raise ValueError("\"{}\" is not a display setting".format(setting))
+
+        if display.displayID not in self.__targets:
+            self.__targets[display.displayID] = (display, {})
+        self.__targets[display.displayID][1].update(settings)
 
+    def plan(self):
+        """
+        Compares every target against its display's current settings.
+        :return: The DisplayOperations which must be performed (in order), and those which can be skipped
+        """
+        operations = []
+        skipped = []
+        for displayOperations, displaySkipped in self.__map(self.__planDisplay, list(self.__targets.values())):
+            operations.extend(displayOperations)
+            skipped.extend(displaySkipped)
+
+        operations.sort(key=lambda operation: self.settingOrder.index(operation.setting))
+        return operations, skipped
+
+    def apply(self):
+        """
+        Performs every operation which changes something. If any operation fails, pending mirroring and
+        mode changes are cancelled. If a DisplayConfiguration is already open, mirroring and mode changes are
+        added to it, and are left for whoever opened it to commit (or cancel); every other operation is
+        performed before this returns, and so before them.
+        :return: A ReconcileReport of what was applied and what was skipped
+        """
+        # Display tags (e.g. in errors and traces) must describe the displays as they are now
+        if self.__targets:
+            refreshDisplaySnapshot()
+        operations, skipped = self.plan()
+
+        # Inside a caller's open DisplayConfiguration, mirroring and mode changes join it, and are applied
+        # (or cancelled) when the caller commits (or cancels) it; only a configuration begun here is committed here
+        configuration = activeConfiguration
+        began = configuration is None
+        if began:
+            configuration = DisplayConfiguration(self.option)
+        try:
+            # Operations which act on displays immediately are batched, so that each batch can be
+            # performed on every display at once
+            batch = []
+            for operation in operations:
+                if operation.setting in self.transactionalSettings:
+                    self.__performBatch(batch)
+                    batch = []
+                    if began:
+                        configuration.begin()
+                    self.__perform(operation)
+                else:
+                    # Everything else acts on the display immediately, so earlier changes must be applied first
+                    if began:
+                        configuration.commit()
+                    batch.append(operation)
+            self.__performBatch(batch)
+            if began:
+                configuration.commit()
+        except Exception:
+            if began:
+                configuration.cancel()
+            raise
+
+        return ReconcileReport(applied=operations, skipped=skipped)
+
+    def __map(self, function, items):
+        """
+        :return: function applied to each of items, using up to self.workers threads at once
+        """
+        if self.workers == 1 or len(items) < 2:
+            return [function(item) for item in items]
+
+        # Only needed when running in parallel, so there's no need to import it up front
+        import concurrent.futures
+
+        with concurrent.futures.ThreadPoolExecutor(min(self.workers, len(items))) as pool:
+            return list(pool.map(function, items))
+
+    def __planDisplay(self, target):
+        """
+        :param target: A display and its target settings
+        :return: The DisplayOperations which must be performed on the display, and those which can be skipped
+        """
+        display, settings = target
+        operations = []
+        skipped = []
+        for setting in self.settingOrder:
+            if setting not in settings:
+                continue
+            operation = DisplayOperation(display, setting, settings[setting])
+            if self.__matches(display, setting, operation.value):
+                skipped.append(operation)
+            else:
+                operations.append(operation)
+        return operations, skipped
+
+    def __performBatch(self, operations):
+        """
+        Performs DisplayOperations which act immediately: different displays' at the same time, and
+        each display's in order.
+        """
+        byDisplay = collections.OrderedDict()
+        for operation in operations:
+            byDisplay.setdefault(operation.display.displayID, []).append(operation)
+
+        def performAll(displayOperations):
+            for operation in displayOperations:
+                self.__perform(operation)
+
+        self.__map(performAll, list(byDisplay.values()))
+
+    def __matches(self, display, setting, value):
+        """
+        :return: Whether display's current value for setting is already value
+        """
+        if setting == "mode":
+            current = display.currentMode
+            return (current.width, current.height, current.refresh, current.hidpi) == \
+                (value.width, value.height, value.refresh, value.hidpi)
+        elif setting == "rotation":
+            return display.rotation == value % 360
+        elif setting == "brightness":
+            current = display.brightness
+            return current is not None and abs(current - value) <= self.tolerance
+        elif setting == "underscan":
+            current = display.underscan
+            return current is not None and abs(current - value) <= self.tolerance
+        elif setting == "mirrorSource":
+            current = display.mirrorSource
+            # Mirroring itself means not mirroring at all
+            if value is None or value.displayID == display.displayID:
+                return current is None
+            return current is not None and current.displayID == value.displayID
+
+    def __perform(self, operation):
+        """
+        Performs a single DisplayOperation.
+        """
+        display = operation.display
+        if operation.setting == "mode":
+            display.setMode(operation.value, self.option)
+        elif operation.setting == "rotation":
+            display.setRotate(operation.value, self.option)
+        elif operation.setting == "brightness":
+            display.setBrightness(operation.value, self.option)
+        elif operation.setting == "underscan":
+            display.setUnderscan(operation.value, self.option)
+        elif operation.setting == "mirrorSource":
+            display.setMirrorSource(operation.value, self.option)
+
+
+class DisplayIdentity(collections.namedtuple("DisplayIdentity", ["vendor", "product", "serial"])):
+    """
+    Identifies a physical display by its hardware, rather than by where it happens to be plugged in.
+
+    Fields:
+        vendor: int (the EDID vendor ID)
+        product: int (the EDID product ID)
+        serial: int (the EDID serial number; 0 if the display doesn't report one)
+    """
+
+    __slots__ = ()
+
+
+class DisplayProfile(object):
+    """
+    The desired settings for a particular kind of physical display, applied by a ProfileStore whenever one
+    appears. Only the settings given are applied; every other setting is left alone.
+    """
+
+    # The settings a profile may specify, besides the display's identity
+    settings = ["width", "height", "refresh", "hidpi", "rotation", "brightness", "underscan"]
+
+    def __init__(self, vendor, product, serial=None, **settings):
+        """
+        :param vendor: The vendor ID of the displays this profile applies to
+        :param product: The product ID of the displays this profile applies to
+        :param serial: The serial number of the display this profile applies to; if None,
+            it applies to every display of this vendor and product (which doesn't have its own profile)
+        :param settings: Any of:
+            width, height: int (the resolution to use; must be given together)
+            refresh: int (the refresh rate to prefer; 0 for any)
+            hidpi: int (0 -> any; 1 -> no HiDPI; 2 -> only HiDPI)
+            rotation: int (degrees; a multiple of 90)
+            brightness: float (0 to 1)
+            underscan: float (0 to 1)
+        """
+        for setting in settings:
+            if setting not in self.settings:
+                raise ValueError("\"{}\" is not a profile setting".format(setting))
+        if ("width" in settings) != ("height" in settings):
+            raise ValueError("Profiles must specify both width and height, or neither")
+
+        self.vendor = int(vendor)
+        self.product = int(product)
+        self.serial = int(serial) if serial is not None else None
+
+        self.width = settings.get("width")
+        self.height = settings.get("height")
+        self.refresh = settings.get("refresh", 0)
+        self.hidpi = settings.get("hidpi", 0)
+        self.rotation = settings.get("rotation")
+        self.brightness = settings.get("brightness")
+        self.underscan = settings.get("underscan")
+
+    @property
+    def key(self):
+        """
+        :return: The (vendor, product, serial) this profile is looked up by; serial is None if it
+            applies to every display of its vendor and product
+        """
+        return self.vendor, self.product, self.serial
+
+    def addTargets(self, reconciler, display):
+        """
+        Adds this profile's settings for display to a DisplayReconciler, without applying them
+        :param reconciler: The DisplayReconciler to add targets to
+        :param display: The Display this profile applies to
+        """
+        targets = {}
+        if self.width is not None:
+            targets["mode"] = display.closestMode(self.width, self.height, self.refresh, self.hidpi)
+        if self.rotation is not None:
+            targets["rotation"] = self.rotation
+        if self.brightness is not None:
+            targets["brightness"] = self.brightness
+        if self.underscan is not None:
+            targets["underscan"] = self.underscan
+
+        if targets:
+            reconciler.setTarget(display, **targets)
+
+
+class ProfileStore(object):
+    """
+    Holds DisplayProfiles, indexed by hardware identity, so that finding a display's profile is a
+    pair of dictionary lookups no matter how many profiles there are.
+
+    A profile for a specific serial number takes precedence over one for the display's vendor and product.
+    To apply profiles automatically, pass onDisplayEvent to a DisplayWatcher:
+
+        DisplayWatcher(store.onDisplayEvent).run()
+    """
+
+    def __init__(self, profiles=None):
+        """
+        :param profiles: DisplayProfiles to add to the store
+        """
+        # (vendor, product, serial or None) -> DisplayProfile
+        self.__profiles = {}
+
+        for profile in profiles or []:
+            self.add(profile)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a profile store from a JSON file, which contains a list of objects. Each object has a "vendor"
+        and "product" (and optionally "serial"), along with any of the settings DisplayProfile accepts.
+        :param path: The path of the file to read
+        :return: A ProfileStore with the file's profiles
+        """
+        # Only needed by stored profiles, so there's no need to import it up front
+        import json
+
+        with open(path) as f:
+            entries = json.load(f)
+        if not isinstance(entries, list):
+            raise ValueError("\"{}\" must contain a list of profiles".format(path))
+
+        profiles = []
+        for entry in entries:
+            if not isinstance(entry, dict):
+                raise ValueError("Every profile in \"{}\" must be an object".format(path))
+            if "vendor" not in entry or "product" not in entry:
+                raise ValueError("Every profile in \"{}\" must have a vendor and product".format(path))
+            # Checked here, so that (e.g.) "vendor": "abc" is reported as clearly as "vendor": null
+            try:
+                int(entry["vendor"]), int(entry["product"])
+                if entry.get("serial") is not None:
+                    int(entry["serial"])
+            except (TypeError, ValueError):
+                raise ValueError("The vendor, product, and serial of profiles in \"{}\" must be numbers".format(path))
+            # Any other problem (e.g. an unknown setting) is described by DisplayProfile
+            profiles.append(DisplayProfile(**entry))
+        return cls(profiles)
+
+    def __len__(self):
+        return len(self.__profiles)
+
+    def add(self, profile):
+        """
+        :param profile: A DisplayProfile; replaces any profile with the same key
+        """
+        self.__profiles[profile.key] = profile
+
+    def lookup(self, identity):
+        """
+        :param identity: A DisplayIdentity
+        :return: The DisplayProfile for identity, or None if there isn't one
+        """
+        profile = self.__profiles.get(tuple(identity))
+        if profile is None:
+            profile = self.__profiles.get((identity.vendor, identity.product, None))
+        return profile
+
+    def apply(self, displays=None, option=None):
+        """
+        Applies the matching profile to each display, through a single DisplayReconciler (and so in a
+        single DisplayConfiguration). A display whose profile can't be applied (e.g. because it asks for a
+        resolution the display doesn't support) is left alone, and reported, without affecting the others.
+        :param displays: The Displays to apply profiles to; if None, every online display
+        :param option: The configure option to apply changes with (see configureOptions); if None,
+            the current default is used
+        :return: A ReconcileReport of which changes were applied, which were skipped, and which displays failed
+        """
+        if displays is None:
+            displays = getAllDisplays()
+
+        reconciler = DisplayReconciler(option)
+        failed = []
+        for display in displays:
+            profile = self.lookup(display.identity)
+            if profile is not None:
+                try:
+                    profile.addTargets(reconciler, display)
+                except DisplayError as e:
+                    failed.append((display, e))
+        return reconciler.apply()._replace(failed=failed)
+
+    def onDisplayEvent(self, event):
+        """
+        Applies profiles to the displays which were connected in a DisplayEvent.
+        :param event: A DisplayEvent, as published by a DisplayWatcher
+        :return: A ReconcileReport of which changes were applied, which were skipped, and which displays failed
+        """
+        return self.apply([Display(displayID, validate=False) for displayID in sorted(event.added)])
+
+
+class AbstractDisplayMode(object):
+    """
+    Abstract representation which display_manager_lib.DisplayMode will inherit from.
+
+    Included for unit testing purposes
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    # Allows subclasses to be fully slotted
+    __slots__ = ()
+
+    @abc.abstractmethod
+    def __init__(self):
+        pass
+
+    # "Magic" methods
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return all([
+                self.width == other.width,
+                self.height == other.height,
+                self.refresh == other.refresh,
+                self.hidpi == other.hidpi,
+                self.isDefault == other.isDefault,
+            ])
+        else:
+            return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, self.__class__):
+            return not self.__eq__(other)
+        else:
+            return NotImplemented
+
+    def __lt__(self, other):
+        return self.width * self.height < other.width * other.height
+
+    def __gt__(self, other):
+        return self.width * self.height > other.width * other.height
+
+    def __hash__(self):
+        return hash((self.width, self.height, self.refresh, self.hidpi, self.isDefault))
+
+    # General properties
+
+    @abc.abstractproperty
+    def width(self):
+        pass
+
+    @abc.abstractproperty
+    def height(self):
+        pass
+
+    @abc.abstractproperty
+    def refresh(self):
+        pass
+
+    @abc.abstractproperty
+    def hidpi(self):
+        pass
+
+    @abc.abstractproperty
+    def isDefault(self):
+        pass
+
+
+class DisplayMode(AbstractDisplayMode):
+    """
+    Represents a DisplayMode as implemented in Quartz.CoreGraphics
+
+    Everything about the mode is read by the backend once, when the DisplayMode is created (see
+    QuartzBackend.readMode); the CGDisplayModeRef itself isn't kept. DisplayModes are immutable, so their
+    hashes and sort keys are computed up front as well.
+    """
+
+    __slots__ = (
+        "__width", "__height", "__pixelWidth", "__pixelHeight", "__refresh",
+        "__ioFlags", "__ioModeID", "__hidpi", "__isDefault", "__key", "__hash", "__sortKey",
+    )
+
+    def __init__(self, width, height, refresh, pixelWidth=None, pixelHeight=None, ioFlags=0, ioModeID=0):
+        """
+        :param width: The mode's width, in points
+        :param height: The mode's height, in points
+        :param refresh: The mode's refresh rate, in Hz
+        :param pixelWidth: The mode's width, in pixels; if None, the same as width
+        :param pixelHeight: The mode's height, in pixels; if None, the same as height
+        :param ioFlags: The IOKit mode flags (kDisplayMode...Flag) for the mode
+        :param ioModeID: The IOKit display mode ID of the mode
+        """
+        super(DisplayMode, self).__init__()
+
+        self.__width = int(width)
+        self.__height = int(height)
+        self.__refresh = int(refresh)
+        self.__pixelWidth = int(pixelWidth if pixelWidth is not None else width)  # the maximum display width
+        self.__pixelHeight = int(pixelHeight if pixelHeight is not None else height)  # the maximum display height
+        self.__ioFlags = int(ioFlags)
+        self.__ioModeID = int(ioModeID)
+
+        # If the pixel dimensions are the same as the point dimensions, mode is not HiDPI
+        self.__hidpi = (self.__pixelWidth != self.__width and self.__pixelHeight != self.__height)
+        self.__isDefault = bool(self.__ioFlags & kDisplayModeDefaultFlag)
+
+        self.__key = (self.__width, self.__height, self.__refresh, self.__hidpi, self.__isDefault)
+        self.__hash = hash(self.__key)
+        self.__sortKey = (self.__width * self.__height, self.__width, self.__refresh, self.__hidpi)
+
+    # "Magic" methods
+
+    def __eq__(self, other):
+        if isinstance(other, DisplayMode):
+            return self.__key == other.__key
+        else:
+            return super(DisplayMode, self).__eq__(other)
+
+    def __ne__(self, other):
+        if isinstance(other, DisplayMode):
+            return self.__key != other.__key
+        else:
+            return super(DisplayMode, self).__ne__(other)
+
+    def __hash__(self):
+        return self.__hash
+
+    def __str__(self):
+        return self.littleString
+
+    # General properties
+
+    @property
+    def littleString(self):
+        return "resolution: {width}x{height}, refresh rate: {refresh}, HiDPI: {hidpi}".format(**{
+            "width": self.width,
+            "height": self.height,
+            "refresh": self.refresh,
+            "hidpi": self.hidpi,
+        })
+
+    @property
+    def bigString(self):
+        return "\n".join([
+            "resolution:     {}x{}".format(self.width, self.height),
+            "refresh rate:   {}".format(self.refresh),
+            "HiDPI:          {}".format(self.hidpi),
+        ])
+
+    @property
+    def width(self):
+        return self.__width
+
+    @property
+    def height(self):
+        return self.__height
+
+    @property
+    def pixelWidth(self):
+        return self.__pixelWidth
+
+    @property
+    def pixelHeight(self):
+        return self.__pixelHeight
+
+    @property
+    def refresh(self):
+        return self.__refresh
+
+    @property
+    def hidpi(self):
+        return self.__hidpi
+
+    @property
+    def ioFlags(self):
+        """
+        :return: The IOKit mode flags (kDisplayMode...Flag) Quartz reported for this DisplayMode
+        """
+        return self.__ioFlags
+
+    @property
+    def ioModeID(self):
+        """
+        :return: The IOKit display mode ID of this DisplayMode
+        """
+        return self.__ioModeID
+
+    @property
+    def isDefault(self):
+        """
+        :return: Whether this DisplayMode is the display's default mode
+        """
+        return self.__isDefault
+
+    @property
+    def sortKey(self):
+        """
+        :return: A key which orders DisplayModes by area, then width, refresh rate, and HiDPI
+        """
+        return self.__sortKey
+
+
+class DisplaySnapshot(object):
+    """
+    The set of currently-online displays, as enumerated by a single call to the backend.
+
+    Every Display in a snapshot is built from the same online display list, so looking up several
+    displays (or tags) through one snapshot costs one enumeration rather than one per display.
+    Display tags are indexed in both directions when the snapshot is built, so tag lookups are
+    dictionary lookups.
+    """
+
+    def __init__(self, displayIDs=None, mainDisplayID=None):
+        """
+        :param displayIDs: The online displayIDs, if they've just been read; if None, they're read from the backend
+        :param mainDisplayID: The main displayID, if it's just been read; if None, it's read from the backend
+        """
+        backend = getBackend()
+        if displayIDs is None:
+            displayIDs = backend.onlineDisplayIDs()
+
+        # The topology generation this snapshot describes
+        self.generation = topologyGeneration
+        # The online displayIDs this snapshot was built from
+        self.onlineIDs = frozenset(displayIDs)
+
+        self.mainDisplayID = mainDisplayID if mainDisplayID is not None else backend.mainDisplayID()
+        # These IDs came straight from the online display list, so they don't need to be validated again
+        self.displays = sorted([Display(displayID, validate=False) for displayID in displayIDs])
+
+        # Bidirectional tag index: displayID -> tag, and tag -> Display
+        self.__tagsByID = {}
+        self.__displaysByTag = {}
+        externalNum = 0
+        for display in self.displays:
+            if display.displayID == self.mainDisplayID:
+                tag = "main"
+            else:
+                tag = "ext" + str(externalNum)
+                externalNum += 1
+            self.__tagsByID[display.displayID] = tag
+            self.__displaysByTag[tag] = display
+
+    # "Magic" methods
+
+    def __len__(self):
+        return len(self.displays)
+
+    def __iter__(self):
+        return iter(self.displays)
+
+    def __contains__(self, display):
+        return display.displayID in self.__tagsByID
+
+    # Lookups
+
+    @property
+    def main(self):
+        """
+        :return: The main Display.
+        """
+        if "main" in self.__displaysByTag:
+            return self.__displaysByTag["main"]
+        # The main display is always online, but it may have come online after the list was retrieved
+        return Display(self.mainDisplayID, validate=False)
+
+    @property
+    def externals(self):
+        """
+        :return: All the external (non-main) Displays, in tag order.
+        """
+        return [display for display in self.displays if display.displayID != self.mainDisplayID]
+
+    def tagOf(self, display):
+        """
+        :param display: The Display to find the tag of
+        :return: The display tag ("main" or "ext<N>") for display, or None if it isn't in this snapshot
+        """
+        return self.__tagsByID.get(display.displayID)
+
+    def fromTag(self, displayTag):
+        """
+        :param displayTag: "main", "all", or "ext<N>"
+        :return: The Display which displayTag refers to ("all" returns a list of every Display)
+        """
+        if displayTag == "all":
+            return list(self.displays)
+        elif displayTag == "main":
+            return self.main
+        elif displayTag in self.__displaysByTag:
+            return self.__displaysByTag[displayTag]
+
+        raise DisplayError("There is no display \"{}\"".format(displayTag))
+
+
+def getDisplaySnapshot():
+    """
+    :return: The DisplaySnapshot for the current display topology. It is reused until the topology
+        changes (or invalidateDisplayCaches is called), at which point a new one is taken. Reusing it
+        makes no calls to the backend at all; see refreshDisplaySnapshot for checking that it's still current.
+    """
+    global displaySnapshot
+
+    registerReconfigurationCallback()
+    with snapshotLock:
+        if displaySnapshot is None or displaySnapshot.generation != topologyGeneration:
+            displaySnapshot = DisplaySnapshot()
+        return displaySnapshot
+
+
+def refreshDisplaySnapshot():
+    """
+    Quartz only reports reconfigurations while the run loop is running, which it may never be (e.g. in a
+    script). So before each enumeration, run of commands, or reconciliation, the online display list is
+    read once, and the cached snapshot is only reused if it still matches.
+    :return: The DisplaySnapshot for the current display topology
+    """
+    global displaySnapshot
+
+    registerReconfigurationCallback()
+    backend = getBackend()
+    with snapshotLock:
+        displayIDs = backend.onlineDisplayIDs()
+        mainDisplayID = backend.mainDisplayID()
+        if displaySnapshot is not None and displaySnapshot.generation == topologyGeneration:
+            if displaySnapshot.onlineIDs == frozenset(displayIDs) and \
+                    displaySnapshot.mainDisplayID == mainDisplayID:
+                return displaySnapshot
+            # Unreported changes make whatever was cached about the displays which came and went stale, too
+            for displayID in displaySnapshot.onlineIDs.symmetric_difference(displayIDs):
+                invalidateDisplayCaches(displayID)
+
+        displaySnapshot = DisplaySnapshot(displayIDs, mainDisplayID)
+        return displaySnapshot
+
+
+class ModeCatalog(object):
+    """
+    An index over all of a single display's DisplayModes.
+
+    Modes are hashed by resolution and partitioned by HiDPI, with each resolution's modes sorted by
+    refresh rate, and the highest mode for each HiDPI code is found up front. Exact-resolution and
+    "highest" lookups are therefore constant-time, and area range lookups are logarithmic.
+    """
+
+    def __init__(self, modes):
+        """
+        :param modes: The (de-duplicated) DisplayModes of a single display
+        """
+        # All modes, from largest to smallest (and highest to lowest refresh rate within a resolution)
+        self.modes = sorted(modes, key=lambda mode: mode.sortKey, reverse=True)
+        # Partitions by HiDPI, in the same order as self.modes
+        self.hidpiModes = [mode for mode in self.modes if mode.hidpi]
+        self.lodpiModes = [mode for mode in self.modes if not mode.hidpi]
+
+        self.default = None
+        # (width, height) -> {hidpi: [modes at that resolution, sorted by ascending refresh rate]}
+        self.__byResolution = {}
+        # (width, height, refresh, hidpi) -> mode
+        self.__byKey = {}
+        for mode in reversed(self.modes):
+            if mode.isDefault:
+                self.default = mode
+            resolution = self.__byResolution.setdefault((mode.width, mode.height), {True: [], False: []})
+            resolution[mode.hidpi].append(mode)
+            self.__byKey.setdefault((mode.width, mode.height, mode.refresh, mode.hidpi), mode)
+
+        # HiDPI code -> highest mode which fits it (0: any, 1: only non-HiDPI, 2: only HiDPI)
+        self.__highest = {
+            0: self.modes[0] if self.modes else None,
+            1: self.lodpiModes[0] if self.lodpiModes else None,
+            2: self.hidpiModes[0] if self.hidpiModes else None,
+        }
+
+        # Ascending areas (parallel to the ascending list of modes) for bisection
+        self.__ascending = list(reversed(self.modes))
+        self.__areas = [mode.width * mode.height for mode in self.__ascending]
+
+    # "Magic" methods
+
+    def __len__(self):
+        return len(self.modes)
+
+    def __iter__(self):
+        return iter(self.modes)
+
+    # Helper methods
+
+    @staticmethod
+    def __hidpiFlags(hidpi):
+        """
+        :param hidpi: HiDPI code. 0 returns everything, 1 returns only non-HiDPI, and 2 returns only HiDPI.
+        :return: The values of DisplayMode.hidpi which fit the HiDPI code
+        """
+        if hidpi == 1:
+            return [False]
+        elif hidpi == 2:
+            return [True]
+        else:
+            return [True, False]
+
+    # Lookups
+
+    def atResolution(self, width, height, hidpi=0):
+        """
+        :param width: Desired width
+        :param height: Desired height
+        :param hidpi: HiDPI code. 0 returns everything, 1 returns only non-HiDPI, and 2 returns only HiDPI.
+        :return: All modes at width x height which fit hidpi, sorted by ascending refresh rate
+        """
+        resolution = self.__byResolution.get((width, height))
+        if not resolution:
+            return []
+
+        flags = self.__hidpiFlags(hidpi)
+        if len(flags) == 1:
+            return list(resolution[flags[0]])
+        else:
+            return sorted(resolution[True] + resolution[False], key=lambda mode: mode.refresh)
+
+    def exact(self, width, height, refresh, hidpi):
+        """
+        :return: The mode exactly matching width, height, refresh, and hidpi (a boolean), or None
+        """
+        return self.__byKey.get((width, height, refresh, hidpi))
+
+    def highest(self, hidpi=0):
+        """
+        :param hidpi: HiDPI code. 0 returns everything, 1 returns only non-HiDPI, and 2 returns only HiDPI.
+        :return: The mode with the largest area which fits hidpi, or None
+        """
+        return self.__highest.get(hidpi, self.__highest[0])
+
+    def closest(self, width, height, refresh=0, hidpi=0):
+        """
+        :param width: Desired width
+        :param height: Desired height
+        :param refresh: Desired refresh rate
+        :param hidpi: HiDPI code. 0 returns everything, 1 returns only non-HiDPI, and 2 returns only HiDPI
+        :return: The mode at width x height which best matches refresh and hidpi, with HiDPI matches
+            preferred over refresh matches; or None if there are no modes at width x height
+        """
+        resolution = self.__byResolution.get((width, height))
+        if not resolution:
+            return None
+
+        flags = self.__hidpiFlags(hidpi)
+        # Matches HiDPI and refresh
+        for flag in flags:
+            mode = self.__byKey.get((width, height, refresh, flag))
+            if mode:
+                return mode
+        # Matches HiDPI (at the highest refresh rate available)
+        rightHidpi = [resolution[flag][-1] for flag in flags if resolution[flag]]
+        if rightHidpi:
+            return max(rightHidpi, key=lambda mode: mode.refresh)
+        # Matches refresh
+        for flag in [True, False]:
+            mode = self.__byKey.get((width, height, refresh, flag))
+            if mode:
+                return mode
+        return None
+
+    def inAreaRange(self, minArea=0, maxArea=None, hidpi=0):
+        """
+        :param minArea: Smallest acceptable area (width * height), inclusive
+        :param maxArea: Largest acceptable area, inclusive; if None, there is no upper bound
+        :param hidpi: HiDPI code. 0 returns everything, 1 returns only non-HiDPI, and 2 returns only HiDPI.
+        :return: All modes within the area range which fit hidpi, from smallest to largest
+        """
+        low = bisect.bisect_left(self.__areas, minArea)
+        high = len(self.__areas) if maxArea is None else bisect.bisect_right(self.__areas, maxArea)
+        flags = self.__hidpiFlags(hidpi)
+        return [mode for mode in self.__ascending[low:high] if mode.hidpi in flags]
+
+
+class DisplayModeCache(object):
+    """
+    Caches each display's ModeCatalog (from which Display.allModes etc. are read), keyed by displayID.
+
+    Copying and de-duplicating a display's modes takes several Quartz calls per mode, and a single
+    command may need them many times (for the default mode, the highest mode, HiDPI checks, etc.),
+    so they are only copied the first time they're needed after each reconfiguration.
+    """
+
+    def __init__(self):
+        self.__modes = {}
+        # Number of lookups served from the cache, and number which had to copy modes from Quartz
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, displayID):
+        return displayID in self.__modes
+
+    def get(self, displayID, build):
+        """
+        :param displayID: The displayID whose modes are needed
+        :param build: Called (with no arguments) to build the ModeCatalog if it isn't cached
+        :return: The cached ModeCatalog for displayID
+        """
+        if displayID in self.__modes:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.__modes[displayID] = build()
+        return self.__modes[displayID]
+
+    def invalidate(self, displayID=None):
+        """
+        :param displayID: The display whose modes should be discarded. If None, discards every display's modes.
+        """
+        if displayID is None:
+            self.__modes.clear()
+        else:
+            self.__modes.pop(displayID, None)
+
+
+# Shared by every Display, so that modes survive across DisplaySnapshots
+modeCache = DisplayModeCache()
+
+
+class DisplayBackend(object):
+    """
+    The interface between Display Manager and the system's displays. Everything Display Manager reads from
+    or writes to the displays goes through the backend returned by getBackend.
+
+    Getters return None for settings which can't be read. Setters and configuration methods follow Quartz's
+    convention of returning an error: anything truthy means the change failed.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    # Topology
+
+    @abc.abstractmethod
+    def onlineDisplayIDs(self):
+        """
+        :return: A list of the online displays' IDs; raises DisplayError if they can't be retrieved
+        """
+        pass
+
+    @abc.abstractmethod
+    def mainDisplayID(self):
+        """
+        :return: The main display's ID
+        """
+        pass
+
+    @abc.abstractmethod
+    def identity(self, displayID):
+        """
+        :return: The DisplayIdentity of a display's hardware
+        """
+        pass
+
+    # Modes
+
+    @abc.abstractmethod
+    def currentMode(self, displayID):
+        """
+        :return: The DisplayMode a display is currently set to
+        """
+        pass
+
+    @abc.abstractmethod
+    def allModes(self, displayID):
+        """
+        :return: A list of every DisplayMode a display supports (possibly including duplicates)
+        """
+        pass
+
+    # Settings
+
+    @abc.abstractmethod
+    def rotation(self, displayID):
+        pass
+
+    @abc.abstractmethod
+    def setRotation(self, displayID, angle):
+        """
+        :param angle: 0, 90, 180, or 270
+        """
+        pass
+
+    @abc.abstractmethod
+    def brightness(self, displayID):
+        pass
+
+    @abc.abstractmethod
+    def setBrightness(self, displayID, brightness):
+        pass
+
+    @abc.abstractmethod
+    def underscan(self, displayID):
+        """
+        :return: A display's underscan, from 0 (no underscan) to 1 (maximum underscan)
+        """
+        pass
+
+    @abc.abstractmethod
+    def setUnderscan(self, displayID, underscan):
+        """
+        :param underscan: From 0 (no underscan) to 1 (maximum underscan)
+        """
+        pass
+
+    @abc.abstractmethod
+    def mirrorSource(self, displayID):
+        """
+        :return: The ID of the display which a display is mirroring, or None if it isn't mirroring one
+        """
+        pass
+
+    @abc.abstractmethod
+    def origin(self, displayID):
+        """
+        :return: The (x, y) coordinates of a display's upper-left corner
+        """
+        pass
+
+    # Configuration transactions
+
+    @abc.abstractmethod
+    def beginConfiguration(self):
+        """
+        :return: A new configuration transaction, or None if one couldn't be begun
+        """
+        pass
+
+    @abc.abstractmethod
+    def configureMode(self, configRef, displayID, mode):
+        pass
+
+    @abc.abstractmethod
+    def configureMirror(self, configRef, displayID, sourceID):
+        """
+        :param sourceID: The ID of the display to mirror, or None to stop mirroring
+        """
+        pass
+
+    @abc.abstractmethod
+    def configureOrigin(self, configRef, displayID, x, y):
+        pass
+
+    @abc.abstractmethod
+    def completeConfiguration(self, configRef, option):
+        """
+        :param option: One of Display Manager's configure options (see configureOptions)
+        """
+        pass
+
+    @abc.abstractmethod
+    def cancelConfiguration(self, configRef):
+        pass
+
+    # Reconfiguration callbacks
+
+    @abc.abstractmethod
+    def registerReconfigurationCallback(self, callback):
+        """
+        :param callback: A function to call with a displayID every time that display has been reconfigured
+        """
+        pass
+
+    def runLoop(self, wait):
+        """
+        Delivers reconfiguration callbacks, waiting up to wait seconds for one to arrive.
+        """
+        time.sleep(wait)
+
+    def invalidate(self, displayID=None):
+        """
+        Discards anything the backend has cached about a display (or about every display, if displayID is None).
+        """
+        pass
+
+
+class QuartzBackend(DisplayBackend):
+    """
+    Reads and configures the Mac's displays through Quartz (CoreGraphics) and IOKit.
+    """
+
+    def __init__(self):
+        # Each display's IOKit display service, which IOKit settings are read and written through
+        self.services = DisplayServiceCache(self)
+        # The reconfiguration callback registered with Quartz. A reference must be kept, or PyObjC will
+        # release the callback while Quartz still holds on to it.
+        self.__callback = None
+
+    # Topology
+
+    def onlineDisplayIDs(self):
+        (error, displayIDs, count) = Quartz.CGGetOnlineDisplayList(32, None, None)  # max 32 displays
+        if error:
+            raise DisplayError("Could not retrieve displays list")
+        return list(displayIDs)
+
+    def mainDisplayID(self):
+        return Quartz.CGMainDisplayID()
+
+    def identity(self, displayID):
+        return DisplayIdentity(
+            int(Quartz.CGDisplayVendorNumber(displayID)),
+            int(Quartz.CGDisplayModelNumber(displayID)),
+            int(Quartz.CGDisplaySerialNumber(displayID)),
+        )
+
+    # Modes
+
+    @staticmethod
+    def readMode(modeRef):
+        """
+        :param modeRef: A Quartz.CGDisplayModeRef
+        :return: A DisplayMode with everything Display Manager needs from modeRef
+        """
+        if not isinstance(modeRef, Quartz.CGDisplayModeRef):
+            raise DisplayError("\"{}\" is not a valid Quartz.CGDisplayModeRef".format(modeRef))
+
+        return DisplayMode(
+            width=Quartz.CGDisplayModeGetWidth(modeRef),
+            height=Quartz.CGDisplayModeGetHeight(modeRef),
+            refresh=Quartz.CGDisplayModeGetRefreshRate(modeRef),
+            pixelWidth=Quartz.CGDisplayModeGetPixelWidth(modeRef),
+            pixelHeight=Quartz.CGDisplayModeGetPixelHeight(modeRef),
+            ioFlags=Quartz.CGDisplayModeGetIOFlags(modeRef),
+            ioModeID=Quartz.CGDisplayModeGetIODisplayModeID(modeRef),
+        )
+
+    def currentMode(self, displayID):
+        return self.readMode(Quartz.CGDisplayCopyDisplayMode(displayID))
+
+    def allModes(self, displayID):
+        return [self.readMode(modeRef) for modeRef in self.__copyModeRefs(displayID)]
+
+    @staticmethod
+    def __copyModeRefs(displayID):
+        """
+        :return: All of a display's Quartz.CGDisplayModeRefs, including HiDPI ones
+        """
+        # options forces Quartz to show HiDPI modes
+        options = {Quartz.kCGDisplayShowDuplicateLowResolutionModes: True}
+        return Quartz.CGDisplayCopyAllDisplayModes(displayID, options)
+
+    def __modeRef(self, displayID, mode):
+        """
+        :param mode: One of the display's DisplayModes
+        :return: The Quartz.CGDisplayModeRef which mode was read from, or None if the display has no such mode
+        """
+        for modeRef in self.__copyModeRefs(displayID):
+            # Compare IOKit mode IDs first, so that only likely matches are read in full
+            if Quartz.CGDisplayModeGetIODisplayModeID(modeRef) == mode.ioModeID and self.readMode(modeRef) == mode:
+                return modeRef
+        return None
+
+    # Settings
+
+    def rotation(self, displayID):
+        return int(Quartz.CGDisplayRotation(displayID))
+
+    def setRotation(self, displayID, angle):
+        # see: https://opensource.apple.com/source/IOGraphics/IOGraphics-406/IOGraphicsFamily/IOKit/graphics/
+        # IOGraphicsTypes.h for angle codes (kIOScaleRotate{0, 90, 180, 270}).
+        # Likewise, see .../IOKit/graphics/IOGraphicsTypesPrivate.h for rotateCode (kIOFBSetTransform)
+        swapAxes = 0x10
+        invertX = 0x20
+        invertY = 0x40
+        angleCodes = {
+            0: 0,
+            90: (swapAxes | invertX) << 16,
+            180: (invertX | invertY) << 16,
+            270: (swapAxes | invertY) << 16,
+        }
+        rotateCode = 0x400
+
+        options = rotateCode | angleCodes[angle]
+        service = self.services.get(displayID)
+        if not service:
+            return True
+        return iokit["IOServiceRequestProbe"](service, options)
+
+    def brightness(self, displayID):
+        # Displays without an IOKit display service (e.g. on Apple silicon, AirPlay, or DisplayLink)
+        # have no brightness Display Manager can read
+        service = self.services.get(displayID)
+        if not service:
+            return None
+        (error, brightness) = iokit["IODisplayGetFloatParameter"](service, 0, iokit["kDisplayBrightness"], None)
+        if error:
+            return None
+        else:
+            return brightness
+
+    def setBrightness(self, displayID, brightness):
+        service = self.services.get(displayID)
+        if not service:
+            return True
+        return iokit["IODisplaySetFloatParameter"](service, 0, iokit["kDisplayBrightness"], brightness)
+
+    def underscan(self, displayID):
+        service = self.services.get(displayID)
+        if not service:
+            return None
+        (error, underscan) = iokit["IODisplayGetFloatParameter"](service, 0, iokit["kDisplayUnderscan"], None)
+        if error:
+            return None
+        else:
+            # IOKit handles underscan values as the opposite of what makes sense, so I switch it here.
+            # e.g. 0 -> maximum (100%), 1 -> 0% (default)
+            return float(abs(underscan - 1))
+
+    def setUnderscan(self, displayID, underscan):
+        # IOKit handles underscan values as the opposite of what makes sense, so I switch it here.
+        # e.g. 0 -> maximum (100%), 1 -> 0% (default)
+        underscan = float(abs(underscan - 1))
+        service = self.services.get(displayID)
+        if not service:
+            return True
+        return iokit["IODisplaySetFloatParameter"](service, 0, iokit["kDisplayUnderscan"], underscan)
+
+    def mirrorSource(self, displayID):
+        masterDisplayID = Quartz.CGDisplayMirrorsDisplay(displayID)
+        if masterDisplayID == Quartz.kCGNullDirectDisplay:
+            return None
+        else:
+            return masterDisplayID
+
+    def origin(self, displayID):
+        bounds = Quartz.CGDisplayBounds(displayID)
+        return int(bounds.origin.x), int(bounds.origin.y)
+
+    # Configuration transactions
+
+    def beginConfiguration(self):
+        (error, configRef) = Quartz.CGBeginDisplayConfiguration(None)
+        if error:
+            return None
+        return configRef
+
+    def configureMode(self, configRef, displayID, mode):
+        modeRef = self.__modeRef(displayID, mode)
+        if modeRef is None:
+            return True
+        return Quartz.CGConfigureDisplayWithDisplayMode(configRef, displayID, modeRef, None)
+
+    def configureMirror(self, configRef, displayID, sourceID):
+        if sourceID is None:
+            sourceID = Quartz.kCGNullDirectDisplay
+        return Quartz.CGConfigureDisplayMirrorOfDisplay(configRef, displayID, sourceID)
+
+    def configureOrigin(self, configRef, displayID, x, y):
+        return Quartz.CGConfigureDisplayOrigin(configRef, displayID, x, y)
+
+    def completeConfiguration(self, configRef, option):
+        return Quartz.CGCompleteDisplayConfiguration(configRef, getattr(Quartz, configureOptions[option]))
+
+    def cancelConfiguration(self, configRef):
+        Quartz.CGCancelDisplayConfiguration(configRef)
+
+    # Reconfiguration callbacks
+
+    def registerReconfigurationCallback(self, callback):
+        def onReconfiguration(displayID, flags, userInfo):
+            # Quartz calls back once before and once after each change; only the latter matters
+            if not flags & Quartz.kCGDisplayBeginConfigurationFlag:
+                callback(displayID)
+
+        self.__callback = onReconfiguration
+        Quartz.CGDisplayRegisterReconfigurationCallback(self.__callback, None)
+
+    def runLoop(self, wait):
+        result = CoreFoundation.CFRunLoopRunInMode(CoreFoundation.kCFRunLoopDefaultMode, wait, True)
+        # A run loop with nothing to wait on returns immediately
+        if result == CoreFoundation.kCFRunLoopRunFinished:
+            time.sleep(wait)
+
+    def invalidate(self, displayID=None):
+        self.services.invalidate(displayID)
+
+
+class SimulatedBackend(DisplayBackend):
+    """
+    An in-memory stand-in for a Mac's displays, so that Display Manager (library, command line, and GUI)
+    can be run, tested, and profiled anywhere, including on Linux build hosts.
+
+    Each simulated display starts out in its default mode, unrotated, at full brightness, and without
+    underscan or mirroring. Every call can be made to take "latency" seconds, to approximate the cost of
+    talking to real hardware. As with Quartz, reconfiguration callbacks are queued until the run loop runs.
+    """
+
+    # Refresh rates given to generated modes, in the order they are added
+    refreshRates = [60, 50, 30, 75, 120, 144, 24, 100]
+    # The most distinct resolutions a generated display has
+    maxResolutions = 64
+    # The settings whose changes Quartz reports with reconfiguration callbacks; brightness and underscan are
+    # set through IOKit, which doesn't reconfigure the display
+    reconfiguringSettings = ["mode", "rotation", "mirrorSource", "origin"]
+
+    def __init__(self, displays=1, modes=24, latency=0.0):
+        """
+        :param displays: How many displays to simulate
+        :param modes: How many modes each display should have (see generateModes), or a list of
+            DisplayModes to give every display
+        :param latency: How long (in seconds) every call to the backend should take
+        """
+        self.latency = latency
+        # Number of calls made to this backend
+        self.calls = 0
+        self.__lock = threading.Lock()
+        self.modes = modes if isinstance(modes, list) else self.generateModes(modes)
+
+        # displayID -> {setting: value}
+        self.__displays = collections.OrderedDict()
+        self.__mainDisplayID = None
+        self.__nextDisplayID = 1
+        self.__callbacks = []
+        # The displayIDs whose reconfiguration callbacks haven't been delivered yet
+        self.__pending = []
+
+        for i in range(displays):
+            self.connect()
+        # The initial displays were already connected when the simulation began
+        self.__pending = []
+
+    @classmethod
+    def generateModes(cls, count):
+        """
+        :param count: How many modes to generate (at most 1024)
+        :return: A list of count distinct DisplayModes, spread across a range of 16:10 resolutions, refresh
+            rates, and HiDPI-ness. The largest non-HiDPI 60 Hz mode is the default.
+        """
+        # Each resolution has up to two variants (HiDPI and not) of each refresh rate
+        variants = [(refresh, hidpi) for refresh in cls.refreshRates for hidpi in [False, True]]
+        if not 0 < count <= cls.maxResolutions * len(variants):
+            raise ValueError("Can only generate 1 to {} modes".format(cls.maxResolutions * len(variants)))
+
+        resolutions = min(-(-count // 2), cls.maxResolutions)
+        variantsPerResolution = -(-count // resolutions)
+        modes = []
+        for variant in range(variantsPerResolution):
+            refresh, hidpi = variants[variant]
+            for resolution in range(resolutions):
+                if len(modes) == count:
+                    break
+                width = 640 + 64 * resolution
+                height = width * 10 // 16
+                scale = 2 if hidpi else 1
+                modes.append(DisplayMode(
+                    width, height, refresh, width * scale, height * scale, ioModeID=len(modes) + 1))
+
+        # Mark the default, just as IOKit would
+        default = max(
+            (mode for mode in modes if not mode.hidpi and mode.refresh == 60), key=lambda mode: mode.sortKey)
+        modes[modes.index(default)] = DisplayMode(
+            default.width, default.height, default.refresh, default.pixelWidth, default.pixelHeight,
+            ioFlags=kDisplayModeDefaultFlag, ioModeID=default.ioModeID)
+        return modes
+
+    # Simulated hardware
+
+    def connect(self, identity=None, modes=None):
+        """
+        Simulates a display being connected. The first display connected is the main display.
+        :param identity: The new display's DisplayIdentity; if None, a unique one is made up
+        :param modes: The new display's DisplayModes; if None, the backend's modes
+        :return: The new display's ID
+        """
+        displayID = self.__nextDisplayID
+        self.__nextDisplayID += 1
+
+        modes = modes if modes is not None else self.modes
+        default = [mode for mode in modes if mode.isDefault] or modes
+        # Displays are arranged left to right, in the order they were connected
+        x = max([state["origin"][0] + state["mode"].width for state in self.__displays.values()] or [0])
+
+        self.__displays[displayID] = {
+            "identity": identity or DisplayIdentity(0x610, 0xa000 + displayID, displayID),
+            "modes": modes,
+            "mode": default[0],
+            "rotation": 0,
+            "brightness": 1.0,
+            "underscan": 0.0,
+            "mirrorSource": None,
+            "origin": (x, 0),
+        }
+        if self.__mainDisplayID is None:
+            self.__mainDisplayID = displayID
+        self.__pending.append(displayID)
+        return displayID
+
+    def disconnect(self, displayID):
+        """
+        Simulates a display being disconnected.
+        :param displayID: The display to disconnect
+        """
+        self.__displays.pop(displayID)
+        for otherID, state in self.__displays.items():
+            if state["mirrorSource"] == displayID:
+                state["mirrorSource"] = None
+                self.__pending.append(otherID)
+        if self.__mainDisplayID == displayID:
+            self.__mainDisplayID = next(iter(self.__displays), None)
+        self.__pending.append(displayID)
+
+    def __call(self, displayID=None):
+        """
+        Accounts for (and waits out) a single call to the backend.
+        :param displayID: The display the call is about, if any
+        :return: The display's state; raises DisplayError if it isn't online
+        """
+        with self.__lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if displayID is not None:
+            if displayID not in self.__displays:
+                raise DisplayError("Display with ID \"{}\" not found".format(displayID))
+            return self.__displays[displayID]
+
+    def __change(self, displayID, setting, value):
+        """
+        Changes one setting of an online display, and queues its reconfiguration callback (if it has one).
+        :return: An error, if the display isn't online
+        """
+        if displayID not in self.__displays:
+            return True
+        self.__displays[displayID][setting] = value
+        if setting in self.reconfiguringSettings:
+            self.__pending.append(displayID)
+        return 0
+
+    # Topology
+
+    def onlineDisplayIDs(self):
+        self.__call()
+        return list(self.__displays)
+
+    def mainDisplayID(self):
+        self.__call()
+        return self.__mainDisplayID
+
+    def identity(self, displayID):
+        return self.__call(displayID)["identity"]
+
+    # Modes
+
+    def currentMode(self, displayID):
+        return self.__call(displayID)["mode"]
+
+    def allModes(self, displayID):
+        return list(self.__call(displayID)["modes"])
+
+    # Settings
+
+    def rotation(self, displayID):
+        return self.__call(displayID)["rotation"]
+
+    def setRotation(self, displayID, angle):
+        self.__call()
+        return self.__change(displayID, "rotation", angle)
+
+    def brightness(self, displayID):
+        return self.__call(displayID)["brightness"]
+
+    def setBrightness(self, displayID, brightness):
+        self.__call()
+        return self.__change(displayID, "brightness", float(brightness))
+
+    def underscan(self, displayID):
+        return self.__call(displayID)["underscan"]
+
+    def setUnderscan(self, displayID, underscan):
+        self.__call()
+        return self.__change(displayID, "underscan", float(underscan))
+
+    def mirrorSource(self, displayID):
+        return self.__call(displayID)["mirrorSource"]
+
+    def origin(self, displayID):
+        return self.__call(displayID)["origin"]
+
+    # Configuration transactions
+
+    def beginConfiguration(self):
+        self.__call()
+        # The changes to make, as (displayID, setting, value)
+        return []
+
+    def configureMode(self, configRef, displayID, mode):
+        self.__call()
+        if displayID not in self.__displays or mode not in self.__displays[displayID]["modes"]:
+            return True
+        configRef.append((displayID, "mode", mode))
+        return 0
+
+    def configureMirror(self, configRef, displayID, sourceID):
+        self.__call()
+        if displayID not in self.__displays or (sourceID is not None and sourceID not in self.__displays):
+            return True
+        configRef.append((displayID, "mirrorSource", sourceID))
+        return 0
+
+    def configureOrigin(self, configRef, displayID, x, y):
+        self.__call()
+        if displayID not in self.__displays:
+            return True
+        configRef.append((displayID, "origin", (x, y)))
+        return 0
+
+    def completeConfiguration(self, configRef, option):
+        self.__call()
+        error = 0
+        for displayID, setting, value in configRef:
+            error = self.__change(displayID, setting, value) or error
+        return error
+
+    def cancelConfiguration(self, configRef):
+        self.__call()
+
+    # Reconfiguration callbacks
+
+    def registerReconfigurationCallback(self, callback):
+        self.__call()
+        self.__callbacks.append(callback)
+
+    def runLoop(self, wait):
+        if not self.__pending:
+            time.sleep(wait)
+
+        pending, self.__pending = self.__pending, []
+        for displayID in pending:
+            for callback in self.__callbacks:
+                callback(displayID)
+
+
+class DisplayServiceCache(object):
+    """
+    Caches each display's IOKit display service, keyed by displayID.
+
+    Where Quartz.CGDisplayIOServicePort (which is deprecated) still finds a display's service, that exact
+    service is used. Otherwise (e.g. on Apple silicon), services are found with a single walk of the IOKit
+    registry, matching each IODisplayConnect service's vendor, product, and serial number to those Quartz
+    reports for the online displays. Either way, the lookup is only made once per display, rather than for
+    every brightness, underscan, and rotation read or write.
+    """
+
+    # The keys of IODisplayCreateInfoDictionary's dictionary which identify a display. IOGraphicsLib.h
+    # #defines these (as kDisplayVendorID, etc.), so they can't be loaded from IOKit as variables.
+    identityKeys = ["DisplayVendorID", "DisplayProductID", "DisplaySerialNumber"]
+
+    def __init__(self, backend):
+        """
+        :param backend: The QuartzBackend whose displays' services are cached
+        """
+        self.__backend = backend
+        # displayID -> service (or None, if the last lookup found no service for that display)
+        self.__services = {}
+        # displayIDs whose services came from the registry walk, and so must be released when discarded
+        self.__owned = set()
+        # Number of registry walks performed
+        self.scans = 0
+        # Held while looking services up, so that displays configured at once don't each start a walk
+        self.__lock = threading.Lock()
+
+    def __contains__(self, displayID):
+        return displayID in self.__services
+
+    def get(self, displayID):
+        """
+        :param displayID: The display whose service is needed
+        :return: The IOKit service for displayID, or None if it has none
+        """
+        if displayID not in self.__services:
+            with self.__lock:
+                if displayID not in self.__services:
+                    self.__lookUp(displayID)
+        return self.__services.get(displayID)
+
+    def invalidate(self, displayID=None):
+        """
+        :param displayID: The display whose service should be discarded. If None, discards every display's service.
+        """
+        with self.__lock:
+            for discarded in list(self.__services) if displayID is None else [displayID]:
+                self.__release(discarded)
+
+    def __release(self, displayID):
+        """
+        Forgets displayID's service, releasing it if it was found by the registry walk
+        """
+        service = self.__services.pop(displayID, None)
+        if displayID in self.__owned:
+            self.__owned.discard(displayID)
+            if service:
+                getIOKit()["IOObjectRelease"](service)
+
+    def __lookUp(self, displayID):
+        """
+        Finds displayID's service, preferring Quartz's exact lookup to the registry walk
+        """
+        if hasattr(Quartz, "CGDisplayIOServicePort"):
+            service = Quartz.CGDisplayIOServicePort(displayID)
+            if service:
+                self.__services[displayID] = service
+                return
+        self.__scan()
+        # Until a service is found, the display has none
+        self.__services.setdefault(displayID, None)
+
+    def __scan(self):
+        """
+        Walks the IOKit registry once, and matches every display service found to an online display
+        which doesn't have one yet.
+        """
+        iokit = getIOKit()
+        self.scans += 1
+
+        # (vendor, product, serial) -> online displayIDs with that identity (and no service yet), in order
+        identities = {}
+        for displayID in self.__backend.onlineDisplayIDs():
+            if not self.__services.get(displayID):
+                identity = self.__backend.identity(displayID)
+                identities.setdefault(identity, []).append(displayID)
+
+        (error, iterator) = iokit["IOServiceGetMatchingServices"](
+            iokit["kIOMasterPortDefault"], iokit["IOServiceMatching"](b"IODisplayConnect"), None)
+        if error:
+            return
+
+        # kIODisplayOnlyPreferredName: don't bother localizing every product name
+        kIODisplayOnlyPreferredName = 0x00000200
+        service = iokit["IOIteratorNext"](iterator)
+        while service:
+            info = iokit["IODisplayCreateInfoDictionary"](service, kIODisplayOnlyPreferredName)
+            identity = tuple(int(info.get(key, 0)) for key in self.identityKeys)
+            # Identical displays without serial numbers can't be told apart, and are matched in order
+            if identities.get(identity):
+                displayID = identities[identity].pop(0)
+                self.__services[displayID] = service
+                self.__owned.add(displayID)
+            else:
+                iokit["IOObjectRelease"](service)
+            service = iokit["IOIteratorNext"](iterator)
+        iokit["IOObjectRelease"](iterator)
+
+
+def invalidateDisplayCaches(displayID=None):
+    """
+    Marks everything cached about the online displays as stale. Called automatically whenever
+    Quartz reports a display reconfiguration, and after Display Manager changes a configuration itself.
+
+    :param displayID: The display which changed. Its cached modes and service are discarded, along with
+        the current DisplaySnapshot. If None, every display's cached modes and service are discarded.
+    """
+    global topologyGeneration
+    with snapshotLock:
+        topologyGeneration += 1
+    modeCache.invalidate(displayID)
+    getBackend().invalidate(displayID)
+
+
+def getBackend():
+    """
+    :return: The DisplayBackend every Display is read and configured through. Unless one has been set with
+        setBackend, it is the one described by the DISPLAY_MANAGER_BACKEND environment variable (see
+        parseBackend), or a QuartzBackend.
+    """
+    global displayBackend
+
+    if displayBackend is None:
+        displayBackend = parseBackend(os.environ.get("DISPLAY_MANAGER_BACKEND", "quartz"))
+    return displayBackend
+
+
+def setBackend(backend):
+    """
+    Makes every Display read and configure through a different backend from now on.
+    :param backend: A DisplayBackend
+    """
+    global displayBackend, reconfigurationCallback
+
+    displayBackend = backend
+    # Keep recording calls, if they were being recorded
+    instrumentBackend()
+    # The callback was registered with the old backend, and everything cached was read from it
+    reconfigurationCallback = None
+    invalidateDisplayCaches()
+
+
+def parseBackend(spec):
+    """
+    :param spec: "quartz", or "simulated", optionally followed by a colon and comma-separated settings for
+        the SimulatedBackend (e.g. "simulated:displays=3,modes=200,latency=0.001")
+    :return: The DisplayBackend spec describes
+    """
+    name, _, settings = spec.partition(":")
+    if name == "quartz" and not settings:
+        return QuartzBackend()
+    elif name == "simulated":
+        kwargs = {}
+        for setting in settings.split(",") if settings else []:
+            key, _, value = setting.partition("=")
+            if key in ["displays", "modes"]:
+                kwargs[key] = int(value)
+            elif key == "latency":
+                kwargs[key] = float(value)
+            else:
+                raise ValueError("\"{}\" is not a simulated backend setting".format(key))
+        return SimulatedBackend(**kwargs)
+    else:
+        raise ValueError("\"{}\" is not a valid display backend".format(spec))
+
+
+class CallStats(object):
+    """
+    The number of calls made to one backend method (overall, or for one display), and how long they took.
+    """
+
+    # Upper bounds (in seconds) of the latency histogram's buckets; the last bucket holds anything slower
+    buckets = [0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0]
+    # Labels for the histogram's buckets, for reports
+    bucketLabels = ["<10us", "<100us", "<1ms", "<10ms", "<100ms", "<1s", ">=1s"]
+
+    __slots__ = ("count", "total", "maximum", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        # In seconds
+        self.total = 0.0
+        self.maximum = 0.0
+        # The number of calls which fell into each bucket
+        self.histogram = [0] * (len(self.buckets) + 1)
+
+    def record(self, elapsed):
+        """
+        :param elapsed: How long (in seconds) a call took
+        """
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.maximum:
+            self.maximum = elapsed
+        self.histogram[bisect.bisect_left(self.buckets, elapsed)] += 1
+
+    @property
+    def mean(self):
+        """
+        :return: The mean time (in seconds) a call took
+        """
+        return self.total / self.count if self.count else 0.0
+
+
+class DisplayStats(object):
+    """
+    Call counts and latencies for every backend method (and so for every Quartz and IOKit entry point
+    Display Manager uses), overall and per display. Collected while enableStats is in effect.
+    """
+
+    def __init__(self):
+        # method name -> CallStats
+        self.functions = collections.OrderedDict()
+        # (method name, displayID) -> CallStats
+        self.displays = collections.OrderedDict()
+        # Displays may be configured from several threads at once (see DisplayReconciler)
+        self.__lock = threading.Lock()
+
+    def record(self, function, displayID, elapsed):
+        """
+        :param function: The name of the backend method called
+        :param displayID: The display the call was about, or None
+        :param elapsed: How long (in seconds) the call took
+        """
+        with self.__lock:
+            if function not in self.functions:
+                self.functions[function] = CallStats()
+            self.functions[function].record(elapsed)
+
+            if displayID is not None:
+                key = (function, displayID)
+                if key not in self.displays:
+                    self.displays[key] = CallStats()
+                self.displays[key].record(elapsed)
+
+    def reset(self):
+        """
+        Discards everything recorded so far.
+        """
+        self.functions.clear()
+        self.displays.clear()
+
+    @property
+    def report(self):
+        """
+        :return: A table of the recorded calls, by method and by display
+        """
+        def row(name, callStats):
+            return "{:<32}{:>7}{:>12.3f}{:>10.3f}{:>10.3f}  {}".format(
+                name, callStats.count, callStats.total * 1000, callStats.mean * 1000, callStats.maximum * 1000,
+                " ".join("{}:{}".format(label, count)
+                         for label, count in zip(CallStats.bucketLabels, callStats.histogram) if count))
+
+        def header(name):
+            return "{:<32}{:>7}{:>12}{:>10}{:>10}  {}".format(
+                name, "calls", "total ms", "mean ms", "max ms", "latency histogram")
+
+        lines = [header("function")]
+        for function, callStats in self.functions.items():
+            lines.append(row(function, callStats))
+        lines.append("")
+        lines.append(header("function (displayID)"))
+        for (function, displayID), callStats in sorted(self.displays.items()):
+            lines.append(row("{} ({})".format(function, displayID), callStats))
+        return "\n".join(lines)
+
+
+class InstrumentedBackend(object):
+    """
+    Stands in for a DisplayBackend, recording every call made through it: how long it took (in a DisplayStats),
+    and what it was passed and returned (in a TraceLog). Only used while stats or tracing are enabled (see
+    enableStats and enableTrace), so that otherwise calls cost nothing extra.
+    """
+
+    # Backend methods which are about a single display, and the position of the displayID among their arguments
+    displayArguments = {
+        "identity": 0, "currentMode": 0, "allModes": 0, "rotation": 0, "setRotation": 0, "brightness": 0,
+        "setBrightness": 0, "underscan": 0, "setUnderscan": 0, "mirrorSource": 0, "origin": 0,
+        "configureMode": 1, "configureMirror": 1, "configureOrigin": 1,
+    }
+    # Backend methods which spend their time waiting (or just dropping caches), rather than talking to displays
+    untimed = ["runLoop", "invalidate"]
+
+    def __init__(self, backend, stats=None, trace=None):
+        """
+        :param backend: The DisplayBackend to instrument
+        :param stats: The DisplayStats to record call latencies in, or None
+        :param trace: The TraceLog to record calls in, or None
+        """
+        self.backend = backend
+        self.stats = stats
+        self.trace = trace
+
+    def __getattr__(self, name):
+        """
+        Wraps one of the backend's methods (the first time it is used) so that its calls are recorded.
+        """
+        attribute = getattr(self.backend, name)
+        if not callable(attribute) or name.startswith("_") or name in self.untimed:
+            return attribute
+
+        position = self.displayArguments.get(name)
+
+        def instrumented(*args, **kwargs):
+            start = time.perf_counter()
+            result = None
+            error = None
+            try:
+                result = attribute(*args, **kwargs)
+                return result
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                displayID = args[position] if position is not None and len(args) > position else None
+                if self.stats is not None:
+                    self.stats.record(name, displayID, elapsed)
+                if self.trace is not None:
+                    self.trace.write(
+                        "call",
+                        function=name,
+                        displayID=displayID,
+                        args=args,
+                        # Long results (e.g. every mode a display has) are only counted
+                        result={"count": len(result)} if isinstance(result, list) else result,
+                        error=repr(error) if error is not None else None,
+                        elapsed=elapsed,
+                    )
+
+        setattr(self, name, instrumented)
+        return instrumented
+
+
+def instrumentBackend():
+    """
+    Wraps the backend in an InstrumentedBackend while stats or tracing are enabled, and unwraps it otherwise.
+    """
+    global displayBackend
+
+    backend = getBackend()
+    if isinstance(backend, InstrumentedBackend):
+        backend = backend.backend
+    if displayStats is not None or traceLog is not None:
+        backend = InstrumentedBackend(backend, displayStats, traceLog)
+    displayBackend = backend
+
+
+def enableStats():
+    """
+    Starts recording every call made to the backend (see DisplayStats). Does nothing if already recording.
+    :return: The DisplayStats calls are recorded in
+    """
+    global displayStats
+
+    if displayStats is None:
+        displayStats = DisplayStats()
+        instrumentBackend()
+    return displayStats
+
+
+def disableStats():
+    """
+    Stops recording calls made to the backend.
+    :return: The DisplayStats calls were recorded in, or None if they weren't being recorded
+    """
+    global displayStats
+
+    stats = displayStats
+    if stats is not None:
+        displayStats = None
+        instrumentBackend()
+    return stats
+
+
+def getStats():
+    """
+    :return: The DisplayStats calls are being recorded in, or None if they aren't being recorded
+    """
+    return displayStats
+
+
+class TraceLog(object):
+    """
+    Writes a machine-readable trace of what Display Manager does, as JSON lines.
+
+    Every record has the time it was made ("ts", in seconds since the epoch), the host, process, and session
+    (unique to this TraceLog) it came from, a sequence number, and an "event": "command" (a Command and the
+    displays it resolved to), "operation" (a change which was applied or skipped), "call" (a call to the
+    backend, with its arguments, result, and duration), "run" (the outcome of running commands), or "error".
+    This makes traces from any number of machines straightforward to merge and aggregate.
+
+    Records are buffered, and only written once bufferSize of them have accumulated (or the trace is flushed,
+    which happens automatically when the process exits).
+    """
+
+    # The version of the records' format
+    schema = 1
+    # How many records are held before being written
+    bufferSize = 256
+
+    def __init__(self, stream):
+        """
+        :param stream: A text file to write records to (e.g. sys.stderr)
+        """
+        # Only needed while tracing, so there's no need to import them up front
+        import json
+        import socket
+        import uuid
+
+        self.stream = stream
+        self.__encoder = json.JSONEncoder(default=self.__encode, separators=(",", ":"))
+        self.__context = {
+            "schema": self.schema,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "session": uuid.uuid4().hex,
+        }
+        self.__sequence = 0
+        # Encoded records which haven't been written yet
+        self.__lines = []
+        # Displays may be configured from several threads at once (see DisplayReconciler)
+        self.__lock = threading.Lock()
+
+        atexit.register(self.flush)
+
+    def write(self, event, **fields):
+        """
+        Records an event.
+        :param event: The type of event
+        :param fields: Anything else to record about the event; Displays, DisplayModes, and DisplayOperations
+            are recorded by value
+        """
+        # Encoding happens outside the lock, so that nothing it does can wait on the lock held by this thread
+        record = dict(self.__context)
+        record.update(fields)
+        body = self.__encoder.encode(record)
+        timestamp = time.time()
+
+        with self.__lock:
+            # The sequence number is only known once the lock is held, so it is spliced onto the front
+            head = self.__encoder.encode({"ts": timestamp, "seq": self.__sequence, "event": event})
+            self.__sequence += 1
+
+            self.__lines.append(head[:-1] + "," + body[1:])
+            if len(self.__lines) >= self.bufferSize:
+                self.__write()
+
+    def flush(self):
+        """
+        Writes every buffered record.
+        """
+        with self.__lock:
+            self.__write()
+
+    def __write(self):
+        """
+        Writes every buffered record (while holding the lock).
+        """
+        if self.__lines:
+            self.stream.write("\n".join(self.__lines) + "\n")
+            self.__lines = []
+        self.stream.flush()
+
+    def close(self):
+        """
+        Writes every buffered record. Nothing is written once the process exits, so the stream can be closed.
+        """
+        self.flush()
+        atexit.unregister(self.flush)
+
+    @staticmethod
+    def __encode(value):
+        """
+        :return: A JSON-compatible representation of value, which the JSON encoder can't handle itself
+        """
+        if isinstance(value, AbstractDisplay):
+            # The tag comes from the snapshot in hand, since looking it up could call (and trace) the backend
+            snapshot = displaySnapshot
+            return {"displayID": value.displayID, "tag": snapshot.tagOf(value) if snapshot is not None else None}
+        elif isinstance(value, AbstractDisplayMode):
+            return {"width": value.width, "height": value.height, "refresh": value.refresh, "hidpi": value.hidpi}
+        else:
+            return repr(value)
+
+
+def enableTrace(stream):
+    """
+    Starts tracing what Display Manager does (see TraceLog). Does nothing if already tracing.
+    :param stream: A text file to write the trace to
+    :return: The TraceLog the trace is written to
+    """
+    global traceLog
+
+    if traceLog is None:
+        traceLog = TraceLog(stream)
+        instrumentBackend()
+    return traceLog
+
+
+def disableTrace():
+    """
+    Stops tracing, writing out anything still buffered.
+    :return: The TraceLog the trace was written to, or None if there wasn't one
+    """
+    global traceLog
+
+    log = traceLog
+    if log is not None:
+        log.close()
+        traceLog = None
+        instrumentBackend()
+    return log
+
+
+def getTrace():
+    """
+    :return: The TraceLog being written to, or None if Display Manager isn't being traced
+    """
+    return traceLog
+
+
+def trace(event, **fields):
+    """
+    Records an event in the trace, if Display Manager is being traced (see TraceLog.write).
+    """
+    if traceLog is not None:
+        traceLog.write(event, **fields)
+
+
+def registerReconfigurationCallback():
+    """
+    Registers (once) a Quartz callback which invalidates the display caches whenever the display
+    topology or configuration changes (e.g. displays are connected, disconnected, mirrored, or set to a new mode),
+    and passes the change on to any DisplayWatchers.
+    """
+    global reconfigurationCallback
+
+    if reconfigurationCallback is None:
+        def onReconfiguration(displayID):
+            invalidateDisplayCaches(displayID)
+            for watcher in list(reconfigurationWatchers):
+                watcher.notify(displayID)
+
+        reconfigurationCallback = onReconfiguration
+        getBackend().registerReconfigurationCallback(reconfigurationCallback)
+
+
+class DisplayEvent(collections.namedtuple("DisplayEvent", ["added", "removed", "changed", "generation"])):
+    """
+    A settled burst of display reconfigurations, as published by a DisplayWatcher.
+
+    Fields:
+        added: frozenset of the displayIDs which came online
+        removed: frozenset of the displayIDs which went offline
+        changed: frozenset of the displayIDs which stayed online, but were reconfigured
+            (e.g. set to a new mode, mirrored, or moved)
+        generation: The topologyGeneration once the burst had settled
+    """
+
+    __slots__ = ()
+
+
+class DisplayWatcher(object):
+    """
+    Publishes display reconfigurations (displays being connected, disconnected, set to a new mode, etc.)
+    as DisplayEvents, so that nothing has to poll getAllDisplays() to notice them.
+
+    Quartz reports each reconfiguration with several callbacks (one per display, per step), and
+    reconnecting a dock can produce dozens of them within a second. The watcher collects callbacks until
+    none have arrived for "delay" seconds, and then publishes the whole burst as a single DisplayEvent,
+    by comparing the displays which were online before it with those online after it. Display Manager's
+    caches are invalidated by the same callbacks, so Displays read in response to an event already
+    reflect the new configuration.
+
+    Events are passed to "callback" (if given), and returned by poll(), by iteration
+    ("for event in watcher"), and by asynchronous iteration ("async for event in watcher").
+
+    Quartz only delivers reconfiguration callbacks while the main thread's run loop is running. poll()
+    and iteration run it themselves; an application with its own run loop (e.g. a GUI) should call
+    poll(0) periodically to publish events which have settled.
+    """
+
+    # How often (in seconds) asynchronous iteration checks for events
+    asyncInterval = 0.1
+    # The longest (in seconds) poll() runs the run loop at a time, so that it notices settled bursts
+    maxWait = 1.0
+
+    def __init__(self, callback=None, delay=0.5):
+        """
+        :param callback: A function to call with each DisplayEvent, or None
+        :param delay: How long (in seconds) a burst of callbacks must be quiet before it is published
+        """
+        self.callback = callback
+        self.delay = delay
+
+        # Settled events, waiting to be returned by poll()
+        self.__events = collections.deque()
+        # The displayIDs which have been reconfigured during the current burst
+        self.__changedIDs = set()
+        # When the current burst will be considered settled (None if there isn't one)
+        self.__deadline = None
+        # The displayIDs which were online as of the last published event (None if not watching)
+        self.__onlineIDs = None
+        # Held while the current burst changes, since callbacks may arrive on a different thread than publish()
+        self.__lock = threading.Lock()
+
+    # Watching
+
+    @property
+    def watching(self):
+        """
+        :return: Whether this watcher is receiving reconfiguration callbacks
+        """
+        return self in reconfigurationWatchers
+
+    def start(self):
+        """
+        Starts receiving reconfiguration callbacks. Called automatically by poll() and iteration.
+        """
+        if not self.watching:
+            registerReconfigurationCallback()
+            self.__onlineIDs = self.__currentIDs()
+            reconfigurationWatchers.append(self)
+
+    def stop(self):
+        """
+        Stops receiving reconfiguration callbacks, discarding any burst in progress.
+        """
+        if self.watching:
+            reconfigurationWatchers.remove(self)
+        self.__changedIDs.clear()
+        self.__deadline = None
+
+    def notify(self, displayID):
+        """
+        Records one reconfiguration callback (see registerReconfigurationCallback).
+        :param displayID: The display which was reconfigured
+        """
+        with self.__lock:
+            self.__changedIDs.add(displayID)
+            self.__deadline = time.time() + self.delay
+
+    # Publishing
+
+    @property
+    def settled(self):
+        """
+        :return: Whether the current burst has been quiet for long enough to be published
+        """
+        deadline = self.__deadline
+        return deadline is not None and time.time() >= deadline
+
+    def poll(self, timeout=0):
+        """
+        Runs the run loop until an event has settled, or timeout has passed.
+        :param timeout: How long (in seconds) to wait for an event; if None, waits indefinitely
+        :return: The next DisplayEvent, or None if none settled in time
+        """
+        self.start()
+        end = None if timeout is None else time.time() + timeout
+
+        while True:
+            # Wait no longer than needed for the timeout to pass, or for the current burst to settle
+            now = time.time()
+            wait = self.maxWait
+            if end is not None:
+                wait = min(wait, end - now)
+            if self.__deadline is not None:
+                wait = min(wait, self.__deadline - now)
+            self.__runLoop(max(wait, 0))
+
+            event = self.publish()
+            if event is not None:
+                return event
+
+            if end is not None and time.time() >= end:
+                return None
+
+    def publish(self):
+        """
+        Publishes the current burst, if it has settled, without running the run loop (for applications which
+        run it themselves, e.g. on another thread).
+        :return: The next DisplayEvent, or None if none has settled
+        """
+        self.__settle()
+        if self.__events:
+            event = self.__events.popleft()
+            if self.callback is not None:
+                self.callback(event)
+            return event
+        return None
+
+    def run(self):
+        """
+        Publishes events to the callback until stop() is called (e.g. by the callback).
+        """
+        self.start()
+        while self.watching:
+            self.poll(self.maxWait)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.poll(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # Only needed by asynchronous iteration, so there's no need to import it up front
+        import asyncio
+
+        while True:
+            event = self.poll(0)
+            if event is not None:
+                return event
+            await asyncio.sleep(self.asyncInterval)
+
+    def __settle(self):
+        """
+        If the current burst has been quiet for long enough, turns it into a DisplayEvent.
+        """
+        with self.__lock:
+            if not self.settled:
+                return
+            changedIDs = self.__changedIDs
+            self.__changedIDs = set()
+            self.__deadline = None
+
+        onlineIDs = self.__currentIDs()
+        self.__events.append(DisplayEvent(
+            added=frozenset(onlineIDs - self.__onlineIDs),
+            removed=frozenset(self.__onlineIDs - onlineIDs),
+            changed=frozenset(changedIDs & self.__onlineIDs & onlineIDs),
+            generation=topologyGeneration,
+        ))
+        self.__onlineIDs = onlineIDs
+
+    @staticmethod
+    def __currentIDs():
+        """
+        :return: The set of online displayIDs
+        """
+        return set(display.displayID for display in refreshDisplaySnapshot().displays)
+
+    @staticmethod
+    def __runLoop(wait):
+        """
+        Runs the current thread's run loop, so that the backend can deliver reconfiguration callbacks.
+        :param wait: The longest (in seconds) to run it for
+        """
+        getBackend().runLoop(wait)
+
+
+def getMainDisplay():
+    """
+    :return: The main Display.
+    """
+    return refreshDisplaySnapshot().main
+
+
+def getAllDisplays():
+    """
+    :return: A list containing all currently-online displays.
+    """
+    return list(refreshDisplaySnapshot().displays)
+
+
+class IOKitBindings(dict):
+    """
+    A dictionary of the IOKit functions and variables Display Manager uses.
+
+    IOKit is not natively bridged in PyObjC, so the methods must be found and encoded manually to gain
+    their functionality in Python. Each one is found and encoded the first time it is looked up, so
+    that nothing is loaded from IOKit until it is actually needed.
+    """
+
+    # The IOKit functions which may be retrieved, and their signatures
+    functions = {
+        "IOServiceGetMatchingServices": b"iI@o^I",
+        "IOServiceMatching": b"@*",
+        "IOObjectRelease": b"iI",
+        "IODisplayCreateInfoDictionary": b"@II",
+        "IODisplayGetFloatParameter": b"iII@o^f",
+        "IODisplaySetFloatParameter": b"iII@f",
+        "IOServiceRequestProbe": b"iII",
+        "IOIteratorNext": b"II",
+    }
+
+    # The IOKit variables which may be retrieved, and their types
+    variables = {
+        "kIODisplayNoProductName": b"I",
+        "kIOMasterPortDefault": b"I",
+        "kIODisplayOverscanKey": b"*",
+    }
+
+    # A few IOKit variables that have been deprecated, but whose values
+    # still work as intended in IOKit functions
+    deprecatedVariables = {
+        "kDisplayBrightness": "brightness",
+        "kDisplayUnderscan": "pscn",
+    }
+
+    def __init__(self):
+        dict.__init__(self)
+        self.__bundle = None
+
+    def __missing__(self, key):
+        """
+        Retrieves the IOKit function or variable "key" the first time it is looked up.
+        """
+        if key in self.deprecatedVariables:
+            value = CoreFoundation.CFSTR(self.deprecatedVariables[key])
+
+        elif key in self.functions or key in self.variables:
+            # PyObjC sometimes raises compatibility warnings in macOS 10.14 relating to parts of IOKit that
+            # Display Manager doesn't use. Thus, such warnings will be ignored while loading from IOKit
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+
+                if key in self.functions:
+                    bound = {}
+                    objc.loadBundleFunctions(self.__getBundle(), bound, [(key, self.functions[key])])
+                else:
+                    # Bridge won't put variables straight into a dictionary of our own, so globals()
+                    bound = globals()
+                    objc.loadBundleVariables(self.__getBundle(), bound, [(key, self.variables[key])])
+
+            if key not in bound:
+                raise KeyError(key)
+            value = bound[key]
+
+        else:
+            raise KeyError(key)
+
+        self[key] = value
+        return value
+
+    def __getBundle(self):
+        """
+        :return: The IOKit framework, which is retrieved the first time it is needed
+        """
+        if self.__bundle is None:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                self.__bundle = objc.initFrameworkWrapper(
+                    "IOKit",
+                    frameworkIdentifier="com.apple.iokit",
+                    frameworkPath=objc.pathForFramework("/System/Library/Frameworks/IOKit.framework"),
+                    globals=globals()
+                )
+        return self.__bundle
+
+
+# Configured for global usage; IOKit functions and variables are retrieved the first time each is used
+iokit = IOKitBindings()
+
+
+def getIOKit():
+    """
+    This handles the importing of specific functions and variables from the
+    IOKit framework. IOKit is not natively bridged in PyObjC, so the methods
+    must be found and encoded manually to gain their functionality in Python.
+
+    Each function and variable is only retrieved the first time it is looked up.
+
+    :return: A dictionary containing several IOKit functions and variables.
+    """
     return iokit
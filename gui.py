@@ -18,6 +18,7 @@
 # Display Manager, version 1.0.1
 # Graphical User Interface
 
+import sys
 import os
 import tkinter as tk
 from tkinter import ttk
@@ -34,6 +35,11 @@ class App(object):
         self.root = tk.Tk()
         self.root.title("Display Manager")
 
+        # The DisplayState of the currently selected display, as of the last reload
+        self.state = None
+        # Reloads the window whenever displays are connected or disconnected
+        self.watcher = DisplayWatcher(self.__onDisplayEvent)
+
         self.mainFrame = ttk.Frame(self.root)
 
         # Set up the window
@@ -203,18 +209,23 @@ class App(object):
         ttk.Button(self.mainFrame, text="Build Script", command=self.buildScript).grid(column=7, row=70, sticky=tk.E)
         ttk.Separator(self.mainFrame, orient=tk.HORIZONTAL).grid(row=79, columnspan=8, sticky=tk.EW)
 
-    def __displaySelectionInit(self):
+    def __displaySelectionInit(self, selectedID=None):
         """
         Add all connected displays to self.displayDropdown.
+        :param selectedID: The displayID (as a string) to select, if it's still connected; otherwise, the first
+            display is selected
         """
         displayStrings = []
+        selected = 0
         for display in getAllDisplays():
             displayID = str(display.displayID)
             self.displayDict[displayID] = display
+            if displayID == selectedID:
+                selected = len(displayStrings)
             displayStrings.append(displayID + " (Main Display)" if display.isMain else displayID)
 
         self.displayDropdown["values"] = displayStrings
-        self.displayDropdown.current(0)
+        self.displayDropdown.current(selected)
         self.displayDropdown.bind("<<ComboboxSelected>>", lambda event: self.__reloadDisplay())
 
     def __modeSelectionInit(self):
@@ -223,14 +234,14 @@ class App(object):
         """
         # Add self.display's DisplayModes to self.modeDropdown in reverse sorted order
         sortedModeStrings = []
-        for mode in sorted(self.display.allModes, reverse=True):
+        for mode in self.display.modeCatalog.modes:
             modeString = mode.__str__()
             self.modeDict[modeString] = mode
             sortedModeStrings.append(modeString)
         self.modeDropdown["values"] = sortedModeStrings
 
         # Set the default mode to the current mode, if possible
-        currentModeString = self.display.currentMode.__str__()
+        currentModeString = self.state.mode.__str__()
         if currentModeString in self.modeDropdown["values"]:
             self.modeDropdown.current(self.modeDropdown["values"].index(currentModeString))
         else:
@@ -241,8 +252,8 @@ class App(object):
         Set self.rotateSlider's value to that of the currently selected display, and
         deactivates said slider if the rotation of this display can't be set.
         """
-        if self.display.rotation is not None:
-            rotation = self.display.rotation
+        if self.state.rotation is not None:
+            rotation = self.state.rotation
             self.rotateSlider.set(rotation)
             self.rotateSlider.configure(state=tk.NORMAL)
         else:
@@ -254,8 +265,8 @@ class App(object):
         Set self.brightnessSlider's value to that of the currently selected display, and
         deactivates said slider if the brightness of this display can't be set.
         """
-        if self.display.brightness is not None:
-            brightness = self.display.brightness * 100
+        if self.state.brightness is not None:
+            brightness = self.state.brightness * 100
             self.brightnessSlider.set(brightness)
             self.brightnessSlider.configure(state=tk.NORMAL)
         else:
@@ -267,8 +278,8 @@ class App(object):
         Sets self.underscanSlider's value to that of the currently selected display, and
         deactivates said slider if the underscan of this display can't be set.
         """
-        if self.display.underscan is not None:
-            underscan = abs(self.display.underscan - 1) * 100
+        if self.state.underscan is not None:
+            underscan = abs(self.state.underscan - 1) * 100
             self.underscanSlider.set(underscan)
             self.underscanSlider.configure(state=tk.NORMAL)
         else:
@@ -414,11 +425,11 @@ class App(object):
             underscan=self.underscan,
             scope=self.display,
         )
-        if self.display.rotation is not None:
+        if self.state.rotation is not None:
             commands.append(rotate)
-        if self.display.brightness is not None:
+        if self.state.brightness is not None:
             commands.append(brightness)
-        if self.display.underscan is not None:
+        if self.state.underscan is not None:
             commands.append(underscan)
 
         return CommandList(commands)
@@ -427,6 +438,9 @@ class App(object):
         """
         Reloads data-containing elements.
         """
+        # Read all of the selected display's settings at once
+        self.state = self.display.snapshot()
+
         self.__modeSelectionInit()
         self.__rotateSelectionInit()
         self.__brightnessSelectionInit()
@@ -435,19 +449,59 @@ class App(object):
 
         self.mirrorEnabled.set(False)  # resets every time the display is switched
 
+    def __reloadDisplays(self):
+        """
+        Reloads the list of displays, along with the selected display's data-containing elements.
+        The selected display stays selected, if it's still connected.
+        """
+        selectedID = re.search(r"^[0-9]*", self.displayDropdown.get()).group()
+        self.displayDict = {}
+        self.__displaySelectionInit(selectedID)
+        self.__reloadDisplay()
+
+    def __onDisplayEvent(self, event):
+        """
+        Reloads the list of displays when displays are connected or disconnected. Displays which were only
+        reconfigured (e.g. by "Set Display", which reloads the display itself) are left alone, so that the
+        selection and any unsaved changes to it aren't lost.
+        :param event: A DisplayEvent, as published by self.watcher
+        """
+        if event.added or event.removed:
+            self.__reloadDisplays()
+
+    def __watchDisplays(self):
+        """
+        Publishes any settled display reconfigurations, and schedules itself to run again.
+        """
+        self.watcher.poll(0)
+        self.root.after(250, self.__watchDisplays)
+
     def start(self):
         """
         Open the GUI.
         """
         self.__displaySelectionInit()
         self.__reloadDisplay()
+        self.__watchDisplays()
 
         self.root.mainloop()
 
 
 def main():
-    view = App()
-    view.start()
+    try:
+        options, args = parseOptions(sys.argv[1:])
+    except CommandSyntaxError as e:
+        print("Error: {}".format(e.message))
+        raise SystemExit()
+    # Trace everything done through the GUI, until it's closed
+    if "trace" in options and not startTrace(options["trace"]):
+        raise SystemExit()
+
+    try:
+        view = App()
+        view.start()
+    finally:
+        stopTrace()
 
 
 if __name__ == "__main__":
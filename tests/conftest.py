@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository, rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import display_manager_lib  # noqa: E402
+
+
+@pytest.fixture
+def backend():
+    """
+    :return: A SimulatedBackend with three displays, which every Display is read and configured through
+    """
+    simulated = display_manager_lib.SimulatedBackend(displays=3, modes=20)
+    display_manager_lib.setBackend(simulated)
+    return simulated
@@ -0,0 +1,96 @@
+import json
+import os
+import stat
+import threading
+
+import pytest
+
+from display_manager import Agent, agentIsRunning, sendToAgent
+
+
+@pytest.fixture
+def agent(backend, tmp_path):
+    """
+    :return: An Agent serving (on another thread) at a socket in a temporary directory
+    """
+    server = Agent(str(tmp_path / "agent.sock"))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join(10)
+
+
+def send(agent, capsys, *args):
+    """
+    :return: Whether the agent ran the commands successfully, and what they printed
+    """
+    capsys.readouterr()
+    ok = sendToAgent(agent.path, list(args))
+    return ok, capsys.readouterr().out
+
+
+def testSocketIsPrivate(agent):
+    mode = os.stat(agent.path).st_mode
+    assert stat.S_ISSOCK(mode)
+    assert stat.S_IMODE(mode) == 0o600
+    assert agentIsRunning(agent.path)
+
+
+def testRoundTrip(agent, capsys):
+    ok, output = send(agent, capsys, "brightness", ".5", "main")
+    assert ok and output == ""
+
+    ok, output = send(agent, capsys, "show", "--format", "json", "main")
+    assert ok
+    displays = json.loads(output)["displays"]
+    assert [display["tag"] for display in displays] == ["main"]
+    assert displays[0]["brightness"] == 0.5
+
+
+def testErrorsAreReturned(agent, capsys):
+    ok, output = send(agent, capsys, "brightness", "main")
+    assert not ok
+    assert "Brightness commands must specify a brightness value" in output
+
+
+def testAlreadyRunning(agent):
+    with pytest.raises(OSError) as e:
+        Agent(agent.path)
+    assert "already running" in str(e.value)
+    # The running agent's socket is left alone
+    assert agentIsRunning(agent.path)
+
+
+def testStaleSocketIsReplaced(backend, tmp_path):
+    path = str(tmp_path / "agent.sock")
+    Agent(path).server_close()
+    assert os.path.exists(path) and not agentIsRunning(path)
+
+    server = Agent(path)
+    try:
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    finally:
+        server.server_close()
+
+
+def testTracedRequestsDontStopTheAgent(agent, tmp_path, capsys):
+    trace = str(tmp_path / "trace.jsonl")
+    results = []
+    thread = threading.Thread(target=lambda: results.append(
+        send(agent, capsys, "--trace", trace, "brightness", ".25", "all", "show", "main")))
+    thread.daemon = True
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive(), "traced request did not finish"
+    assert results[0][0]
+
+    with open(trace) as f:
+        assert any(json.loads(line)["event"] == "run" for line in f)
+
+    # Later requests (traced or not) are still served
+    ok, output = send(agent, capsys, "show", "--format", "json", "all")
+    assert ok
+    assert [display["brightness"] for display in json.loads(output)["displays"]] == [0.25, 0.25, 0.25]
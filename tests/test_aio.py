@@ -0,0 +1,49 @@
+import asyncio
+
+import display_manager_aio as aio
+
+
+def testWatchDisplays(backend):
+    async def watch():
+        watcher = aio.watchDisplays(delay=0.05)
+        try:
+            await watcher.start()
+            displays = await aio.getAllDisplays()
+            assert len(displays) == 3
+
+            loop = asyncio.get_running_loop()
+            displayID = await loop.run_in_executor(None, backend.connect)
+            added = await asyncio.wait_for(watcher.__anext__(), 5)
+            assert added.added == frozenset([displayID]) and not added.removed
+            assert len(await aio.getAllDisplays()) == 4
+
+            await loop.run_in_executor(None, backend.disconnect, displayID)
+            removed = await asyncio.wait_for(watcher.__anext__(), 5)
+            assert removed.removed == frozenset([displayID]) and not removed.added
+            assert len(await aio.getAllDisplays()) == 3
+        finally:
+            watcher.stop()
+
+    asyncio.run(watch())
+
+
+def testConcurrentReadsShareOneCall(backend):
+    async def read():
+        display = (await aio.getAllDisplays())[0]
+        first, second = await asyncio.gather(display.allModes(), display.allModes())
+        # Each awaiter gets its own list, with the same modes
+        assert first == second and first is not second
+
+        states = await asyncio.gather(*[display.snapshot() for i in range(5)])
+        assert len(set(state.brightness for state in states)) == 1
+
+    asyncio.run(read())
+
+
+def testChangesAreSeenByLaterReads(backend):
+    async def change():
+        display = (await aio.getAllDisplays())[1]
+        await display.setBrightness(0.25)
+        assert (await display.snapshot()).brightness == 0.25
+
+    asyncio.run(change())
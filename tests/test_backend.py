@@ -0,0 +1,34 @@
+from display_manager_lib import getMainDisplay
+
+
+def watch(backend):
+    """
+    :return: A list which the displayIDs of reconfiguration callbacks are appended to, once they're delivered
+    """
+    displayIDs = []
+    backend.registerReconfigurationCallback(displayIDs.append)
+    return displayIDs
+
+
+def testBrightnessAndUnderscanDontReconfigure(backend):
+    delivered = watch(backend)
+    backend.setBrightness(1, 0.5)
+    backend.setUnderscan(2, 0.5)
+    backend.runLoop(0)
+    assert delivered == []
+
+
+def testReconfigurationsAreQueued(backend):
+    delivered = watch(backend)
+    main = getMainDisplay()
+    mode = [mode for mode in main.allModes if mode != main.currentMode][0]
+    backend.setRotation(2, 90)
+    main.setMode(mode)
+    assert delivered == []
+    backend.runLoop(0)
+    assert delivered == [2, 1]
+
+    displayID = backend.connect()
+    backend.disconnect(displayID)
+    backend.runLoop(0)
+    assert delivered == [2, 1, displayID, displayID]
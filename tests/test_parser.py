@@ -0,0 +1,171 @@
+import os
+
+import pytest
+
+from display_manager import (
+    Command, CommandExecutionError, CommandSyntaxError, CommandValueError, parseCommands, runCommandStream,
+)
+from display_manager_lib import getAllDisplays, getMainDisplay
+
+
+def parseOne(commandString):
+    commands = parseCommands(commandString).commands
+    assert len(commands) == 1
+    return commands[0]
+
+
+def parseError(commandString):
+    with pytest.raises((CommandSyntaxError, CommandValueError)) as info:
+        parseCommands(commandString)
+    return info.value
+
+
+# Parsing
+
+@pytest.mark.parametrize("commandString, attributes", [
+    ("show", {"subcommand": "current", "scope": None, "hidpi": 0}),
+    ("show available no-hidpi main ext0", {"subcommand": "available", "scope": ("main", "ext0"), "hidpi": 1}),
+    ("show highest only-hidpi all", {"subcommand": "highest", "scope": ("all",), "hidpi": 2}),
+    ("res 1920 1080", {"width": 1920, "height": 1080, "refresh": None, "scope": None}),
+    ("res 1920 1080 60 only-hidpi all", {"width": 1920, "height": 1080, "refresh": 60, "hidpi": 2, "scope": ("all",)}),
+    ("res highest", {"subcommand": "highest", "refresh": None}),
+    ("res highest 60", {"subcommand": "highest", "refresh": 60}),
+    ("res default 75 ext1", {"subcommand": "default", "refresh": 75, "scope": ("ext1",)}),
+    ("rotate 90 ext0", {"angle": 90, "scope": ("ext0",)}),
+    ("rotate -90", {"angle": -90}),
+    ("brightness .4 main", {"brightness": 0.4, "scope": ("main",)}),
+    ("underscan 0", {"underscan": 0.0, "scope": None}),
+    ("mirror enable main ext0 ext1", {"subcommand": "enable", "source": "main", "scope": ("ext0", "ext1")}),
+    ("mirror disable", {"subcommand": "disable", "scope": None}),
+    ("mirror disable ext1", {"subcommand": "disable", "scope": ("ext1",)}),
+    ("help", {"subcommand": "usage"}),
+    ("help res", {"subcommand": "res"}),
+])
+def testParse(commandString, attributes):
+    command = parseOne(commandString)
+    assert command.verb == commandString.split()[0]
+    for name, value in attributes.items():
+        assert getattr(command, name) == value, name
+
+
+def testParseSeveral():
+    commands = parseCommands("brightness .4 main underscan 0 all show ext0").commands
+    assert [command.verb for command in commands] == ["brightness", "underscan", "show"]
+    assert [command.scope for command in commands] == [("main",), ("all",), ("ext0",)]
+
+
+def testParseDoesNotReadDisplays(backend):
+    calls = backend.calls
+    parseCommands("res highest ext7 brightness 1 all mirror enable ext3 ext4")
+    assert backend.calls == calls
+
+
+# Errors, and where they are reported
+
+@pytest.mark.parametrize("commandString, errorType, verb, position, message", [
+    # Scope tags must come after everything else
+    ("res 1920 main 1080", CommandSyntaxError, "res", 9, "Invalid placement of main"),
+    ("show main available", CommandSyntaxError, "show", 5, "Invalid placement of main"),
+    # HiDPI conflicts
+    ("res highest no-hidpi only-hidpi main", CommandValueError, "res", 21,
+     "Cannot specify both \"no-hidpi\" and \"only-hidpi\""),
+    ("show available only-hidpi no-hidpi", CommandValueError, "show", 26,
+     "Cannot specify both \"no-hidpi\" and \"only-hidpi\""),
+    # "default" and "highest" take only a refresh rate
+    ("res default abc", CommandValueError, "res", 12, "\"abc\" is not a valid refresh rate"),
+    ("res default -5", CommandValueError, "res", 12, "Refresh rate must be positive"),
+    ("res highest 60 75", CommandValueError, "res", 4, "\"highest\"x\"60\" is not a valid resolution"),
+    # Resolutions
+    ("res", CommandSyntaxError, "res", 3, "Res commands must specify a resolution"),
+    ("res 1920", CommandValueError, "res", 4,
+     "Res commands must either specify both width and height or use the \"highest\" keyword"),
+    ("res 1920 x", CommandValueError, "res", 9, "\"x\" is not a valid height"),
+    ("res a b c", CommandValueError, "res", 4,
+     "\"a\"x\"b\" is not a valid resolution, and \"c\" is not a valid refresh rate"),
+    ("res 1920 1080 60 30", CommandSyntaxError, "res", 17, "Too many arguments supplied for the res command"),
+    # Mirroring's source and targets
+    ("mirror enable main", CommandSyntaxError, "mirror", 18,
+     "Mirror enable commands require at least one source and one target display"),
+    ("mirror enable all ext0", CommandValueError, "mirror", 14, "The source for mirror enable cannot be \"all\""),
+    ("mirror enable x main ext0", CommandValueError, "mirror", 14, "\"x\" is not a valid source or target"),
+    ("mirror disable foo", CommandValueError, "mirror", 15, "\"foo\" is not a valid scope"),
+    ("mirror", CommandSyntaxError, "mirror", 6, "Mirror commands must specify a subcommand"),
+    ("mirror flip", CommandValueError, "mirror", 7, "\"flip\" is not a valid subcommand"),
+    # Values
+    ("rotate 45", CommandValueError, "rotate", 7, "\"45\" is not a multiple of 90"),
+    ("brightness 1.5", CommandValueError, "brightness", 11, "\"1.5\" is not a number between 0 and 1 (inclusive)"),
+    ("brightness", CommandSyntaxError, "brightness", 10, "Brightness commands must specify a brightness value"),
+    ("underscan 0 1", CommandSyntaxError, "underscan", 12, "Underscan commands can only have one argument"),
+    # Commands
+    ("show current highest", CommandSyntaxError, "show", 13, "Show commands can only have one subcommand"),
+    ("show help", CommandSyntaxError, "help", 5, "Cannot run multiple commands if one of them is \"help\""),
+    ("help res show", CommandSyntaxError, "help", 9, "Help commands can only have one argument"),
+    ("frob", CommandSyntaxError, "frob", 0, "\"frob\" is not a valid type of command"),
+    ("", CommandSyntaxError, None, None, "An empty string is not a valid command"),
+])
+def testParseError(commandString, errorType, verb, position, message):
+    error = parseError(commandString)
+    assert type(error) is errorType
+    assert (error.verb, error.position, error.message) == (verb, position, message)
+
+
+# Running
+
+def testUnknownTagIsReportedWhenRun(backend):
+    commands = parseCommands("brightness 0.5 ext9")
+    with pytest.raises(CommandExecutionError) as info:
+        commands.run()
+    assert info.value.message == "There is no display \"ext9\""
+
+
+def testLaterCommandsWinPerDisplay(backend):
+    parseCommands("brightness 0.2 all brightness 0.7 main").run()
+    assert [display.brightness for display in getAllDisplays()] == [0.7, 0.2, 0.2]
+
+
+def testRes(backend):
+    parseCommands("res highest main").run()
+    main = getMainDisplay()
+    assert main.currentMode == main.highestMode(0)
+
+    mode = main.allModes[-1]
+    parseCommands("res {} {} {} main".format(mode.width, mode.height, mode.refresh)).run()
+    assert (main.currentMode.width, main.currentMode.height) == (mode.width, mode.height)
+
+
+def testMirror(backend):
+    parseCommands("mirror enable main ext0 ext1").run()
+    main, ext0, ext1 = getAllDisplays()
+    assert ext0.mirrorSource == main and ext1.mirrorSource == main
+
+    parseCommands("mirror disable").run()
+    assert ext0.mirrorSource is None and ext1.mirrorSource is None
+
+
+def testStreamOutputIsInInputOrder(backend, capsys):
+    lines = ["brightness .5 all", "underscan 0 main", "res 1920 main 1080", "# comment", "brightness .3 ext9",
+             "show main", "rotate 90 ext1", "rotate 180 ext0"]
+    read, write = os.pipe()
+    with os.fdopen(write, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    with os.fdopen(read) as stream:
+        assert not runCommandStream(stream, {})
+
+    statuses = [line for line in capsys.readouterr().out.splitlines()
+                if line.startswith("line ") or line.startswith("display ")]
+    assert statuses == [
+        "line 1: ok",
+        "line 2: ok",
+        "line 3: error in res command: Invalid placement of main",
+        "line 5: error: There is no display \"ext9\"",
+        "display \"main\":",
+        "line 6: ok",
+        "line 7: ok",
+        "line 8: ok",
+    ]
+    assert [display.rotation for display in getAllDisplays()] == [0, 180, 90]
+
+
+def testCommandString():
+    assert str(parseOne("res 1920 1080 60 ext1 main")) == "res 1920 1080 refresh 60 main ext1"
+    assert Command(verb="brightness", brightness=0.5).scope is None
@@ -0,0 +1,163 @@
+import json
+
+import pytest
+
+from display_manager_lib import (
+    DisplayConfiguration, DisplayError, DisplayIdentity, DisplayMode, DisplayProfile, DisplayReconciler, ProfileStore,
+    getAllDisplays,
+)
+
+
+def settings(operations):
+    return [(operation.display.tag, operation.setting) for operation in operations]
+
+
+def testSkipsWhatAlreadyMatches(backend):
+    main = getAllDisplays()[0]
+    reconciler = DisplayReconciler()
+    reconciler.setTarget(main, mode=main.defaultMode, rotation=0, brightness=1.0, underscan=0.0, mirrorSource=None)
+    report = reconciler.apply()
+    assert report.applied == []
+    assert len(report.skipped) == 5
+
+
+def testAppliesInOrder(backend):
+    main, ext0, ext1 = getAllDisplays()
+    reconciler = DisplayReconciler()
+    reconciler.setTarget(ext0, brightness=0.3, mode=ext0.allModes[-1])
+    reconciler.setTarget(ext1, mirrorSource=main, rotation=90)
+    report = reconciler.apply()
+    assert settings(report.applied) == [
+        ("ext1", "mirrorSource"), ("ext1", "rotation"), ("ext0", "mode"), ("ext0", "brightness")]
+    assert ext0.currentMode == ext0.allModes[-1]
+    assert ext0.brightness == 0.3
+    assert ext1.mirrorSource == main
+    assert ext1.rotation == 90
+
+    # Nothing is left to change
+    assert reconciler.apply().applied == []
+
+
+def testLaterTargetsReplaceEarlierOnes(backend):
+    main = getAllDisplays()[0]
+    reconciler = DisplayReconciler()
+    reconciler.setTarget(main, brightness=0.3, underscan=0.5)
+    reconciler.setTarget(main, brightness=0.6)
+    reconciler.apply()
+    assert (main.brightness, main.underscan) == (0.6, 0.5)
+
+
+def testParallelMatchesSerial(backend):
+    displays = getAllDisplays()
+    # A different mode for each display, none of which is already set
+    modes = [mode for mode in displays[0].allModes if mode != displays[0].currentMode][:len(displays)]
+    reconciler = DisplayReconciler(workers=4)
+    for display, mode in zip(displays, modes):
+        reconciler.setTarget(display, brightness=mode.width / 10000.0, mode=mode)
+    report = reconciler.apply()
+    assert len(report.applied) == 2 * len(displays)
+    for display, mode in zip(displays, modes):
+        assert display.brightness == pytest.approx(mode.width / 10000.0)
+        assert display.currentMode == mode
+
+
+def testNeedsAWorker():
+    with pytest.raises(ValueError):
+        DisplayReconciler(workers=0)
+
+
+def testUnknownSetting(backend):
+    with pytest.raises(ValueError):
+        DisplayReconciler().setTarget(getAllDisplays()[0], contrast=1)
+
+
+def testFailureCancelsPendingModes(backend):
+    main, ext0, ext1 = getAllDisplays()
+    reconciler = DisplayReconciler()
+    reconciler.setTarget(main, mode=main.allModes[-1])
+    reconciler.setTarget(ext0, mode=DisplayMode(123, 45, 60))
+    with pytest.raises(DisplayError):
+        reconciler.apply()
+    assert main.currentMode == main.defaultMode
+
+
+def testJoinsAnOpenConfiguration(backend):
+    main, ext0, ext1 = getAllDisplays()
+    with DisplayConfiguration() as configuration:
+        reconciler = DisplayReconciler()
+        reconciler.setTarget(ext0, mode=ext0.allModes[-1], brightness=0.4)
+        reconciler.apply()
+        # The mode change waits for the caller's configuration, which is still open
+        assert configuration.isOpen
+        assert ext0.currentMode == ext0.defaultMode
+        configuration.setMirrorSource(ext1, main)
+    assert ext0.currentMode == ext0.allModes[-1]
+    assert ext0.brightness == 0.4
+    assert ext1.mirrorSource == main
+
+
+def testOrderInAnOpenConfiguration(backend, monkeypatch):
+    main, ext0, ext1 = getAllDisplays()
+    calls = []
+
+    def recorded(name, method):
+        def record(*args, **kwargs):
+            calls.append(name)
+            return method(*args, **kwargs)
+        return record
+
+    for name in ["setRotation", "setUnderscan", "setBrightness", "configureMode", "configureMirror",
+                 "completeConfiguration"]:
+        monkeypatch.setattr(backend, name, recorded(name, getattr(backend, name)))
+
+    with DisplayConfiguration():
+        reconciler = DisplayReconciler()
+        reconciler.setTarget(ext0, mirrorSource=main, rotation=90, mode=ext0.allModes[-1], underscan=0.5,
+                             brightness=0.4)
+        report = reconciler.apply()
+        assert settings(report.applied) == [
+            ("ext0", "mirrorSource"), ("ext0", "rotation"), ("ext0", "mode"), ("ext0", "underscan"),
+            ("ext0", "brightness")]
+        # Rotation, underscan, and brightness have already been applied; mirroring and mode are only configured
+        assert calls == ["configureMirror", "setRotation", "configureMode", "setUnderscan", "setBrightness"]
+        assert ext0.rotation == 90 and ext0.mirrorSource is None
+    assert calls[-1] == "completeConfiguration"
+    assert ext0.mirrorSource == main and ext0.currentMode == ext0.allModes[-1]
+
+
+def testProfileFailuresAreReportedPerDisplay(backend):
+    main, ext0, ext1 = getAllDisplays()
+    store = ProfileStore([
+        DisplayProfile(main.identity.vendor, main.identity.product, main.identity.serial, width=99999, height=1),
+        DisplayProfile(ext0.identity.vendor, ext0.identity.product, ext0.identity.serial, brightness=0.2),
+    ])
+    report = store.apply()
+    assert settings(report.applied) == [("ext0", "brightness")]
+    assert [(display.tag, type(error)) for display, error in report.failed] == [("main", DisplayError)]
+    assert ext0.brightness == 0.2
+
+
+@pytest.mark.parametrize("entry, message", [
+    ({"vendor": "abc", "product": 1}, "must be numbers"),
+    ({"vendor": 1, "product": None}, "must be numbers"),
+    ({"vendor": 1, "product": 2, "serial": [3]}, "must be numbers"),
+    ({"vendor": 1}, "must have a vendor and product"),
+    ({"vendor": 1, "product": 2, "contrast": 1}, "\"contrast\" is not a profile setting"),
+    ("main", "must be an object"),
+])
+def testMalformedProfiles(tmp_path, entry, message):
+    path = tmp_path / "profiles.json"
+    path.write_text(json.dumps([entry]))
+    with pytest.raises(ValueError) as info:
+        ProfileStore.load(str(path))
+    assert message in str(info.value)
+
+
+def testLoadProfiles(tmp_path):
+    path = tmp_path / "profiles.json"
+    path.write_text(json.dumps([{"vendor": "1552", "product": 40960, "serial": 7, "brightness": 0.5}]))
+    store = ProfileStore.load(str(path))
+    assert len(store) == 1
+    profile = store.lookup(DisplayIdentity(1552, 40960, 7))
+    assert profile.key == (1552, 40960, 7)
+    assert profile.brightness == 0.5
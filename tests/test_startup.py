@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+frameworks = ["objc", "CoreFoundation", "Quartz", "AppKit", "IOKit"]
+
+# Records (and refuses) every import of a PyObjC framework, so the test behaves the same with or without PyObjC
+script = """
+import contextlib, io, json, sys
+
+attempts = []
+
+class Recorder(object):
+    def find_spec(self, name, path=None, target=None):
+        if name.split(".")[0] in {frameworks!r}:
+            attempts.append(name)
+            raise ImportError(name)
+
+sys.meta_path.insert(0, Recorder())
+
+import display_manager
+with contextlib.redirect_stdout(io.StringIO()):
+    display_manager.runArguments(["help"])
+    display_manager.runArguments(["res", "1920", "main", "1080"])
+    display_manager.parseCommands("res highest ext0 brightness .5 all")
+started = list(attempts)
+
+try:
+    display_manager.getMainDisplay()
+except ImportError:
+    pass
+print(json.dumps([started, attempts]))
+""".format(frameworks=frameworks)
+
+
+def run(*args):
+    env = dict(os.environ)
+    env.pop("DISPLAY_MANAGER_BACKEND", None)
+    return subprocess.run([sys.executable] + list(args), cwd=root, env=env, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True, timeout=60)
+
+
+def testFrameworksAreImportedOnFirstDisplayAccess():
+    result = run("-c", script)
+    assert result.returncode == 0, result.stderr
+    started, attempts = json.loads(result.stdout)
+    # Nothing is imported to show help, report a syntax error, or parse commands...
+    assert started == []
+    # ...but the first display access needs Quartz
+    assert attempts and attempts[0] in frameworks
+
+
+def testImportTime():
+    result = run("-X", "importtime", "-c", "import display_manager")
+    assert result.returncode == 0, result.stderr
+    # Each line of -X importtime's report ends with "| <module>"
+    imported = [line.rsplit("|", 1)[-1].strip() for line in result.stderr.splitlines() if "|" in line]
+    assert "display_manager" in imported
+    assert not [name for name in imported if name.split(".")[0] in frameworks]
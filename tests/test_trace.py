@@ -0,0 +1,83 @@
+import json
+import threading
+
+from display_manager import runArguments
+from display_manager_lib import DisplayStats, InstrumentedBackend
+
+
+def runTraced(path, *args):
+    """
+    Runs a command line with "--trace path", failing (rather than hanging) if it doesn't finish
+    :return: Whether the commands ran successfully, and the trace's records
+    """
+    results = []
+    thread = threading.Thread(target=lambda: results.append(runArguments(["--trace", str(path)] + list(args))))
+    thread.daemon = True
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive(), "traced command did not finish"
+
+    with open(str(path)) as f:
+        return results[0], [json.loads(line) for line in f]
+
+
+def testTracedCommandsFinish(backend, tmp_path, capsys):
+    path = tmp_path / "trace.jsonl"
+    ok, records = runTraced(path, "brightness", ".5", "all")
+    assert ok
+    ok, records = runTraced(path, "res", "highest", "main", "show")
+    assert ok
+    assert records
+
+
+def testTraceRecords(backend, tmp_path, capsys):
+    path = tmp_path / "trace.jsonl"
+    ok, records = runTraced(path, "brightness", ".5", "all", "show", "main")
+    assert ok
+
+    # Every record has the same context, and the records are numbered in order
+    assert [record["seq"] for record in records] == list(range(len(records)))
+    assert len(set(record["session"] for record in records)) == 1
+    for record in records:
+        assert record["schema"] == 1
+        assert isinstance(record["ts"], float)
+
+    events = set(record["event"] for record in records)
+    assert {"call", "command", "operation", "run"} <= events
+
+    commands = [record for record in records if record["event"] == "command"]
+    assert [record["verb"] for record in commands] == ["brightness", "show"]
+    assert commands[0]["scope"] == [{"displayID": 1, "tag": "main"}, {"displayID": 2, "tag": "ext0"},
+                                    {"displayID": 3, "tag": "ext1"}]
+    assert commands[1]["scope"] == [{"displayID": 1, "tag": "main"}]
+
+    operations = [record for record in records if record["event"] == "operation"]
+    assert [(record["display"]["tag"], record["setting"], record["status"]) for record in operations] == [
+        ("main", "brightness", "applied"), ("ext0", "brightness", "applied"), ("ext1", "brightness", "applied")]
+
+    calls = [record for record in records if record["event"] == "call"]
+    assert all(record["elapsed"] >= 0 for record in calls)
+    assert [record["displayID"] for record in calls if record["function"] == "setBrightness"] == [1, 2, 3]
+
+    runs = [record for record in records if record["event"] == "run"]
+    assert runs[-1]["ok"] and runs[-1]["error"] is None and runs[-1]["elapsed"] >= 0
+    assert runs[-1]["commands"] == ["brightness 0.5 all", "show current main"]
+
+
+def testTraceErrors(backend, tmp_path, capsys):
+    path = tmp_path / "trace.jsonl"
+    ok, records = runTraced(path, "res", "1920", "main", "1080")
+    assert not ok
+    errors = [record for record in records if record["event"] == "error"]
+    assert len(errors) == 1
+    assert errors[0]["error"] == "Invalid placement of main"
+    assert errors[0]["position"] == 9
+
+
+def testWaitingIsNotTimed(backend):
+    stats = DisplayStats()
+    instrumented = InstrumentedBackend(backend, stats)
+    instrumented.runLoop(0)
+    instrumented.invalidate(1)
+    instrumented.brightness(1)
+    assert list(stats.functions) == ["brightness"]